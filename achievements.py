@@ -0,0 +1,93 @@
+from datetime import datetime
+
+from stats import build_streak
+
+# -----------------------------
+# ACHIEVEMENT ENGINE
+# -----------------------------
+# record["achievements"] = {"rookie": "2026-01-04T09:12:00", ...}
+#
+# Each badge is a rule registered for one kind of event ("log" or "task").
+# When a daily log or task is added, only the rules for that event type that
+# the user has not unlocked yet are checked, against that one event. Newly
+# unlocked badges are saved with their unlock time, so showing badges is a
+# lookup and adding rules doesn't make page views any slower.
+#
+# Events:
+#   {"type": "log",  "entry": <daily log entry>, "streak": <streak state after it>}
+#   {"type": "task", "task": <task>}
+
+BADGES = {}   # id -> badge definition, in display order
+
+
+def badge(badge_id, icon, title, desc, on):
+    """Register the decorated ``check(event) -> bool`` as a badge rule."""
+    def register(check):
+        BADGES[badge_id] = {"id": badge_id, "icon": icon, "title": title, "desc": desc,
+                            "on": on, "check": check}
+        return check
+    return register
+
+
+@badge("rookie", "🥉", "Rookie", "Logged your first day.", on="log")
+def _first_log(event):
+    return True
+
+@badge("fire", "🔥", "On Fire", "Achieved a 3-day streak.", on="log")
+def _three_day_streak(event):
+    return event["streak"]["longest"] >= 3
+
+@badge("beast", "🦁", "Beast Mode", "Logged 10+ hours in a day.", on="log")
+def _ten_hour_day(event):
+    return sum(event["entry"].get("log", {}).values()) >= 10
+
+@badge("king", "👑", "Consistency King", "7-day streak master.", on="log")
+def _seven_day_streak(event):
+    return event["streak"]["longest"] >= 7
+
+
+def unlocked_by(event, unlocked):
+    """Ids of the badges ``event`` unlocks, skipping those in ``unlocked``."""
+    return [
+        badge_id for badge_id, rule in BADGES.items()
+        if rule["on"] == event["type"] and badge_id not in unlocked and rule["check"](event)
+    ]
+
+def unlock_ops(record, event, when=None):
+    """Record ops that save the badges ``event`` unlocks for ``record``."""
+    when = (when or datetime.now()).isoformat(timespec="seconds")
+    return [("set", ["achievements", badge_id], when)
+            for badge_id in unlocked_by(event, record.get("achievements") or {})]
+
+def build_achievements(record, when=None):
+    """Unlocked badges for a full record, for records that predate the
+    engine: replays every log and task through the rules. Badges that are
+    already unlocked keep their original timestamps."""
+    unlocked = dict(record.get("achievements") or {})
+    when = (when or datetime.now()).isoformat(timespec="seconds")
+    logs = record.get("daily_logs", [])
+    streak = build_streak(entry["date"] for entry in logs)
+    events = [{"type": "log", "entry": entry, "streak": streak} for entry in logs]
+    events += [{"type": "task", "task": task} for task in record.get("tasks", [])]
+    for event in events:
+        for badge_id in unlocked_by(event, unlocked):
+            unlocked[badge_id] = when
+    return unlocked
+
+def badges_from_stats(log_count, longest_streak, best_day):
+    """Ids of the badges implied by aggregate stats, for ranking records
+    that predate stored achievements without replaying their history. The
+    log rules are checked once, against the best log entry and the longest
+    streak, which is what build_achievements would unlock."""
+    if not log_count:
+        return []
+    event = {"type": "log", "entry": {"log": {"": best_day}}, "streak": {"longest": longest_streak}}
+    return unlocked_by(event, {})
+
+def badge_list(achievements):
+    """Display list of unlocked badges (in rule order) with "unlocked_at"."""
+    return [
+        {"id": b["id"], "icon": b["icon"], "title": b["title"], "desc": b["desc"],
+         "unlocked_at": achievements[b["id"]]}
+        for b in BADGES.values() if b["id"] in achievements
+    ]
@@ -1,105 +1,166 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, Response, stream_with_context
 from werkzeug.security import generate_password_hash, check_password_hash
 from functools import wraps
-from datetime import date
+from datetime import date, datetime, timedelta
 
-import json
+import click
+import io
 import os
-import requests
+import threading
+
+from storage import CachedStore, ShardedStore, leaderboard_row, path_parts
+from database import SQLiteChallengeStore, SQLiteStore
+from presence import PresenceTracker
+from scheduler import ExpiryScheduler, day_end
+from leaderboard import SORTS as LEADERBOARD_SORTS, LeaderboardIndex
+from friends import FriendSummaries
+from events import EventBus
+from h2hstore import ChallengeLog
+from chessgames import ChessError, ChessGames
+from chessengine import ChessEngine
+from achievements import badge_list, badges_from_stats, build_achievements, unlock_ops
+from challenges import H2H_METRICS, evaluate_challenges, h2h_events, h2h_progress
+from dateindex import DateIndex
+from export import (HEADER_KEYS as EXPORT_HEADER_KEYS, SECTIONS as EXPORT_SECTIONS, stream_csv, stream_json,
+                    stream_ndjson, stream_zip)
+from importer import READERS as IMPORT_READERS, SECTIONS as IMPORT_SECTIONS, import_ops
+from insights import FakeOpenAI, InsightCache, InsightJobs, InsightService, with_retries
+from stats import (activity_totals_between, advance_streak, build_rollups, build_streak, current_streak,
+                   log_rollup_ops, parse_day, rebuild_derived, recent_daily_totals, task_rollup_ops)
+
+# Heavy clients (OpenAI, requests) are only imported and built on first use,
+# so importing this module (worker boot) stays fast and works without an
+# OPENAI_API_KEY; see make_ai_client() and http_session().
 
 app = Flask(__name__)
 app.secret_key = "CHANGE_THIS_SECRET_KEY"
 
-# -----------------------------
-from datetime import date, datetime, timedelta
-import json
-import os
-import requests
-import io
-import csv
-from flask import send_file, Response
-# -----------------------------
 # -----------------------------
 # DATA STORAGE (JSON DB)
 # -----------------------------
-DB_FILE = "users.json"
+DB_FILE = "users.json"   # legacy monolithic file, migrated into the store on first start
+USERS_DIR = "users"
+SQLITE_FILE = "users.db"
+GAMES_DIR = "games"   # chess move logs (see chessgames.py)
+H2H_LOG = "h2h.log"   # H2H challenges with the json backend (see h2hstore.py)
+CHESS_POLL_SECONDS = 25
+
+# "json" (per-user shards, default) or "sqlite"
+STORAGE_BACKEND = os.getenv("SMARTROUTINE_STORAGE", "json")
+
+if STORAGE_BACKEND == "sqlite":
+    backend = SQLiteStore(SQLITE_FILE, legacy_file=DB_FILE)
+    h2h_store = SQLiteChallengeStore(SQLITE_FILE)
+else:
+    backend = ShardedStore(USERS_DIR, legacy_file=DB_FILE)
+    h2h_store = ChallengeLog(H2H_LOG)
+
+# Parsed records stay in memory between requests (see storage.CachedStore)
+store = CachedStore(backend, max_entries=int(os.getenv("SMARTROUTINE_CACHE_SIZE", "10000")))
+
+# H2H challenges used to be copied into both players' records; adopt those once
+if h2h_store.needs_import():
+    h2h_store.import_records(store.load_all())
 
 def calculate_streak(daily_logs):
     """
     Calculates consecutive days of logging ending today or yesterday.
     Returns: integer streak count.
     """
-    if not daily_logs:
-        return 0
-    
-    # Extract unique dates from logs
-    log_dates = sorted(list(set(log["date"] for log in daily_logs)), reverse=True)
-    if not log_dates:
-        return 0
-    
-    today = date.today()
-    try:
-        current_log_date = datetime.strptime(log_dates[0], "%Y-%m-%d").date()
-    except:
-        return 0
-    
-    # If the last log was effectively not "current" (today or yesterday), streak is broken
-    if current_log_date < today - timedelta(days=1):
-        return 0
-        
-    streak = 1
-    # Check consecutive days backwards
-    for i in range(len(log_dates) - 1):
-        try:
-            d1 = datetime.strptime(log_dates[i], "%Y-%m-%d").date()
-            d2 = datetime.strptime(log_dates[i+1], "%Y-%m-%d").date()
-            if (d1 - d2).days == 1:
-                streak += 1
-            else:
-                break
-        except:
-            break
-            
-    return streak
+    # Each date is parsed once into an ordinal day (see dateindex.py)
+    return DateIndex(daily_logs).streak()
 
-def check_achievements(user_data):
+def streak_from_dates(log_dates):
     """
-    Returns a list of unlocked badges based on user stats.
+    Same as calculate_streak, for "YYYY-MM-DD" dates.
     """
-    badges = []
-    logs = user_data.get("daily_logs", [])
-    streak = calculate_streak(logs)
-    
-    # 1. Rookie: First Log
-    if len(logs) >= 1:
-        badges.append({"id": "rookie", "icon": "🥉", "title": "Rookie", "desc": "Logged your first day."})
-        
-    # 2. On Fire: 3 Day Streak
-    if streak >= 3:
-        badges.append({"id": "fire", "icon": "🔥", "title": "On Fire", "desc": "Achieved a 3-day streak."})
-        
-    # 3. Beast Mode: 10+ Hours in a single day
-    for entry in logs:
-        total = sum(entry.get("log", {}).values())
-        if total >= 10:
-            badges.append({"id": "beast", "icon": "🦁", "title": "Beast Mode", "desc": "Logged 10+ hours in a day."})
-            break
-            
-    # 4. Consistency King: 7 Day Streak
-    if streak >= 7:
-        badges.append({"id": "king", "icon": "👑", "title": "Consistency King", "desc": "7-day streak master."})
-        
-    return badges
+    return DateIndex({"date": d} for d in log_dates).streak()
+
+def user_streak(user_data, email=None):
+    """
+    Live streak from the record's maintained streak state.
+    Records not yet backfilled (flask rebuild-stats) fall back to a full scan.
+    """
+    if "streak" in user_data:
+        return current_streak(user_data["streak"])
+    if "daily_logs" not in user_data and email:
+        return streak_from_dates(store.log_dates(email))
+    return calculate_streak(user_data.get("daily_logs", []))
+
+def user_rollups(email, user_data):
+    """
+    Dashboard rollups kept on the record (see stats.py). Records that
+    predate them (or their log_best field) get theirs built from history
+    (and saved) once.
+    """
+    if "log_best" in user_data.get("rollups", {}):
+        return user_data["rollups"]
+    rollups = build_rollups(load_user(email) or {})
+    update_user(email, ("set", "rollups", rollups))
+    return rollups
+
+def user_achievements(email, user_data):
+    """
+    Unlocked badges {id: unlocked_at} kept on the record by the achievement
+    engine (see achievements.py). Records that predate it get theirs built
+    from history (and saved) once.
+    """
+    if "achievements" in user_data:
+        return user_data["achievements"]
+    achievements = build_achievements(load_user(email) or {})
+    update_user(email, ("set", "achievements", achievements))
+    return achievements
 
 def load_users():
-    if not os.path.exists(DB_FILE):
-        return {}
-    with open(DB_FILE, "r") as f:
-        return json.load(f)
+    """Load every user record. Prefer load_user / load_users_many in routes."""
+    return store.load_all()
 
 def save_users(users):
-    with open(DB_FILE, "w") as f:
-        json.dump(users, f, indent=4)
+    """Write back the records in ``users`` (only those, not the whole DB)."""
+    store.save_many(users)
+
+def load_user(email, sections=None):
+    return store.load(email, sections=sections)
+
+def save_user(email, user):
+    store.save(email, user)
+
+def load_users_many(emails):
+    return store.load_many(emails)
+
+def update_user(email, *ops):
+    """Record small changes (see storage.apply_ops) without rewriting the user."""
+    store.apply(email, list(ops))
+
+def flush_presence(last_seen):
+    store.apply_many({
+        email: [("set", "data.last_seen", when.isoformat())]
+        for email, when in last_seen.items() if store.exists(email)
+    })
+
+# Last-seen timestamps are kept in memory and written in batches
+presence = PresenceTracker(flush_presence, interval=int(os.getenv("SMARTROUTINE_PRESENCE_FLUSH", "60")))
+
+# Live notifications pushed to open /events streams (see events.py)
+event_bus = EventBus(heartbeat=int(os.getenv("SMARTROUTINE_EVENTS_HEARTBEAT", "15")))
+
+def notify(email, event, sender, **fields):
+    """Push ``event`` to ``email``'s open pages, with ``sender``'s name and avatar."""
+    if not event_bus.has_subscribers(email):
+        return
+    card = friend_summaries.get_many([sender]).get(sender, {})
+    event_bus.publish(email, event, {
+        "email": sender,
+        "name": card.get("name", sender.split("@")[0]),
+        "avatar": card.get("avatar", "👤"),
+        **fields,
+    })
+
+def announce_online(email):
+    """Tell friends with an open page that ``email`` just came online."""
+    user = load_user(email, sections=("friends",)) or {}
+    for friend_email in user.get("friends", {}).get("list", []):
+        notify(friend_email, "friend_online", email)
 
 # -----------------------------
 # LOGIN REQUIRED DECORATOR
@@ -110,15 +171,11 @@ def login_required(f):
         if "user" not in session:
             return redirect(url_for("login"))
         
-        # Update last_seen timestamp for online status
-        from datetime import datetime
-        users = load_users()
-        email = session["user"]
-        if email in users:
-            if "data" not in users[email]:
-                users[email]["data"] = {}
-            users[email]["data"]["last_seen"] = datetime.now().isoformat()
-            save_users(users)
+        # Update last_seen timestamp for online status (flushed in batches)
+        if presence.touch(session["user"]):
+            announce_online(session["user"])
+            check_challenges_soon(session["user"])
+        expiry_scheduler.start()
         
         return f(*args, **kwargs)
     return decorated_function
@@ -137,22 +194,19 @@ def base():
 # -----------------------------
 @app.route("/register", methods=["GET", "POST"])
 def register():
-    users = load_users()
-
     if request.method == "POST":
         email = request.form.get("email").lower()
         password = request.form.get("password")
 
-        if email in users:
+        if store.exists(email):
             flash("User already exists. Please login.", "error")
             return redirect(url_for("login"))
 
-        users[email] = {
+        save_user(email, {
             "password": generate_password_hash(password),
             "data": {}
-        }
+        })
 
-        save_users(users)
         flash("Account created successfully. Please login.", "success")
         return redirect(url_for("login"))
 
@@ -163,8 +217,6 @@ def register():
 # -----------------------------
 @app.route("/login", methods=["GET", "POST"])
 def login():
-    users = load_users()
-
     if request.method == "POST":
         email = request.form.get("email").lower().strip()
         password = request.form.get("password")
@@ -172,10 +224,11 @@ def login():
         # DEBUG PRINT (optional)
         print("Trying login:", email)
 
-        if email in users:
+        user = load_user(email)
+        if user is not None:
             print("User exists")
 
-            if users[email]["password"] and check_password_hash(users[email]["password"], password):
+            if user["password"] and check_password_hash(user["password"], password):
                 print("Password correct")
                 session["user"] = email
                 return redirect(url_for("dashboard"))  # ✅ REDIRECT
@@ -194,24 +247,43 @@ def login():
 # -----------------------------
 # DASHBOARD (PROTECTED)
 # -----------------------------
-from datetime import date, datetime
-from collections import defaultdict
-from flask import render_template, request, redirect, url_for, session
-from openai import OpenAI
-
-# Initialize OpenAI client (set OPENAI_API_KEY in environment)
-client = OpenAI()
+def make_ai_client():
+    """
+    OpenAI client (set OPENAI_API_KEY in environment, or SMARTROUTINE_AI=fake
+    to run offline with canned answers). Built on the first insight request:
+    importing openai is the slowest part of startup.
+    """
+    if os.getenv("SMARTROUTINE_AI") == "fake":
+        return FakeOpenAI(delay=float(os.getenv("SMARTROUTINE_AI_FAKE_DELAY", "0")))
+    from openai import OpenAI
+    # Retries are handled by the insight job runner below
+    return OpenAI(max_retries=0)
+
+# Identical prompts (same recent tasks and streak) are answered from memory
+insights = InsightService(make_ai_client, InsightCache(
+    max_entries=int(os.getenv("SMARTROUTINE_INSIGHT_CACHE_SIZE", "1024")),
+    ttl=int(os.getenv("SMARTROUTINE_INSIGHT_TTL", "3600"))
+))
+
+# Cache misses are generated in the background and polled for
+insight_jobs = InsightJobs(
+    max_workers=int(os.getenv("SMARTROUTINE_INSIGHT_WORKERS", "4")),
+    max_pending=int(os.getenv("SMARTROUTINE_INSIGHT_MAX_PENDING", "64")),
+    timeout=float(os.getenv("SMARTROUTINE_INSIGHT_TIMEOUT", "30")),
+    retries=int(os.getenv("SMARTROUTINE_INSIGHT_RETRIES", "2"))
+)
 
 @app.route("/dashboard", methods=["GET", "POST"])
 @login_required
 def dashboard():
-    users = load_users()
     email = session["user"]
+    # Logs are aggregated by the store below, so they are not loaded here
+    user = load_user(email, sections=("tasks",))
 
     # Ensure user structure
-    if email not in users:
-        users[email] = {}
-    users[email].setdefault("tasks", [])
+    if user is None:
+        user = {}
+    user.setdefault("tasks", [])
 
     # -----------------------------
     # ADD TASK (FROM LEFT PANEL)
@@ -221,48 +293,41 @@ def dashboard():
         duration = int(request.form.get("duration"))   # ✅ FIXED (int)
         task_date = request.form.get("date") or str(date.today())
 
-        users[email]["tasks"].append({
+        new_task = {
             "task": task,
             "duration": duration,
             "date": task_date
-        })
-
-        save_users(users)
+        }
+        rollup_ops = task_rollup_ops(new_task) if "rollups" in user else []
+        badge_ops = unlock_ops(user, {"type": "task", "task": new_task}) if "achievements" in user else []
+        update_user(email, ("append", "tasks", new_task), *rollup_ops, *badge_ops)
         return redirect(url_for("dashboard"))
 
-    tasks = users[email]["tasks"]
+    tasks = user["tasks"]
 
-    streaks = users[email].get("daily_logs", [])
-    current_streak = calculate_streak(streaks)
+    # Per-user rollups keep the aggregates below independent of history length.
+    rollups = user_rollups(email, user)
+
+    streak = user_streak(user, email)
     
     # ACHIEVEMENTS
-    badges = check_achievements(users[email])
+    badges = badge_list(user_achievements(email, user))
     
     # GOALS vs ACTUALS (Current Week)
-    goals = users[email].get("goals", {})
+    goals = user.get("goals", {})
     # Calculate this week's actuals
-    this_week_actuals = defaultdict(int)
     today = date.today()
     start_of_week = today - timedelta(days=today.weekday()) # Monday
-    
-    for log in users[email].get("daily_logs", []):
-        log_date = datetime.strptime(log["date"], "%Y-%m-%d").date()
-        if log_date >= start_of_week:
-            for act, hrs in log.get("log", {}).items():
-                this_week_actuals[act] += hrs
+    this_week_actuals = activity_totals_between(rollups, start_of_week, start_of_week + timedelta(days=6))
 
     # HEATMAP DATA PREP (Last 30 days)
     # Format: { "2026-01-01": 5, "2026-01-02": 0 }
-    log_activity = {}
-    for log in users[email].get("daily_logs", []):
-        total_hrs = sum(log.get("log", {}).values())
-        if total_hrs > 0:
-            log_activity[log["date"]] = total_hrs
+    log_activity = recent_daily_totals(rollups, today, 31)
 
     # -----------------------------
     # AUTO-UPDATE CHART DATA
     # -----------------------------
-    total_hours = sum(int(t["duration"]) for t in tasks)
+    total_hours = rollups["task_total"]
 
     productive = int(total_hours * 0.7)
     unproductive = total_hours - productive
@@ -270,16 +335,8 @@ def dashboard():
     # -----------------------------
     # WEEKLY & MONTHLY REPORTS
     # -----------------------------
-    weekly = defaultdict(int)
-    monthly = defaultdict(int)
-
-    for t in tasks:
-        d = datetime.strptime(t["date"], "%Y-%m-%d")
-        week_key = f"{d.year}-W{d.isocalendar().week}"
-        month_key = d.strftime("%Y-%m")
-
-        weekly[week_key] += int(t["duration"])
-        monthly[month_key] += int(t["duration"])
+    weekly = rollups["task_week"]
+    monthly = rollups["task_month"]
 
     # -----------------------------
     # AI TASK ANALYSIS (ON-DEMAND)
@@ -292,35 +349,31 @@ def dashboard():
     # -----------------------------
     return render_template(
         "dashboard.html",
-        user=users[email],
+        user=user,
         email=email,
         tasks=tasks,
         productive=productive,
         unproductive=unproductive,
         weekly=weekly,
         monthly=monthly,
-        streak=current_streak,
+        streak=streak,
         heatmap_data=log_activity,
         badges=badges,
         goals=goals,
         actuals=this_week_actuals
     )
 
-@app.route("/generate-insight", methods=["POST"])
-@login_required
-def generate_insight():
-    users = load_users()
-    email = session["user"]
-    tasks = users[email].get("tasks", [])
-    
+def insight_messages(user, email):
+    """Chat messages asking for advice on the user's recent tasks, or None without tasks."""
+    tasks = user.get("tasks", [])
     if not tasks:
-        return jsonify({"success": False, "message": "No tasks to analyze yet!"})
+        return None
 
     # Get last 5 tasks for context
     recent = tasks[-10:]
     task_text = "\n".join([f"- {t['task']} ({t['duration']} hrs) on {t['date']}" for t in recent])
     
-    streak = calculate_streak(users[email].get("daily_logs", []))
+    streak = user_streak(user, email)
     
     prompt = f"""
     You are a high-performance productivity coach.
@@ -331,34 +384,66 @@ def generate_insight():
     Analyze their focus usage. Give 1 short, punchy, specific advice (max 2 sentences) to optimize their routine.
     Direct address ("You should..."). No fluff.
     """
+    return [
+        {"role": "system", "content": "You are a specialized productivity AI."},
+        {"role": "user", "content": prompt}
+    ]
 
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "system", "content": "You are a specialized productivity AI."},
-                      {"role": "user", "content": prompt}]
-        )
-        insight = response.choices[0].message.content
-        
-        # Save to user profile
-        users[email]["data"]["latest_insight"] = insight
-        save_users(users)
-        
-        return jsonify({"success": True, "insight": insight})
-    except Exception as e:
-        print(e)
-        return jsonify({"success": False, "message": "AI Service unavailable."})
+def store_insight(email, insight):
+    """Save the insight to the user's profile (only if it changed)."""
+    user = load_user(email, sections=())
+    if user is not None and insight != user.get("data", {}).get("latest_insight"):
+        update_user(email, ("set", "data.latest_insight", insight))
+
+@app.route("/generate-insight", methods=["POST"])
+@login_required
+def generate_insight():
+    email = session["user"]
+    messages = insight_messages(load_user(email, sections=("tasks",)), email)
+    
+    if messages is None:
+        return jsonify({"success": False, "message": "No tasks to analyze yet!"})
+
+    # Unchanged tasks and streak: answer straight from the cache
+    insight = insights.peek(messages)
+    if insight is not None:
+        store_insight(email, insight)
+        return jsonify({"success": True, "status": "done", "insight": insight, "cached": True})
+
+    def work(timeout):
+        insight, _ = insights.complete(messages, timeout=timeout)
+        store_insight(email, insight)
+        return insight
+
+    job = insight_jobs.submit(email, work)
+    if job is None:
+        return jsonify({"success": False, "message": "AI coach is busy, try again in a minute."}), 503
+    return jsonify({"success": True, "status": job["status"], "job_id": job["id"]}), 202
+
+@app.route("/insight-status/<job_id>")
+@login_required
+def insight_status(job_id):
+    """Poll a job from /generate-insight; "done" once latest_insight is stored."""
+    job = insight_jobs.get(job_id)
+    if job is None or job["email"] != session["user"]:
+        return jsonify({"success": False, "message": "Unknown insight job."}), 404
+    if job["status"] == "failed":
+        return jsonify({"success": False, "status": "failed", "job_id": job_id, "message": "AI Service unavailable."})
+    body = {"success": True, "status": job["status"], "job_id": job_id}
+    if job["status"] == "done":
+        body["insight"] = job["result"]
+    return jsonify(body)
 
 @app.route("/delete-task/<int:index>", methods=["POST"])
 @login_required
 def delete_task(index):
-    users = load_users()
     email = session["user"]
-    tasks = users[email].get("tasks", [])
+    user = load_user(email)
+    tasks = user.get("tasks", [])
     
     if 0 <= index < len(tasks):
-        tasks.pop(index) # Remove by index
-        save_users(users)
+        rollup_ops = task_rollup_ops(tasks[index], sign=-1) if "rollups" in user else []
+        update_user(email, ("remove", "tasks", index), *rollup_ops) # Remove by index
         flash("Task deleted.", "success")
     else:
         flash("Task not found.", "error")
@@ -373,37 +458,113 @@ def delete_task(index):
 @app.route("/export_data")
 @login_required
 def export_data():
-    users = load_users()
+    """Stream the user's history as json (default), ndjson, csv (one
+    section) or zip (a CSV per section), optionally limited to ?from=&to=."""
     email = session["user"]
-    user_data = users.get(email, {})
-    
-    # Create a simple JSON export
-    # For a more complex CSV export, we could offer choices.
-    # Here we default to JSON for structural integrity.
-    
+    fmt = request.args.get("format", "json")
+    section = request.args.get("section") or None
+    start = request.args.get("from") or None
+    end = request.args.get("to") or None
+    if fmt not in ("json", "ndjson", "csv", "zip"):
+        return jsonify({"error": "format must be json, ndjson, csv or zip"}), 400
+    if section is not None and section not in EXPORT_SECTIONS:
+        return jsonify({"error": f"section must be one of {', '.join(EXPORT_SECTIONS)}"}), 400
+    if any(day is not None and parse_day(day) is None for day in (start, end)):
+        return jsonify({"error": "from/to must be YYYY-MM-DD"}), 400
+    if fmt == "csv" and section is None:
+        return jsonify({"error": "csv exports one section; pass ?section= or use format=zip"}), 400
+
+    # Each section is read lazily, only once the previous one has been sent
+    names = (section,) if section else EXPORT_SECTIONS
+    sections = ((name, store.iter_entries(email, name, start, end)) for name in names)
+    filename = "my_smartroutine_data" + (f"_{section}" if section else "")
+
+    if fmt == "csv":
+        body, mimetype = stream_csv(section, store.iter_entries(email, section, start, end)), "text/csv"
+    elif fmt == "zip":
+        body, mimetype = stream_zip(sections), "application/zip"
+    elif fmt == "ndjson":
+        body, mimetype = stream_ndjson(sections), "application/x-ndjson"
+    else:
+        # Only what the user entered; derived state (rollups, streak, ...) stays private
+        record = load_user(email, sections=()) or {}
+        header = {"email": email}
+        header.update((k, record[k]) for k in EXPORT_HEADER_KEYS if k in record)
+        if start or end:
+            header["range"] = {"from": start, "to": end}
+        body, mimetype = stream_json(header, sections), "application/json"
+
     return Response(
-        json.dumps(user_data, indent=4),
-        mimetype="application/json",
-        headers={"Content-disposition": "attachment; filename=my_smartroutine_data.json"}
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={"Content-disposition": f"attachment; filename={filename}.{fmt}"}
     )
 
+# -----------------------------
+# BULK IMPORT
+# -----------------------------
+def import_format(filename, fmt=None):
+    """"csv" / "ndjson" from an explicit choice or the file extension."""
+    fmt = fmt or os.path.splitext(filename or "")[1].lstrip(".").lower()
+    return {"jsonl": "ndjson", "json": "ndjson"}.get(fmt, fmt)
+
+def import_entries(email, lines, fmt, section=None):
+    """Validate and dedupe ``lines`` against the user's record and save
+    every accepted entry in one write. Returns the import summary."""
+    record = load_user(email, sections=IMPORT_SECTIONS) or {}
+    ops, summary = import_ops(record, IMPORT_READERS[fmt](lines, section))
+    if ops:
+        update_user(email, *ops)
+    return summary
+
+@app.route("/import", methods=["POST"])
+@login_required
+def import_data():
+    """Bulk import an uploaded CSV / NDJSON file (see importer.py)."""
+    email = session["user"]
+    upload = request.files.get("file")
+    fmt = import_format(upload and upload.filename, request.form.get("format"))
+    section = request.form.get("section") or None
+    wants_json = request.accept_mimetypes.best == "application/json"
+
+    error = None
+    if not upload:
+        error = "Choose a file to import."
+    elif fmt not in IMPORT_READERS:
+        error = "Import files must be CSV or NDJSON."
+    elif section is not None and section not in IMPORT_SECTIONS:
+        error = f"Section must be one of {', '.join(IMPORT_SECTIONS)}."
+    if error:
+        if wants_json:
+            return jsonify({"error": error}), 400
+        flash(error, "error")
+        return redirect(url_for("profile"))
+
+    lines = io.TextIOWrapper(upload.stream, encoding="utf-8-sig", errors="replace", newline="")
+    summary = import_entries(email, lines, fmt, section)
+    if wants_json:
+        return jsonify(summary)
+    accepted = sum(summary["accepted"].values())
+    flash(f"Imported {accepted} entries ({summary['duplicates']} duplicates skipped, "
+          f"{summary['rejected']} rows rejected).", "success" if accepted or not summary["rejected"] else "error")
+    return redirect(url_for("profile"))
+
 # -----------------------------
 # SET GOALS
 # -----------------------------
 @app.route("/set-goals", methods=["POST"])
 @login_required
 def set_goals():
-    users = load_users()
     email = session["user"]
+    user = load_user(email)
     
     goals = {}
-    for act in users[email].get("activities", []):
+    for act in user.get("activities", []):
         target = request.form.get(f"goal_{act}")
         if target:
             goals[act] = int(target)
             
-    users[email]["goals"] = goals
-    save_users(users)
+    update_user(email, ("set", "goals", goals))
     flash("Weekly goals updated!", "success")
     return redirect(url_for("dashboard"))
 
@@ -413,23 +574,49 @@ def set_goals():
 @app.route("/report")
 @login_required
 def report():
-    users = load_users()
     email = session["user"]
-    u = users[email]
+    u = load_user(email, sections=())
     
     # Calculate Summary Stats
-    total_logs = len(u.get("daily_logs", []))
-    streak = calculate_streak(u.get("daily_logs", []))
+    log_stats = store.log_stats(email)
+    total_logs = log_stats["logs"]
+    streak = user_streak(u, email)
     
     # Mood Stats
-    moods = [l.get("mood") for l in u.get("daily_logs", []) if l.get("mood")]
-    top_mood = max(set(moods), key=moods.count) if moods else "N/A"
+    moods = log_stats["moods"]
+    top_mood = max(moods, key=moods.get) if moods else "N/A"
     
     return render_template("report.html", 
                            user=u, 
                            email=email,
                            stats={"total_logs": total_logs, "streak": streak, "top_mood": top_mood},
-                           badges=check_achievements(u))
+                           badges=badge_list(user_achievements(email, u)))
+
+# -----------------------------
+# STORAGE CACHE STATS
+# -----------------------------
+@app.route("/cache-stats")
+@login_required
+def cache_stats():
+    """Hit/miss counters of this worker's record, friend card and AI insight caches (and engine use)."""
+    return jsonify({"records": store.stats(), "friends": friend_summaries.stats(), "events": event_bus.stats(),
+                    "insights": insights.stats(), "insight_jobs": insight_jobs.stats(),
+                    "chess_engine": chess_engine.stats(), "h2h": h2h_store.stats(),
+                    "scheduler": expiry_scheduler.stats()})
+
+@app.route("/events")
+@login_required
+def events():
+    """Server-Sent Events stream of this user's live notifications."""
+    email = session["user"]
+    q = event_bus.subscribe(email)
+    if q is None:
+        return jsonify({"error": "Too many open event streams."}), 429
+    response = Response(event_bus.stream(email, q), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    # Also covers a stream that is closed before its body is ever read
+    response.call_on_close(lambda: event_bus.unsubscribe(email, q))
+    return response
 
 # -----------------------------
 # LOGOUT
@@ -443,6 +630,16 @@ def logout():
 # -----------------------------
 # GOOGLE SIGN-IN (BACKEND READY)
 # -----------------------------
+_http = None
+
+def http_session():
+    """Shared requests session (keeps connections alive), created on first use."""
+    global _http
+    if _http is None:
+        import requests
+        _http = requests.Session()
+    return _http
+
 @app.route("/google-login", methods=["POST"])
 def google_login():
     """
@@ -453,7 +650,7 @@ def google_login():
     token = request.json.get("token")
 
     # Verify token with Google
-    response = requests.get(
+    response = http_session().get(
         "https://oauth2.googleapis.com/tokeninfo",
         params={"id_token": token}
     )
@@ -464,19 +661,14 @@ def google_login():
     data = response.json()
     email = data.get("email")
 
-    users = load_users()
-
-    if email not in users:
-        users[email] = {
+    if not store.exists(email):
+        save_user(email, {
             "password": None,
             "data": {}
-        }
-        save_users(users)
+        })
 
     session["user"] = email
     return {"success": True}
-from openai import OpenAI
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 def ai_analysis(tasks):
     if not tasks:
@@ -484,45 +676,49 @@ def ai_analysis(tasks):
 
     text = "\n".join([f"{t['task']} - {t['duration']} hrs" for t in tasks])
 
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role":"system","content":"You are a productivity coach."},
-            {"role":"user","content":f"Analyze my tasks:\n{text}"}
-        ]
-    )
-    return response.choices[0].message.content
+    analysis, _ = insights.complete([
+        {"role":"system","content":"You are a productivity coach."},
+        {"role":"user","content":f"Analyze my tasks:\n{text}"}
+    ])
+    return analysis
 @app.route("/daily-log", methods=["GET", "POST"])
 @login_required
 def daily_log():
-    users = load_users()
     email = session["user"]
+    user = load_user(email)
 
-    users[email].setdefault("activities", [])
-    users[email].setdefault("daily_logs", [])
+    user.setdefault("activities", [])
+    user.setdefault("daily_logs", [])
 
     if request.method == "POST":
         date_val = request.form.get("date")
         mood_val = request.form.get("mood")
         log = {}
 
-        for act in users[email]["activities"]:
+        for act in user["activities"]:
             hours = request.form.get(act)
             log[act] = int(hours) if hours else 0
 
-        users[email]["daily_logs"].append({
+        # O(1) streak update; a backdated log, or a record that has no streak
+        # state yet, is rebuilt from all its log dates
+        streak = advance_streak(user.get("streak"), date_val)
+        if streak is None:
+            streak = build_streak([date_val] + [l["date"] for l in user["daily_logs"]])
+
+        entry = {
             "date": date_val,
             "mood": mood_val,
             "log": log
-        })
-
-        save_users(users)
+        }
+        rollup_ops = log_rollup_ops(entry, user["rollups"]) if "rollups" in user else []
+        badge_ops = unlock_ops(user, {"type": "log", "entry": entry, "streak": streak}) if "achievements" in user else []
+        update_user(email, ("append", "daily_logs", entry), ("set", "streak", streak), *rollup_ops, *badge_ops)
         return redirect(url_for("dashboard"))
 
     return render_template(
         "daily_log.html",
-        user=users[email],
-        activities=users[email]["activities"],
+        user=user,
+        activities=user["activities"],
         today_date=str(date.today())
     )
 
@@ -532,9 +728,9 @@ def daily_log():
 @app.route("/notes", methods=["GET", "POST"])
 @login_required
 def notes():
-    users = load_users()
     email = session["user"]
-    users[email].setdefault("notes", [])
+    user = load_user(email)
+    user.setdefault("notes", [])
 
     if request.method == "POST":
         title = request.form.get("title")
@@ -542,16 +738,15 @@ def notes():
         # Store simplified date string
         d_str = str(date.today())
         
-        users[email]["notes"].append({
+        update_user(email, ("append", "notes", {
             "title": title,
             "content": content,
             "date": d_str
-        })
-        save_users(users)
+        }))
         flash("Note added successfully!", "success")
         return redirect(url_for("notes"))
 
-    return render_template("notes.html", notes=users[email]["notes"])
+    return render_template("notes.html", notes=user["notes"])
 
 # -----------------------------
 # EXPENSES
@@ -559,9 +754,9 @@ def notes():
 @app.route("/expenses", methods=["GET", "POST"])
 @login_required
 def expenses():
-    users = load_users()
     email = session["user"]
-    users[email].setdefault("expenses", [])
+    user = load_user(email)
+    user.setdefault("expenses", [])
 
     if request.method == "POST":
         try:
@@ -573,17 +768,16 @@ def expenses():
         category = request.form.get("category")
         d_str = str(date.today())
 
-        users[email]["expenses"].append({
+        update_user(email, ("append", "expenses", {
             "amount": amount,
             "description": desc,
             "category": category,
             "date": d_str
-        })
-        save_users(users)
+        }))
         flash("Expense added!", "success")
         return redirect(url_for("expenses"))
 
-    return render_template("expenses.html", expenses=users[email]["expenses"])
+    return render_template("expenses.html", expenses=user["expenses"])
 
 # -----------------------------
 # MANAGE ACTIVITIES
@@ -591,30 +785,30 @@ def expenses():
 @app.route("/activities", methods=["GET", "POST"])
 @login_required
 def activities():
-    users = load_users()
     email = session["user"]
+    user = load_user(email)
     # Ensure default activities exist if empty
-    if "activities" not in users[email] or not users[email]["activities"]:
-        users[email]["activities"] = ["Coding", "Reading", "Exercise", "Sleep"] # Default set
+    if "activities" not in user or not user["activities"]:
+        user["activities"] = ["Coding", "Reading", "Exercise", "Sleep"] # Default set
 
     if request.method == "POST":
         if "new_activity" in request.form:
             new_act = request.form.get("new_activity").strip()
-            if new_act and new_act not in users[email]["activities"]:
-                users[email]["activities"].append(new_act)
-                save_users(users)
+            if new_act and new_act not in user["activities"]:
+                user["activities"].append(new_act)
+                save_user(email, user)
                 flash(f"Activity '{new_act}' added.", "success")
         
         elif "delete_activity" in request.form:
             act = request.form.get("delete_activity")
-            if act in users[email]["activities"]:
-                users[email]["activities"].remove(act)
-                save_users(users)
+            if act in user["activities"]:
+                user["activities"].remove(act)
+                save_user(email, user)
                 flash(f"Activity '{act}' removed.", "success")
                 
         return redirect(url_for("activities"))
 
-    return render_template("activities.html", activities=users[email]["activities"])
+    return render_template("activities.html", activities=user["activities"])
 
 # -----------------------------
 # USER PROFILE
@@ -622,9 +816,9 @@ def activities():
 @app.route("/profile", methods=["GET", "POST"])
 @login_required
 def profile():
-    users = load_users()
     email = session["user"]
-    user = users[email]
+    # Lifetime stats come from the store's log aggregates, not the raw logs
+    user = load_user(email, sections=())
     
     # Ensure data dict exists
     user.setdefault("data", {})
@@ -633,31 +827,26 @@ def profile():
     if request.method == "POST":
         # Handle Avatar Update
         if "avatar" in request.form:
-            user["data"]["avatar"] = request.form.get("avatar")
-            save_users(users)
+            update_user(email, ("set", "data.avatar", request.form.get("avatar")))
             flash("Avatar updated!", "success")
         
         # Handle Password Change (Simple implementation)
         elif "new_password" in request.form:
              new_pw = request.form.get("new_password")
              if new_pw:
-                 user["password"] = generate_password_hash(new_pw)
-                 save_users(users)
+                 update_user(email, ("set", "password", generate_password_hash(new_pw)))
                  flash("Password changed successfully.", "success")
                  
         return redirect(url_for("profile"))
 
     # Calculate Lifetime Stats for Profile
-    total_logs = len(user.get("daily_logs", []))
-    total_hours = 0
-    for log in user.get("daily_logs", []):
-         total_hours += sum(log.get("log", {}).values())
-         
+    log_stats = store.log_stats(email)
+    
     stats = {
         "joined": "2024", # Placeholder, or add joined_date to register
-        "logs": total_logs,
-        "hours": int(total_hours),
-        "streak": calculate_streak(user.get("daily_logs", []))
+        "logs": log_stats["logs"],
+        "hours": int(log_stats["hours"]),
+        "streak": user_streak(user, email)
     }
     
     return render_template("profile.html", user=user, email=email, stats=stats)
@@ -666,42 +855,92 @@ def profile():
 # -----------------------------
 # LEADERBOARD
 # -----------------------------
+LEADERBOARD_PAGE_SIZE = 50
+
+def leaderboard_entry(row):
+    """Display entry (and sort keys) for one storage leaderboard row."""
+    email = row["email"]
+    if row["streak_state"] is not None:
+        streak = current_streak(row["streak_state"])
+    else:
+        streak = streak_from_dates(row["dates"])
+    badges = row["badges"]
+    if badges is None:
+        # Same rules as the achievement engine, from the row's aggregates
+        longest = (row["streak_state"] or build_streak(row["dates"]))["longest"]
+        badges = len(badges_from_stats(row["logs"], longest, row["best_day"]))
+    return {
+        "email": email,
+        "name": row["data"].get("first_name", email.split("@")[0]),
+        "avatar": row["data"].get("avatar", "👤"),
+        "total_hours": row["task_hours"],
+        "streak": streak,
+        "badges": badges
+    }
+
+# Built from storage on first use, then kept current by the listener below
+leaderboard_index = LeaderboardIndex(store.leaderboard_stats, leaderboard_entry)
+
+# Record sections that leaderboard_row() reads
+LEADERBOARD_SECTIONS = {"data", "rollups", "streak", "achievements", "tasks", "daily_logs"}
+
+def refresh_leaderboard(email, ops):
+    if ops is not None and not any(path_parts(path)[0] in LEADERBOARD_SECTIONS and path != "data.last_seen"
+                                   for _, path, _ in ops):
+        return   # e.g. presence flushes and notes don't move anyone on the board
+    # The row comes from the maintained rollups, streak and badges, so this
+    # is O(1) in the user's history (store.view: no copy of the record)
+    user_data = store.view(email)
+    if user_data is not None:
+        leaderboard_index.update(leaderboard_row(email, user_data))
+
+store.subscribe(refresh_leaderboard)
+
+def leaderboard_page_args():
+    sort = request.args.get("sort", "streak")
+    if sort not in LEADERBOARD_SORTS:
+        sort = "streak"
+    page = max(request.args.get("page", 1, type=int), 1)
+    per_page = min(max(request.args.get("per_page", LEADERBOARD_PAGE_SIZE, type=int), 1), 200)
+    return sort, page, per_page
+
 @app.route("/leaderboard")
 @login_required
 def leaderboard():
-    users = load_users()
     current_email = session["user"]
+    sort, page, per_page = leaderboard_page_args()
     
-    # Calculate stats for all users
-    leaderboard_data = []
-    for email, user_data in users.items():
-        # Calculate metrics
-        total_hours = sum(t.get("duration", 0) for t in user_data.get("tasks", []))
-        streak = calculate_streak(user_data.get("daily_logs", []))
-        badges_count = len(check_achievements(user_data))
-        
-        # Get display name
-        display_name = user_data.get("data", {}).get("first_name", email.split("@")[0])
-        avatar = user_data.get("data", {}).get("avatar", "👤")
-        
-        leaderboard_data.append({
-            "email": email,
-            "name": display_name,
-            "avatar": avatar,
-            "total_hours": total_hours,
-            "streak": streak,
-            "badges": badges_count,
-            "is_current": email == current_email
-        })
-    
-    # Sort by streak (default)
-    leaderboard_data.sort(key=lambda x: x["streak"], reverse=True)
+    leaderboard_data = leaderboard_index.top(sort, (page - 1) * per_page, per_page)
+    for entry in leaderboard_data:
+        entry["is_current"] = entry["email"] == current_email
+    total_users = len(leaderboard_index)
     
     return render_template("leaderboard.html", 
                          leaderboard=leaderboard_data,
-                         user=users[current_email],
+                         podium=leaderboard_index.top(sort, 0, 3),
+                         total_users=total_users,
+                         my_rank=leaderboard_index.rank(sort, current_email),
+                         sort=sort,
+                         sorts=LEADERBOARD_SORTS,
+                         page=page,
+                         pages=max((total_users + per_page - 1) // per_page, 1),
+                         user=load_user(current_email, sections=()),
                          email=current_email)
 
+@app.route("/api/leaderboard")
+@login_required
+def leaderboard_api():
+    """Paginated leaderboard: ?sort=streak|total_hours|badges&page=1&per_page=50"""
+    sort, page, per_page = leaderboard_page_args()
+    return jsonify({
+        "sort": sort,
+        "page": page,
+        "per_page": per_page,
+        "total": len(leaderboard_index),
+        "my_rank": leaderboard_index.rank(sort, session["user"]),
+        "results": leaderboard_index.top(sort, (page - 1) * per_page, per_page)
+    })
+
 
 # -----------------------------
 # CHALLENGES
@@ -719,27 +958,27 @@ CHALLENGE_TEMPLATES = {
     ]
 }
 
-def assign_challenges(user_data):
-    """Auto-assign daily and weekly challenges if none active"""
+def drop_expired_challenges(challenges, today):
+    """``challenges`` without its expired active challenges (a new dict)."""
+    # ISO dates compare in date order
+    return {"completed": [], **challenges,
+            "active": [c for c in challenges.get("active", []) if c["expires"] >= str(today)]}
+
+def assign_challenges(challenges):
+    """Drop expired challenges and assign a daily and a weekly one where
+    missing (returns a new dict). Run by the scheduler (refresh_challenges)."""
     import random
-    from datetime import datetime, timedelta
-    
-    if "challenges" not in user_data:
-        user_data["challenges"] = {"active": [], "completed": []}
     
     today = datetime.now().date()
     
     # Remove expired challenges
-    user_data["challenges"]["active"] = [
-        c for c in user_data["challenges"]["active"] 
-        if datetime.strptime(c["expires"], "%Y-%m-%d").date() >= today
-    ]
+    active = drop_expired_challenges(challenges, today)["active"]
     
     # Assign daily challenge if none
-    has_daily = any(c["type"] == "daily" for c in user_data["challenges"]["active"])
+    has_daily = any(c["type"] == "daily" for c in active)
     if not has_daily:
         template = random.choice(CHALLENGE_TEMPLATES["daily"])
-        user_data["challenges"]["active"].append({
+        active.append({
             **template,
             "type": "daily",
             "progress": 0,
@@ -747,147 +986,186 @@ def assign_challenges(user_data):
         })
     
     # Assign weekly challenge if none
-    has_weekly = any(c["type"] == "weekly" for c in user_data["challenges"]["active"])
+    has_weekly = any(c["type"] == "weekly" for c in active)
     if not has_weekly:
         template = random.choice(CHALLENGE_TEMPLATES["weekly"])
-        user_data["challenges"]["active"].append({
+        active.append({
             **template,
             "type": "weekly",
             "progress": 0,
             "expires": str(today + timedelta(days=7))
         })
     
-    return user_data
-
-def update_challenge_progress(user_data):
-    """Update challenge progress based on current user data"""
-    from datetime import datetime, timedelta
-    
-    if "challenges" not in user_data:
-        return
-    
-    today = datetime.now().date()
-    week_start = today - timedelta(days=today.weekday())
-    
-    for challenge in user_data["challenges"]["active"]:
-        metric = challenge["metric"]
-        
-        if metric == "hours":
-            if challenge["type"] == "daily":
-                # Today's hours
-                today_log = next((l for l in user_data.get("daily_logs", []) if l["date"] == str(today)), None)
-                if today_log:
-                    challenge["progress"] = sum(today_log.get("log", {}).values())
-            else:
-                # This week's hours
-                week_logs = [l for l in user_data.get("daily_logs", []) 
-                           if datetime.strptime(l["date"], "%Y-%m-%d").date() >= week_start]
-                challenge["progress"] = sum(sum(l.get("log", {}).values()) for l in week_logs)
-        
-        elif metric == "tasks":
-            # Today's unique tasks
-            today_tasks = [t for t in user_data.get("tasks", []) if t["date"] == str(today)]
-            challenge["progress"] = len(today_tasks)
-        
-        elif metric == "streak":
-            challenge["progress"] = 1 if calculate_streak(user_data.get("daily_logs", [])) > 0 else 0
-        
-        elif metric == "activities":
-            # This week's unique activities
-            week_logs = [l for l in user_data.get("daily_logs", []) 
-                       if datetime.strptime(l["date"], "%Y-%m-%d").date() >= week_start]
-            unique_activities = set()
-            for log in week_logs:
-                unique_activities.update(log.get("log", {}).keys())
-            challenge["progress"] = len(unique_activities)
-        
-        elif metric == "days":
-            # Days logged this week
-            week_logs = [l for l in user_data.get("daily_logs", []) 
-                       if datetime.strptime(l["date"], "%Y-%m-%d").date() >= week_start 
-                       and sum(l.get("log", {}).values()) > 0]
-            challenge["progress"] = len(week_logs)
-        
-        # Check completion
-        if challenge["progress"] >= challenge["target"] and challenge["id"] not in user_data["challenges"]["completed"]:
-            user_data["challenges"]["completed"].append(challenge["id"])
-            # Could add badge here
+    return {"completed": [], **challenges, "active": active}
 
 @app.route("/challenges")
 @login_required
 def challenges():
-    users = load_users()
     email = session["user"]
-    user_data = users[email]
-    
-    # Assign challenges if needed
-    user_data = assign_challenges(user_data)
+    user_data = load_user(email, sections=("challenges",))
     
-    # Update progress
-    update_challenge_progress(user_data)
-    
-    # Save
-    save_users(users)
+    # Read only: the scheduler expires and assigns challenges (refresh_challenges)
+    # and score_challenges keeps their progress current as tasks and logs come in.
+    # One that ran out before the scheduler got to it is just not shown.
+    current = drop_expired_challenges(user_data.get("challenges") or {}, date.today())
     
     return render_template("challenges.html", 
                          user=user_data,
                          email=email,
-                         challenges=user_data["challenges"]["active"],
-                         completed_count=len(user_data["challenges"].get("completed", [])))
+                         challenges=current["active"],
+                         completed_count=len(current["completed"]))
+
+# Record sections whose changes can move challenge progress
+CHALLENGE_INPUTS = {"tasks", "daily_logs", "streak"}
+
+def score_challenges(email, ops):
+    """Re-score the user's daily/weekly challenges after a write to their
+    tasks or logs (one pass over the date-indexed rollups); newly met ones
+    are completed. Writes only if something changed."""
+    if ops is None or not any(path_parts(path)[0] in CHALLENGE_INPUTS for _, path, _ in ops):
+        return
+    record = store.view(email, sections=("challenges",))
+    if record is None or not (record.get("challenges") or {}).get("active"):
+        return
+    current = record["challenges"]
+    updated = evaluate_challenges(current, user_rollups(email, record)["log_day"],
+                                  store.date_index(email, "tasks"), user_streak(record, email), date.today())
+    if updated != current:
+        update_user(email, ("set", "challenges", updated))
+
+store.subscribe(score_challenges)
+
+
+# -----------------------------
+# SCHEDULED EXPIRY
+# -----------------------------
+# Daily/weekly challenges expire and H2H challenges are closed at their
+# deadlines by the scheduler thread (see scheduler.py), started with the
+# first logged-in request. Its start-up sweep schedules every open H2H
+# challenge (the H2H store lists them without touching user records).
+# Users are scheduled as this process sees them: when they come online, and
+# then while they hold challenges. When one expires, its replacement is
+# assigned right away, but only to users seen within CHALLENGE_ACTIVE_WINDOW;
+# anyone else gets theirs when they next come online.
+CHALLENGE_ACTIVE_WINDOW = timedelta(days=2)
+
+def refresh_challenges(email):
+    """Drop the user's expired daily/weekly challenges and, if they were
+    active recently, assign and score replacements (one write, only if
+    anything changed). Then schedule the next expiry."""
+    record = store.view(email, sections=("challenges",))
+    if record is None:
+        return
+    current = {"active": [], "completed": [], **(record.get("challenges") or {})}
+    if presence.is_online(email, record.get("data", {}).get("last_seen"), window=CHALLENGE_ACTIVE_WINDOW):
+        updated = evaluate_challenges(assign_challenges(current), user_rollups(email, record)["log_day"],
+                                      store.date_index(email, "tasks"), user_streak(record, email), date.today())
+    else:
+        updated = drop_expired_challenges(current, date.today())
+    if updated != current:
+        update_user(email, ("set", "challenges", updated))
+    schedule_challenge_expiry(email, updated)
+
+def schedule_challenge_expiry(email, challenges):
+    """Expire the user's challenges at the earliest expiry (nothing to
+    schedule if they hold none)."""
+    key = ("challenges", email)
+    expires = [c["expires"] for c in challenges.get("active", []) if c.get("expires")]
+    if not expires:
+        expiry_scheduler.cancel(key)
+        return
+    when = day_end(min(expires))
+    if expiry_scheduler.due(key) != when:
+        expiry_scheduler.schedule(key, when, lambda: refresh_challenges(email))
+
+def check_challenges_soon(email):
+    """Have the scheduler look at ``email``'s challenges (it expires any that
+    are overdue, assigns missing ones and schedules the rest), unless it
+    already has."""
+    if expiry_scheduler.due(("challenges", email)) is None:
+        expiry_scheduler.schedule(("challenges", email), 0, lambda: refresh_challenges(email))
+
+def finalize_h2h(challenge_id):
+    """Close an H2H challenge after its end date: the higher progress wins
+    (no winner on a tie). Invites nobody answered just expire. A chess game
+    still in progress is adjudicated a draw, and its result closes the
+    challenge."""
+    today = str(date.today())
+    challenge = h2h_store.get(challenge_id)
+    if challenge is None or challenge["status"] not in ("pending", "active") or challenge.get("end_date", today) >= today:
+        return
+    if challenge.get("type") == "chess_game" and challenge["status"] == "active":
+        game = chess_games.adjudicate(challenge_id, "1/2-1/2", "challenge ended")
+        if game is not None:
+            finish_chess_challenge(challenge_id, game)
+            return
+
+    def result(c):
+        if c["status"] == "pending":
+            return {"status": "expired"}
+        mine, theirs = c.get("challenger_progress", 0), c.get("opponent_progress", 0)
+        winner = c["challenger"] if mine > theirs else c["opponent"] if theirs > mine else None
+        return {"status": "completed", "winner": winner}
+    
+    h2h_store.update(challenge_id, result,
+                     check=lambda c: c["status"] in ("pending", "active") and c.get("end_date", today) < today)
+
+def schedule_h2h_expiry(challenge_id, end_date):
+    if end_date:
+        expiry_scheduler.schedule(("h2h", challenge_id), day_end(end_date), lambda: finalize_h2h(challenge_id))
+
+def schedule_existing():
+    """Start-up sweep: every open H2H challenge."""
+    for challenge_id, end_date in h2h_store.open_challenges():
+        schedule_h2h_expiry(challenge_id, end_date)
+
+expiry_scheduler = ExpiryScheduler(on_start=schedule_existing)
 
 
 # -----------------------------
 # FRIEND SYSTEM
 # -----------------------------
+def friend_card(row):
+    """Friend/H2H card for one storage leaderboard row (see friends.py)."""
+    return {**leaderboard_entry(row), "last_seen": row["data"].get("last_seen")}
+
+friend_summaries = FriendSummaries(
+    store.leaderboard_stats, friend_card,
+    max_entries=int(os.getenv("SMARTROUTINE_FRIEND_CACHE_SIZE", "10000")),
+    ttl=int(os.getenv("SMARTROUTINE_FRIEND_CACHE_TTL", "300")),
+)
+
+def refresh_friend_summaries(email, ops):
+    if ops is not None and all(path == "data.last_seen" for _, path, _ in ops):
+        friend_summaries.patch(email, last_seen=ops[-1][2])
+    else:
+        friend_summaries.invalidate(email)
+
+store.subscribe(refresh_friend_summaries)
+
+def friend_card_view(card):
+    """Card plus live online status (online if seen in the last 5 minutes)."""
+    return {**card, "is_online": presence.is_online(card["email"], stored=card["last_seen"])}
+
 @app.route("/friends")
 @login_required
 def friends():
-    users = load_users()
     email = session["user"]
-    user_data = users[email]
+    user_data = load_user(email, sections=("friends",))
     
     # Initialize friends structure if not exists
     if "friends" not in user_data:
         user_data["friends"] = {"list": [], "pending_sent": [], "pending_received": []}
-        save_users(users)
+        update_user(email, ("set", "friends", user_data["friends"]))
+    
+    # One batch for every card on this page (cached between requests)
+    cards = friend_summaries.get_many(user_data["friends"]["list"] + user_data["friends"]["pending_received"])
     
     # Get friend details
-    friends_list = []
-    for friend_email in user_data["friends"]["list"]:
-        if friend_email in users:
-            friend = users[friend_email]
-            
-            # Calculate online status (online if seen in last 5 minutes)
-            from datetime import datetime, timedelta
-            last_seen_str = friend.get("data", {}).get("last_seen")
-            is_online = False
-            if last_seen_str:
-                try:
-                    last_seen = datetime.fromisoformat(last_seen_str)
-                    is_online = (datetime.now() - last_seen) < timedelta(minutes=5)
-                except:
-                    pass
-            
-            friends_list.append({
-                "email": friend_email,
-                "name": friend.get("data", {}).get("first_name", friend_email.split("@")[0]),
-                "avatar": friend.get("data", {}).get("avatar", "👤"),
-                "streak": calculate_streak(friend.get("daily_logs", [])),
-                "total_hours": sum(t.get("duration", 0) for t in friend.get("tasks", [])),
-                "badges": len(check_achievements(friend)),
-                "is_online": is_online
-            })
+    friends_list = [friend_card_view(cards[f]) for f in user_data["friends"]["list"] if f in cards]
     
     # Get pending requests details
-    pending_received = []
-    for req_email in user_data["friends"]["pending_received"]:
-        if req_email in users:
-            requester = users[req_email]
-            pending_received.append({
-                "email": req_email,
-                "name": requester.get("data", {}).get("first_name", req_email.split("@")[0]),
-                "avatar": requester.get("data", {}).get("avatar", "👤")
-            })
+    pending_received = [cards[r] for r in user_data["friends"]["pending_received"] if r in cards]
     
     return render_template("friends.html",
                          user=user_data,
@@ -899,9 +1177,9 @@ def friends():
 @app.route("/friends/add", methods=["POST"])
 @login_required
 def add_friend():
-    users = load_users()
     email = session["user"]
     friend_email = request.form.get("friend_email", "").strip().lower()
+    users = load_users_many([email, friend_email])
     
     # Validation
     if not friend_email:
@@ -940,14 +1218,15 @@ def add_friend():
     friend_data["friends"]["pending_received"].append(email)
     
     save_users(users)
+    notify(friend_email, "friend_request", email)
     flash(f"Friend request sent to {friend_email}!", "success")
     return redirect(url_for("friends"))
 
 @app.route("/friends/accept/<friend_email>")
 @login_required
 def accept_friend(friend_email):
-    users = load_users()
     email = session["user"]
+    users = load_users_many([email, friend_email])
     user_data = users[email]
     
     if "friends" not in user_data:
@@ -968,6 +1247,7 @@ def accept_friend(friend_email):
         friend_data["friends"]["list"].append(email)
         
         save_users(users)
+        notify(friend_email, "friend_accepted", email)
         flash(f"You are now friends with {friend_email}!", "success")
     
     return redirect(url_for("friends"))
@@ -975,8 +1255,8 @@ def accept_friend(friend_email):
 @app.route("/friends/reject/<friend_email>")
 @login_required
 def reject_friend(friend_email):
-    users = load_users()
     email = session["user"]
+    users = load_users_many([email, friend_email])
     user_data = users[email]
     
     if "friends" not in user_data:
@@ -998,8 +1278,8 @@ def reject_friend(friend_email):
 @app.route("/friends/remove/<friend_email>")
 @login_required
 def remove_friend(friend_email):
-    users = load_users()
     email = session["user"]
+    users = load_users_many([email, friend_email])
     user_data = users[email]
     
     if "friends" in user_data and friend_email in user_data["friends"]["list"]:
@@ -1019,81 +1299,112 @@ def remove_friend(friend_email):
 # -----------------------------
 # HEAD-TO-HEAD CHALLENGES
 # -----------------------------
+def bump_h2h_progress(email, ops):
+    """Count a user's new tasks and daily logs towards their active H2H
+    challenges (see challenges.h2h_progress). Costs one index lookup when
+    they have none, and one small write per challenge that changes."""
+    if ops is None:
+        return
+    tasks, logs, streak = h2h_events(ops)
+    if not (tasks or logs or streak):
+        return
+    today = str(date.today())
+    
+    def changes(challenge):
+        if challenge["status"] != "active" or challenge.get("metric") not in H2H_METRICS:
+            return None
+        side = "challenger" if challenge["challenger"] == email else "opponent"
+        return h2h_progress(challenge, side, tasks, logs, streak, today)
+    
+    for challenge in h2h_store.get_many(h2h_store.ids(email, "active")).values():
+        # Checked on the copy first, then applied under the store's write lock
+        if changes(challenge) is not None:
+            h2h_store.update(challenge["id"], changes)
+
+store.subscribe(bump_h2h_progress)
+
+def h2h_catch_up(challenge, today):
+    """Progress from the tasks and daily logs both players recorded while
+    the challenge was pending, which bump_h2h_progress did not count."""
+    fields = {}
+    if challenge.get("metric") not in H2H_METRICS:
+        return fields
+    start, end = challenge["start_date"], challenge["end_date"]
+    for side in ("challenger", "opponent"):
+        email = challenge[side]
+        tasks = list(store.iter_entries(email, "tasks", start, end))
+        logs = list(store.iter_entries(email, "daily_logs", start, end))
+        streak = (store.view(email, sections=()) or {}).get("streak")
+        fields.update(h2h_progress({**challenge, **fields}, side, tasks, logs, streak, today) or {})
+    return fields
+
 @app.route("/h2h")
 @login_required
 def h2h():
-    users = load_users()
     email = session["user"]
-    user_data = users[email]
+    user_data = load_user(email, sections=("friends",))
+    lists = h2h_store.for_user(email)
     
-    # Initialize H2H structure
-    if "h2h_challenges" not in user_data:
-        user_data["h2h_challenges"] = {"active": [], "completed": [], "pending": []}
-        save_users(users)
+    # Cards for opponents, challengers and friends, in one batch
+    related = [c["challenger"] for c in lists["pending"]]
+    for challenge in lists["active"]:
+        related.append(challenge["opponent"] if challenge["challenger"] == email else challenge["challenger"])
+    related.extend(user_data.get("friends", {}).get("list", []))
+    cards = {**friend_summaries.get_many([e for e in related if e != ENGINE_EMAIL]), ENGINE_EMAIL: ENGINE_CARD}
     
     # Get all challenges involving this user
     all_challenges = []
     
-    for challenge in user_data["h2h_challenges"]["active"]:
+    for challenge in lists["active"]:
         opponent_email = challenge["opponent"] if challenge["challenger"] == email else challenge["challenger"]
-        opponent = users.get(opponent_email, {})
+        opponent = cards.get(opponent_email, {})
         
         all_challenges.append({
             **challenge,
-            "opponent_name": opponent.get("data", {}).get("first_name", opponent_email.split("@")[0]),
-            "opponent_avatar": opponent.get("data", {}).get("avatar", "👤"),
+            "opponent_name": opponent.get("name", opponent_email.split("@")[0]),
+            "opponent_avatar": opponent.get("avatar", "👤"),
             "is_challenger": challenge["challenger"] == email
         })
     
     # Get pending challenges
     pending = []
-    for challenge in user_data["h2h_challenges"]["pending"]:
+    for challenge in lists["pending"]:
         sender_email = challenge["challenger"]
-        sender = users.get(sender_email, {})
+        sender = cards.get(sender_email, {})
         pending.append({
             **challenge,
-            "sender_name": sender.get("data", {}).get("first_name", sender_email.split("@")[0]),
-            "sender_avatar": sender.get("data", {}).get("avatar", "👤")
+            "sender_name": sender.get("name", sender_email.split("@")[0]),
+            "sender_avatar": sender.get("avatar", "👤")
         })
     
     # Get friends for challenge creation
-    friends_list = []
-    if "friends" in user_data:
-        for friend_email in user_data["friends"]["list"]:
-            if friend_email in users:
-                friend = users[friend_email]
-                friends_list.append({
-                    "email": friend_email,
-                    "name": friend.get("data", {}).get("first_name", friend_email.split("@")[0]),
-                    "avatar": friend.get("data", {}).get("avatar", "👤")
-                })
+    friends_list = [cards[f] for f in user_data.get("friends", {}).get("list", []) if f in cards]
     
     return render_template("h2h.html",
                          user=user_data,
                          email=email,
                          active_challenges=all_challenges,
                          pending_challenges=pending,
-                         friends=friends_list)
+                         friends=friends_list,
+                         engine_levels=ENGINE_LEVELS)
 
 @app.route("/h2h/create", methods=["POST"])
 @login_required
 def create_h2h():
     import uuid
-    from datetime import datetime, timedelta
     
-    users = load_users()
     email = session["user"]
     
     opponent_email = request.form.get("opponent")
     challenge_type = request.form.get("challenge_type")
     
     # Validation
-    if not opponent_email or opponent_email not in users:
+    if not opponent_email or not store.exists(opponent_email):
         flash("Invalid opponent.", "error")
         return redirect(url_for("h2h"))
     
     # Check if friends
-    user_data = users[email]
+    user_data = load_user(email, sections=("friends",))
     if "friends" not in user_data or opponent_email not in user_data["friends"]["list"]:
         flash("You can only challenge friends!", "error")
         return redirect(url_for("h2h"))
@@ -1142,110 +1453,318 @@ def create_h2h():
         "winner": None
     }
     
-    # Add to opponent's pending
-    opponent_data = users[opponent_email]
-    if "h2h_challenges" not in opponent_data:
-        opponent_data["h2h_challenges"] = {"active": [], "completed": [], "pending": []}
-    opponent_data["h2h_challenges"]["pending"].append(challenge)
-    
-    # Add to user's active (as pending from their side too)
-    if "h2h_challenges" not in user_data:
-        user_data["h2h_challenges"] = {"active": [], "completed": [], "pending": []}
-    user_data["h2h_challenges"]["active"].append(challenge)
-    
-    save_users(users)
+    # One canonical copy: the opponent's pending list and our active list both index it
+    h2h_store.create(challenge)
+    schedule_h2h_expiry(challenge_id, challenge["end_date"])
+    notify(opponent_email, "h2h_invite", email, challenge_id=challenge_id, title=config["title"])
     flash(f"Challenge sent to {opponent_email}!", "success")
     return redirect(url_for("h2h"))
 
 @app.route("/h2h/accept/<challenge_id>")
 @login_required
 def accept_h2h(challenge_id):
-    users = load_users()
     email = session["user"]
-    user_data = users[email]
     
-    if "h2h_challenges" not in user_data:
-        return redirect(url_for("h2h"))
-    
-    # Find and accept challenge
-    for challenge in user_data["h2h_challenges"]["pending"]:
-        if challenge["id"] == challenge_id:
-            challenge["status"] = "active"
-            user_data["h2h_challenges"]["pending"].remove(challenge)
-            user_data["h2h_challenges"]["active"].append(challenge)
-            
-            # Update challenger's copy
-            challenger_data = users[challenge["challenger"]]
-            for c in challenger_data["h2h_challenges"]["active"]:
-                if c["id"] == challenge_id:
-                    c["status"] = "active"
-            
-            save_users(users)
-            flash("Challenge accepted! Let the battle begin! 🔥", "success")
-            break
+    # Only the invited opponent can accept, and only once
+    today = str(date.today())
+    challenge = h2h_store.update(challenge_id, lambda c: {"status": "active", **h2h_catch_up(c, today)},
+                                 check=lambda c: c["opponent"] == email and c["status"] == "pending")
+    if challenge:
+        notify(challenge["challenger"], "h2h_accepted", email, challenge_id=challenge_id, title=challenge["title"])
+        flash("Challenge accepted! Let the battle begin! 🔥", "success")
     
     return redirect(url_for("h2h"))
 
 @app.route("/h2h/decline/<challenge_id>")
 @login_required
 def decline_h2h(challenge_id):
-    users = load_users()
     email = session["user"]
-    user_data = users[email]
     
-    if "h2h_challenges" not in user_data:
-        return redirect(url_for("h2h"))
-    
-    # Find and decline
-    for challenge in user_data["h2h_challenges"]["pending"]:
-        if challenge["id"] == challenge_id:
-            user_data["h2h_challenges"]["pending"].remove(challenge)
-            
-            # Remove from challenger's active
-            challenger_data = users[challenge["challenger"]]
-            challenger_data["h2h_challenges"]["active"] = [
-                c for c in challenger_data["h2h_challenges"]["active"] if c["id"] != challenge_id
-            ]
-            
-            save_users(users)
-            flash("Challenge declined.", "info")
-            break
+    if h2h_store.update(challenge_id, {"status": "declined"},
+                        check=lambda c: c["opponent"] == email and c["status"] == "pending"):
+        flash("Challenge declined.", "info")
     
     return redirect(url_for("h2h"))
 
-
 # -----------------------------
 # CHESS GAME
 # -----------------------------
+# Moves live in per-game logs (see chessgames.py), not in the user records
+chess_games = ChessGames(GAMES_DIR)
+
+# Practice games against the engine (see chessengine.py). Searches run in a
+# process pool started on the first engine game; its moves are played from
+# the future's callback and reach the page through the same long poll.
+ENGINE_EMAIL = "engine@smartroutine"
+ENGINE_CARD = {"email": ENGINE_EMAIL, "name": "SmartRoutine Engine", "avatar": "🤖"}
+ENGINE_LEVELS = {"easy": (1, 0.2), "medium": (3, 1.0), "hard": (5, 3.0)}   # (depth, seconds)
+chess_engine = ChessEngine(
+    workers=int(os.getenv("SMARTROUTINE_ENGINE_WORKERS", "2")),
+    depth=int(os.getenv("SMARTROUTINE_ENGINE_DEPTH", "5")),
+    movetime=float(os.getenv("SMARTROUTINE_ENGINE_MOVETIME", "3"))
+)
+engine_thinking = set()   # game ids with a search in flight
+engine_lock = threading.Lock()
+
+def engine_move(challenge_id):
+    """Start the engine's reply if it is to move in this game (one search at a time per game)."""
+    game = chess_games.history(challenge_id)
+    if game is None or game["result"] or game["turn"] != ENGINE_EMAIL:
+        return
+    with engine_lock:
+        if challenge_id in engine_thinking:
+            return
+        engine_thinking.add(challenge_id)
+    depth, movetime = ENGINE_LEVELS.get(game["header"].get("level"), ENGINE_LEVELS["medium"])
+    
+    def play(future):
+        state = None
+        try:
+            uci = future.result()["uci"]
+            if uci:
+                state = chess_games.play(challenge_id, ENGINE_EMAIL, uci)
+                if state["result"]:
+                    finish_chess_challenge(challenge_id, state)
+        except Exception as e:
+            print("Engine move failed for", challenge_id, e)
+        finally:
+            with engine_lock:
+                engine_thinking.discard(challenge_id)
+        # The player may already have replied while this search was still marked in flight
+        if state is not None and not state["result"]:
+            engine_move(challenge_id)
+    
+    chess_engine.submit(game["fen"], game["keys"], depth, movetime).add_done_callback(play)
+
+def finish_chess_challenge(challenge_id, game):
+    """Complete the H2H challenge behind a finished game (once)."""
+    winner = {"1-0": game["white"], "0-1": game["black"]}.get(game["result"])
+    challenge = h2h_store.get(challenge_id)
+    if challenge is None:
+        return
+    h2h_store.update(challenge_id, {
+        "status": "completed", "winner": winner, "result": game["result"],
+        "challenger_progress": int(winner == challenge["challenger"]),
+        "opponent_progress": int(winner == challenge["opponent"]),
+    }, check=lambda c: c["status"] == "active")
+
+def is_chess_player(challenge_id, email):
+    """True if ``email`` plays in the game (a header lookup, no game state built)."""
+    try:
+        return chess_games.color_of(challenge_id, email) is not None
+    except ChessError:
+        return False
+
 @app.route("/chess/<challenge_id>")
 @login_required
 def chess_game(challenge_id):
-    users = load_users()
     email = session["user"]
-    user_data = users[email]
+    user_data = load_user(email, sections=())
     
-    # Find the challenge
-    challenge = None
-    for c in user_data.get("h2h_challenges", {}).get("active", []):
-        if c["id"] == challenge_id and c["type"] == "chess_game":
-            challenge = c
-            break
-    
-    if not challenge:
+    challenge = h2h_store.get(challenge_id)
+    if not challenge or challenge["type"] != "chess_game" or challenge["status"] == "declined" \
+            or email not in (challenge["challenger"], challenge["opponent"]):
         flash("Chess game not found.", "error")
         return redirect(url_for("h2h"))
     
+    if not chess_games.exists(challenge_id):
+        if challenge["status"] != "active":
+            flash("The game starts once your opponent accepts the challenge.", "info")
+            return redirect(url_for("h2h"))
+        # The challenger plays white
+        chess_games.create(challenge_id, white=challenge["challenger"], black=challenge["opponent"])
+    game = chess_games.state(challenge_id)
+    engine_move(challenge_id)
+    
     # Get opponent info
     opponent_email = challenge["opponent"] if challenge["challenger"] == email else challenge["challenger"]
-    opponent = users.get(opponent_email, {})
+    if opponent_email == ENGINE_EMAIL:
+        opponent = ENGINE_CARD
+    else:
+        opponent = friend_summaries.get_many([opponent_email]).get(opponent_email, {})
     
     return render_template("chess.html",
                          user=user_data,
                          email=email,
                          challenge=challenge,
-                         opponent_name=opponent.get("data", {}).get("first_name", opponent_email.split("@")[0]),
-                         opponent_avatar=opponent.get("data", {}).get("avatar", "👤"))
+                         game=game,
+                         my_color="w" if game["white"] == email else "b",
+                         opponent_name=opponent.get("name", opponent_email.split("@")[0]),
+                         opponent_avatar=opponent.get("avatar", "👤"))
 
+@app.route("/chess/<challenge_id>/move", methods=["POST"])
+@login_required
+def chess_move(challenge_id):
+    """Submit one move in UCI form ({"uci": "e2e4"}); returns the state with just that move."""
+    email = session["user"]
+    uci = (request.get_json(silent=True) or request.form).get("uci", "")
+    challenge = h2h_store.get(challenge_id)
+    if challenge is None or challenge["status"] != "active":
+        return jsonify({"error": "This challenge is closed."}), 400
+    try:
+        game = chess_games.play(challenge_id, email, uci)
+    except ChessError as e:
+        return jsonify({"error": str(e)}), 400
+    if game["result"]:
+        finish_chess_challenge(challenge_id, game)
+    else:
+        engine_move(challenge_id)
+    return jsonify(game)
+
+@app.route("/chess/practice", methods=["POST"])
+@login_required
+def chess_practice():
+    """Start a practice game against the engine, as an H2H chess challenge."""
+    import random
+    import uuid
+    
+    email = session["user"]
+    level = request.form.get("level", "medium")
+    color = request.form.get("color", "random")
+    if level not in ENGINE_LEVELS or color not in ("white", "black", "random"):
+        flash("Invalid practice settings.", "error")
+        return redirect(url_for("h2h"))
+    if color == "random":
+        color = random.choice(("white", "black"))
+    
+    today = date.today()
+    challenge = {
+        "id": str(uuid.uuid4())[:8],
+        "challenger": email,
+        "opponent": ENGINE_EMAIL,
+        "type": "chess_game",
+        "title": f"Practice vs Engine ({level.title()})",
+        "target": 1,
+        "metric": "chess",
+        "start_date": str(today),
+        "end_date": str(today + timedelta(days=7)),
+        "challenger_progress": 0,
+        "opponent_progress": 0,
+        "status": "active",
+        "winner": None
+    }
+    h2h_store.create(challenge)
+    schedule_h2h_expiry(challenge["id"], challenge["end_date"])
+    
+    players = (email, ENGINE_EMAIL) if color == "white" else (ENGINE_EMAIL, email)
+    chess_games.create(challenge["id"], white=players[0], black=players[1], level=level)
+    return redirect(url_for("chess_game", challenge_id=challenge["id"]))
+
+@app.route("/chess/<challenge_id>/resign", methods=["POST"])
+@login_required
+def chess_resign(challenge_id):
+    email = session["user"]
+    try:
+        game = chess_games.resign(challenge_id, email)
+    except ChessError as e:
+        return jsonify({"error": str(e)}), 400
+    finish_chess_challenge(challenge_id, game)
+    return jsonify(game)
+
+@app.route("/chess/<challenge_id>/moves")
+@login_required
+def chess_moves(challenge_id):
+    """Long poll: moves after ply ?after=N, waiting up to ?wait= seconds for one."""
+    email = session["user"]
+    if not is_chess_player(challenge_id, email):
+        return jsonify({"error": "Game not found."}), 404
+    after = max(request.args.get("after", 0, type=int), 0)
+    wait = min(max(request.args.get("wait", CHESS_POLL_SECONDS, type=float), 0), CHESS_POLL_SECONDS)
+    return jsonify(chess_games.wait(challenge_id, after, timeout=wait))
+
+
+# -----------------------------
+# MAINTENANCE COMMANDS
+# -----------------------------
+@app.cli.command("rebuild-stats")
+def rebuild_stats_command():
+    """Recompute derived per-user state (streaks, rollups, badges) from raw data."""
+    emails = store.emails()
+    for email in emails:
+        record = load_user(email)
+        if record is not None:
+            derived = rebuild_derived(record)
+            derived["achievements"] = build_achievements(record)
+            update_user(email, *[("set", key, value) for key, value in derived.items()])
+    print(f"Rebuilt stats for {len(emails)} users.")
+
+@app.cli.command("generate-insights")
+@click.option("--days", default=7, show_default=True, help="Only users with a task or log this recent.")
+@click.option("--concurrency", default=8, show_default=True, help="Parallel AI requests.")
+def generate_insights_command(days, concurrency):
+    """Pre-generate the dashboard insight for every recently active user."""
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    
+    since = date.today() - timedelta(days=days)
+    emails = store.emails()
+    jobs = {}
+    for email in emails:
+        tasks = store.date_index(email, "tasks")
+        logs = store.date_index(email, "daily_logs")
+        if not (tasks and tasks.between(since)) and not (logs and logs.between(since)):
+            continue
+        messages = insight_messages(load_user(email, sections=("tasks",)) or {}, email)
+        if messages is not None:
+            jobs[email] = messages
+    
+    def run(email):
+        started = time.perf_counter()
+        result, error = with_retries(lambda timeout: insights.complete(jobs[email], timeout=timeout),
+                                     insight_jobs.timeout, insight_jobs.retries, insight_jobs.backoff)
+        return email, result, error, time.perf_counter() - started
+    
+    started = time.perf_counter()
+    results, failures, latencies, cached = {}, {}, [], 0
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as pool:
+        for email, result, error, seconds in pool.map(run, jobs):
+            latencies.append(seconds)
+            if error is not None:
+                failures[email] = error
+            else:
+                results[email] = result[0]
+                cached += result[1]
+    elapsed = time.perf_counter() - started
+    
+    # One bulk write for every insight that changed
+    users = load_users_many(list(results))
+    store.apply_many({
+        email: [("set", "data.latest_insight", insight)]
+        for email, insight in results.items()
+        if insight != users.get(email, {}).get("data", {}).get("latest_insight")
+    })
+    
+    latencies.sort()
+    pct = lambda p: latencies[min(int(p * len(latencies)), len(latencies) - 1)] * 1000 if latencies else 0
+    print(f"Users: {len(emails)} total, {len(jobs)} active in the last {days} days.")
+    print(f"Insights: {len(results)} generated ({cached} from cache), {len(failures)} failed "
+          f"in {elapsed:.1f}s ({len(jobs) / elapsed if elapsed else 0:.1f}/s, concurrency {concurrency}).")
+    print(f"Latency: p50 {pct(0.5):.0f} ms, p95 {pct(0.95):.0f} ms, max {pct(1):.0f} ms.")
+    for email, error in failures.items():
+        print(f"  failed: {email}: {error}")
+
+@app.cli.command("import-data")
+@click.argument("email")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "fmt", type=click.Choice(sorted(IMPORT_READERS)), help="Default: from the file extension.")
+@click.option("--section", type=click.Choice(IMPORT_SECTIONS), help="For CSV files without a section column.")
+def import_data_command(email, path, fmt, section):
+    """Bulk import tasks, daily logs, notes and expenses for EMAIL from a CSV or NDJSON file."""
+    import time
+
+    fmt = import_format(path, fmt)
+    if fmt not in IMPORT_READERS:
+        raise click.UsageError("Can't tell the format from the file name; pass --format.")
+    if not store.exists(email):
+        raise click.UsageError(f"No such user: {email}")
+    started = time.perf_counter()
+    with open(path, encoding="utf-8-sig", errors="replace", newline="") as lines:
+        summary = import_entries(email, lines, fmt, section)
+    accepted = ", ".join(f"{n} {name}" for name, n in summary["accepted"].items())
+    print(f"Imported {accepted} in {time.perf_counter() - started:.1f}s; "
+          f"{summary['duplicates']} duplicates skipped, {summary['rejected']} rows rejected.")
+    for error in summary["errors"]:
+        print(f"  line {error['line']}: {error['error']}")
 
 # -----------------------------
 # RUN SERVER
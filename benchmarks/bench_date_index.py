@@ -0,0 +1,98 @@
+"""
+Micro-benchmark: date-range work per request for a user with 3 years of
+daily logs, with per-row strptime scans (the old code) vs a DateIndex
+(built once per cached record, then bisect lookups).
+
+Run from the repository root:  python benchmarks/bench_date_index.py
+"""
+import os
+import random
+import sys
+import timeit
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from dateindex import DateIndex
+
+ACTIVITIES = ["Coding", "Reading", "Exercise", "Music", "Writing"]
+DAYS = 3 * 365
+RUNS = 200
+
+
+def make_user(days=DAYS):
+    today = date.today()
+    rng = random.Random(42)
+    logs, tasks = [], []
+    for i in range(days, -1, -1):
+        day = str(today - timedelta(days=i))
+        logs.append({"date": day, "mood": "Good", "log": {a: rng.randint(0, 3) for a in ACTIVITIES}})
+        for n in range(rng.randint(1, 4)):
+            tasks.append({"task": f"task {n}", "duration": rng.randint(1, 3), "date": day})
+    return logs, tasks
+
+
+def per_request_scans(logs, tasks):
+    """What a dashboard + challenges request used to do: strptime every row,
+    once per question asked."""
+    today = datetime.now().date()
+    week_start = today - timedelta(days=today.weekday())
+    # calculate_streak
+    dates = sorted({l["date"] for l in logs}, reverse=True)
+    streak = 1
+    for i in range(len(dates) - 1):
+        d1 = datetime.strptime(dates[i], "%Y-%m-%d").date()
+        d2 = datetime.strptime(dates[i + 1], "%Y-%m-%d").date()
+        if (d1 - d2).days != 1:
+            break
+        streak += 1
+    # this week's hours, activities and logged days (one scan each)
+    week = [l for l in logs if datetime.strptime(l["date"], "%Y-%m-%d").date() >= week_start]
+    hours = sum(sum(l["log"].values()) for l in week)
+    acts = {a for l in logs if datetime.strptime(l["date"], "%Y-%m-%d").date() >= week_start for a in l["log"]}
+    days = [l for l in logs if datetime.strptime(l["date"], "%Y-%m-%d").date() >= week_start]
+    # last 30 days heatmap and today's tasks
+    cutoff = today - timedelta(days=30)
+    recent = [l for l in logs if datetime.strptime(l["date"], "%Y-%m-%d").date() >= cutoff]
+    today_tasks = [t for t in tasks if t["date"] == str(today)]
+    return streak, hours, len(acts), len(days), len(recent), len(today_tasks)
+
+
+def per_request_indexed(log_index, task_index):
+    today = date.today()
+    week_start = today - timedelta(days=today.weekday())
+    streak = log_index.streak(today)
+    week = log_index.between(week_start, week_start + timedelta(days=6))
+    hours = sum(sum(l["log"].values()) for l in week)
+    acts = {a for l in week for a in l["log"]}
+    recent = log_index.between(today - timedelta(days=30), today)
+    today_tasks = task_index.on(today)
+    return streak, hours, len(acts), len(week), len(recent), len(today_tasks)
+
+
+def bench(label, fn, runs=RUNS):
+    seconds = min(timeit.repeat(fn, number=runs, repeat=5)) / runs
+    print(f"{label:<42} {seconds * 1e6:10.1f} us")
+    return seconds
+
+
+def main():
+    logs, tasks = make_user()
+    print(f"user: {len(logs)} daily logs, {len(tasks)} tasks\n")
+
+    log_index, task_index = DateIndex(logs), DateIndex(tasks)
+    assert per_request_scans(logs, tasks)[0] == per_request_indexed(log_index, task_index)[0]
+
+    old = bench("per request, strptime scans", lambda: per_request_scans(logs, tasks))
+    new = bench("per request, DateIndex lookups", lambda: per_request_indexed(log_index, task_index))
+    build = bench("build both indexes (once per cache load)",
+                  lambda: (DateIndex(logs), DateIndex(tasks)), runs=20)
+    bench("append one log to the index",
+          lambda: DateIndex.add(log_index, {"date": str(date.today()), "log": {}}), runs=1000)
+
+    print(f"\nspeedup per request: {old / new:.0f}x "
+          f"(index build pays for itself after {build / (old - new):.1f} requests)")
+
+
+if __name__ == "__main__":
+    main()
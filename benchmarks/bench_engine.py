@@ -0,0 +1,62 @@
+"""
+Engine benchmark: fixed-depth searches (chessengine.py) from a few opening,
+middlegame and endgame positions, reporting nodes searched, time and
+nodes per second, then the same searches run concurrently on the process
+pool the app uses (ChessEngine), to show throughput across cores.
+
+Each search starts from an empty transposition table unless --keep-tt is
+given.
+
+Run from the repository root:  python benchmarks/bench_engine.py [--depth 4] [--workers 2] [--keep-tt]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import chessengine
+from chessboard import START_FEN
+from chessengine import ChessEngine, best_move
+
+POSITIONS = [
+    ("start", START_FEN),
+    ("italian", "r1bqk1nr/pppp1ppp/2n5/2b1p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4"),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1"),
+    ("middlegame", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10"),
+    ("endgame", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1"),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--keep-tt", action="store_true")
+    args = parser.parse_args()
+
+    nodes, seconds = 0, 0.0
+    for name, fen in POSITIONS:
+        if not args.keep_tt:
+            chessengine._tt.clear()
+        result = best_move(fen, depth=args.depth, movetime=None)
+        nodes += result["nodes"]
+        seconds += result["seconds"]
+        print(f"{name:<11} depth {result['depth']}: {result['uci']:<6} score {result['score']:>6}  "
+              f"{result['nodes']:>8} nodes {result['seconds']:7.2f}s "
+              f"{result['nodes'] / max(result['seconds'], 1e-9):>9,.0f} nodes/s")
+    print(f"single process: {nodes:,} nodes in {seconds:.2f}s ({nodes / seconds:,.0f} nodes/s)")
+
+    engine = ChessEngine(workers=args.workers, depth=args.depth, movetime=3600)
+    engine.submit(START_FEN, depth=1).result()   # start the pool outside the timing
+    started = time.perf_counter()
+    futures = [engine.submit(fen) for _, fen in POSITIONS for _ in range(args.workers)]
+    pool_nodes = sum(f.result()["nodes"] for f in futures)
+    elapsed = time.perf_counter() - started
+    print(f"pool of {args.workers}: {len(futures)} searches, {pool_nodes:,} nodes in {elapsed:.2f}s "
+          f"({pool_nodes / elapsed:,.0f} nodes/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Idle SSE load check: start the app under gunicorn with the gevent workers
+from gunicorn.conf.py, open many /events streams at once (one per
+simulated user, all logged in with signed session cookies) and leave them
+idle. Then report how many threads and how much memory the worker uses,
+check that every stream still gets its heartbeat, and that a normal page
+is still served promptly while they are all open.
+
+The server runs in an empty scratch directory, so no user data is touched.
+
+Run from the repository root:  python benchmarks/bench_sse.py [streams]
+Exits non-zero if a stream fails to connect or misses its heartbeat.
+"""
+import os
+import resource
+import selectors
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+HEARTBEAT = 3
+
+
+def session_cookie(email):
+    # Signed the same way the app signs its own session cookies
+    from flask import Flask
+    flask_app = Flask("sign")
+    flask_app.secret_key = "CHANGE_THIS_SECRET_KEY"
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    return serializer.dumps({"user": email})
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def worker_pid(master):
+    with open(f"/proc/{master}/task/{master}/children") as f:
+        children = f.read().split()
+    return int(children[0]) if children else None
+
+
+def proc_status(pid):
+    fields = {}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            fields[key] = value.strip()
+    return int(fields["Threads"]), int(fields["VmRSS"].split()[0]) // 1024
+
+
+def request(port, path, cookie):
+    return (f"GET {path} HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\n"
+            f"Cookie: session={cookie}\r\nAccept: text/event-stream\r\n\r\n").encode()
+
+
+def wait_for(sel, socks, marker, seconds):
+    """Read from every socket until each has sent ``marker``; returns how many did."""
+    pending = set(socks)
+    buffers = {s: b"" for s in socks}
+    deadline = time.monotonic() + seconds
+    while pending and time.monotonic() < deadline:
+        for key, _ in sel.select(timeout=0.5):
+            s = key.fileobj
+            data = s.recv(65536)
+            buffers[s] += data
+            if s in pending and marker in buffers[s]:
+                pending.discard(s)
+                buffers[s] = b""
+    return len(socks) - len(pending)
+
+
+def main():
+    streams = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))   # inherited by the server
+    if hard < streams + 100:
+        sys.exit(f"open-file limit {hard} is too low for {streams} streams")
+
+    port = free_port()
+    env = {**os.environ, "SMARTROUTINE_BIND": f"127.0.0.1:{port}",
+           "SMARTROUTINE_EVENTS_HEARTBEAT": str(HEARTBEAT), "PYTHONPATH": ROOT}
+    env.pop("OPENAI_API_KEY", None)
+    with tempfile.TemporaryDirectory() as scratch:
+        server = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", os.path.join(ROOT, "gunicorn.conf.py"),
+                                   "--log-level", "warning", "app:app"], cwd=scratch, env=env)
+        try:
+            run(port, server.pid, streams)
+        finally:
+            server.terminate()
+            server.wait(10)
+
+
+def run(port, master, streams):
+    deadline = time.monotonic() + 30
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            break
+        except OSError:
+            if time.monotonic() > deadline:
+                sys.exit("server did not start")
+            time.sleep(0.2)
+    worker = worker_pid(master)
+    threads_before, rss_before = proc_status(worker)
+
+    sel = selectors.DefaultSelector()
+    socks = []
+    started = time.perf_counter()
+    for i in range(streams):
+        s = socket.create_connection(("127.0.0.1", port))
+        s.sendall(request(port, "/events", session_cookie(f"user{i}@bench.test")))
+        s.setblocking(False)
+        sel.register(s, selectors.EVENT_READ)
+        socks.append(s)
+    connected = wait_for(sel, socks, b": connected", 60)
+    connect_seconds = time.perf_counter() - started
+    threads_open, rss_open = proc_status(worker)
+
+    # A normal request while every stream is open
+    page_started = time.perf_counter()
+    with socket.create_connection(("127.0.0.1", port), timeout=10) as s:
+        s.sendall("GET / HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n".encode())
+        status = s.recv(64).split(b"\r\n")[0].decode()
+    page_ms = (time.perf_counter() - page_started) * 1000
+
+    pinged = wait_for(sel, socks, b": ping", HEARTBEAT * 3)
+    for s in socks:
+        s.close()
+
+    print(f"{connected}/{streams} streams connected in {connect_seconds:.1f}s; "
+          f"{pinged}/{streams} got their heartbeat")
+    print(f"worker threads: {threads_before} idle -> {threads_open} with every stream open")
+    print(f"worker RSS:     {rss_before} MB -> {rss_open} MB "
+          f"({(rss_open - rss_before) * 1024 / max(connected, 1):.1f} KB per stream)")
+    print(f"GET / while they were open: {status} in {page_ms:.0f} ms")
+    if connected < streams or pinged < streams:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
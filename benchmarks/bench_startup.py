@@ -0,0 +1,66 @@
+"""
+Startup benchmark: cold `import app` and first-request latency, each in a
+fresh interpreter (what an autoscaled worker pays on boot).
+
+Every run uses an empty scratch directory as its working directory, so no
+user data is read or written, and OPENAI_API_KEY is unset to check that
+the app boots without it.
+
+Run from the repository root:  python benchmarks/bench_startup.py [runs]
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+first = time.perf_counter()
+status = client.get("/").status_code
+done = time.perf_counter()
+client.get("/")
+second = time.perf_counter() - done
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "first_request_ms": (done - first) * 1000,
+    "second_request_ms": second * 1000,
+    "status": status,
+    "heavy_modules": [m for m in ("openai", "requests", "numpy") if m in sys.modules],
+}))
+"""
+
+
+def run_once():
+    env = {k: v for k, v in os.environ.items() if k != "OPENAI_API_KEY"}
+    env["PYTHONPATH"] = ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    with tempfile.TemporaryDirectory() as scratch:
+        out = subprocess.run([sys.executable, "-c", PROBE], cwd=scratch, env=env,
+                             capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    run_once()   # warm the OS file cache and write .pyc files
+    results = [run_once() for _ in range(runs)]
+    assert all(r["status"] == 200 for r in results)
+
+    print(f"{runs} fresh interpreters, no OPENAI_API_KEY\n")
+    for key, label in (("import_ms", "cold import app"),
+                       ("first_request_ms", "first request (GET /)"),
+                       ("second_request_ms", "second request")):
+        values = [r[key] for r in results]
+        print(f"{label:<24} median {statistics.median(values):7.1f} ms   max {max(values):7.1f} ms")
+    print(f"\nheavy modules loaded at boot: {results[-1]['heavy_modules'] or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
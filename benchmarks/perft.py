@@ -0,0 +1,58 @@
+"""
+Perft suite for the chess move generator (chessboard.py): counts the leaf
+nodes of the legal move tree from well-known positions and compares them
+with the published numbers, which catches castling, en passant, promotion
+and pin bugs. Also prints move-generation speed.
+
+Run from the repository root:  python benchmarks/perft.py [max_depth]
+Exits non-zero if any count is wrong.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from chessboard import START_FEN, Position
+
+# (name, FEN, expected leaf counts for depth 1, 2, ...)
+POSITIONS = [
+    ("start", START_FEN, [20, 400, 8902, 197281]),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", [48, 2039, 97862]),
+    ("endgame", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", [14, 191, 2812, 43238]),
+    ("promotions", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", [6, 264, 9467]),
+    ("tricky", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", [44, 1486, 62379]),
+    ("middlegame", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10", [46, 2079, 89890]),
+]
+
+
+def perft(position, depth):
+    moves = position.legal_moves()
+    if depth == 1:
+        return len(moves)
+    return sum(perft(position.make(move), depth - 1) for move in moves)
+
+
+def main():
+    max_depth = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    failures = 0
+    total_nodes, total_seconds = 0, 0.0
+    for name, fen, expected in POSITIONS:
+        position = Position(fen)
+        for depth, want in enumerate(expected[:max_depth], start=1):
+            started = time.perf_counter()
+            got = perft(position, depth)
+            seconds = time.perf_counter() - started
+            total_nodes += got
+            total_seconds += seconds
+            ok = got == want
+            failures += not ok
+            print(f"{name:<11} depth {depth}: {got:>8} {'ok' if ok else f'FAIL (expected {want})':<20}"
+                  f"{seconds:7.2f}s {got / seconds if seconds else 0:>10,.0f} nodes/s")
+    print(f"{total_nodes:,} nodes in {total_seconds:.1f}s ({total_nodes / total_seconds:,.0f} nodes/s), "
+          f"{failures} failure(s)")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
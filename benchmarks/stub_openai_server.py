@@ -0,0 +1,75 @@
+"""
+Local stand-in for the OpenAI chat completions API, for exercising the
+background insight jobs (timeouts, retries, concurrency) without network.
+
+    python benchmarks/stub_openai_server.py --port 8099 --delay 2 --fail-every 3
+    OPENAI_BASE_URL=http://127.0.0.1:8099/v1 OPENAI_API_KEY=stub flask run
+
+--delay      seconds to wait before answering each request
+--fail-every answer every Nth request with a 500 (exercises retries)
+"""
+import argparse
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+counter = itertools.count(1)
+counter_lock = threading.Lock()
+
+
+def make_handler(delay, fail_every):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            with counter_lock:
+                n = next(counter)
+            time.sleep(delay)
+            if not self.path.endswith("/chat/completions"):
+                return self._send(404, {"error": {"message": "not found"}})
+            if fail_every and n % fail_every == 0:
+                return self._send(500, {"error": {"message": "stub failure", "type": "server_error"}})
+            prompt = body.get("messages", [{}])[-1].get("content", "")
+            self._send(200, {
+                "id": f"chatcmpl-stub-{n}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "stub"),
+                "choices": [{
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {"role": "assistant",
+                                "content": f"Stub insight #{n} for a {len(prompt)}-character prompt."},
+                }],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            })
+
+        def _send(self, status, payload):
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, fmt, *args):
+            print(f"[stub] {self.address_string()} {fmt % args}")
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--delay", type=float, default=0.5)
+    parser.add_argument("--fail-every", type=int, default=0)
+    args = parser.parse_args()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(args.delay, args.fail_every))
+    print(f"Stub OpenAI API on http://{args.host}:{args.port}/v1")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
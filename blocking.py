@@ -0,0 +1,29 @@
+import sys
+
+# -----------------------------
+# BLOCKING CALLS ON GEVENT WORKERS
+# -----------------------------
+# On a gevent worker (see gunicorn.conf.py) all requests of the process
+# share one OS thread, so a system call that waits (an fsync, an flock held
+# by another process) stalls every one of them, open /events streams
+# included. call_blocking() hands such a call to gevent's pool of native
+# threads and parks only the calling greenlet; anywhere else (dev server,
+# CLI, tests) it just makes the call.
+#
+# Only plain system calls go through here, nothing that takes Python-level
+# locks: on a patched worker those are greenlet locks, which a native
+# thread must not wait on.
+
+
+def _threadpool():
+    monkey = sys.modules.get("gevent.monkey")
+    if monkey is None or not monkey.is_module_patched("threading"):
+        return None
+    from gevent import get_hub
+    return get_hub().threadpool
+
+
+def call_blocking(fn, *args):
+    """``fn(*args)``, off the event loop when running on a gevent worker."""
+    pool = _threadpool()
+    return pool.apply(fn, args) if pool is not None else fn(*args)
@@ -0,0 +1,150 @@
+from datetime import timedelta
+
+from stats import current_streak, parse_day
+
+# -----------------------------
+# CHALLENGE PROGRESS
+# -----------------------------
+# Daily and weekly challenges are scored from a summary of the challenge's
+# window, built once per window from the date-indexed rollups
+# (rollups["log_day"], see stats.py) and the user's task DateIndex. Every
+# metric then reads its value from that summary, so checking all active
+# challenges costs a few lookups, not one scan of the history per challenge.
+#
+# New metrics register with @metric and read the summary; anything they
+# need that isn't in it yet gets added to summarize().
+
+METRICS = {}   # metric name -> fn(summary) -> progress
+
+
+def metric(name):
+    """Register the decorated ``fn(summary)`` as a challenge metric."""
+    def register(fn):
+        METRICS[name] = fn
+        return fn
+    return register
+
+
+@metric("hours")
+def _hours(summary):
+    return summary["hours"]
+
+@metric("tasks")
+def _tasks(summary):
+    return summary["tasks"]
+
+@metric("activities")
+def _activities(summary):
+    return len(summary["activities"])
+
+@metric("days")
+def _days(summary):
+    return summary["days"]
+
+@metric("streak")
+def _streak(summary):
+    return 1 if summary["streak"] > 0 else 0
+
+
+def challenge_window(kind, today):
+    """(first day, last day) scored by a "daily" or "weekly" challenge."""
+    if kind == "daily":
+        return today, today
+    week_start = today - timedelta(days=today.weekday())
+    return week_start, week_start + timedelta(days=6)
+
+def summarize(log_day, task_index, start, end, streak):
+    """Totals for ``start`` .. ``end``: hours logged, activities with time
+    logged, days with any time logged, tasks added, plus the live streak."""
+    summary = {"hours": 0, "activities": set(), "days": 0, "tasks": 0, "streak": streak}
+    for i in range((end - start).days + 1):
+        day = log_day.get(str(start + timedelta(days=i)), {})
+        hours = sum(day.values())
+        summary["hours"] += hours
+        summary["activities"].update(act for act, hrs in day.items() if hrs > 0)
+        if hours > 0:
+            summary["days"] += 1
+    summary["tasks"] = len(task_index.between(start, end))
+    return summary
+
+def evaluate_challenges(challenges, log_day, task_index, streak, today):
+    """Return a copy of ``challenges`` ({"active", "completed"}) with every
+    active challenge's progress recomputed and newly met ones completed."""
+    summaries = {}
+    active = []
+    completed = list(challenges.get("completed", []))
+    for challenge in challenges.get("active", []):
+        window = challenge_window(challenge["type"], today)
+        if window not in summaries:
+            summaries[window] = summarize(log_day, task_index, *window, streak)
+        score = METRICS.get(challenge["metric"])
+        progress = score(summaries[window]) if score else challenge.get("progress", 0)
+        active.append({**challenge, "progress": progress})
+        if progress >= challenge["target"] and challenge["id"] not in completed:
+            completed.append(challenge["id"])
+    return {**challenges, "active": active, "completed": completed}
+
+
+# -----------------------------
+# H2H PROGRESS
+# -----------------------------
+# Head-to-head progress is kept up to date incrementally: every new task or
+# daily log a player records is added to each of their active H2H
+# challenges, so nothing is rescanned when the H2H page is viewed. The
+# events come straight from the record ops (see h2h_events); each player's
+# side of a challenge keeps its own counter ("challenger_progress" /
+# "opponent_progress"), plus the activities seen so far for "activities".
+# Deleting a task does not take progress back.
+
+H2H_METRICS = ("hours", "tasks", "activities", "streak")
+
+
+def h2h_events(ops):
+    """(new tasks, new daily logs, new streak state or None) in a batch of
+    record ops."""
+    tasks, logs, streak = [], [], None
+    for op, path, value in ops:
+        if op == "append" and path == "tasks":
+            tasks.append(value)
+        elif op == "append" and path == "daily_logs":
+            logs.append(value)
+        elif op == "set" and path == "streak":
+            streak = value
+    return tasks, logs, streak
+
+def streak_since(state, start, today):
+    """The live streak of ``state``, counting only days from ``start`` on
+    (so never more than the days elapsed since then)."""
+    first, last = parse_day(start), parse_day(state.get("last_date"))
+    today = parse_day(today)
+    if first is None or last is None or last < first:
+        return 0
+    return min(current_streak(state, today), (last - first).days + 1, (today - first).days + 1)
+
+def h2h_progress(challenge, side, tasks, logs, streak, today):
+    """Fields to change on ``challenge`` for ``side``'s ("challenger" or
+    "opponent") new ``tasks`` / ``logs`` and streak state (None if it
+    didn't change), or None if nothing changes. Only entries dated inside
+    the challenge count, and only the part of the streak since it started;
+    ``today`` is a "YYYY-MM-DD" string."""
+    start, end = challenge.get("start_date", ""), challenge.get("end_date", "9999-12-31")
+    key = f"{side}_progress"
+    current = challenge.get(key, 0)
+    logs = [l for l in logs if start <= l.get("date", "") <= end]
+    metric = challenge.get("metric")
+    if metric == "hours":
+        added = sum(hrs for l in logs for hrs in (l.get("log") or {}).values() if hrs)
+        return {key: current + added} if added else None
+    if metric == "tasks":
+        added = sum(1 for t in tasks if start <= t.get("date", "") <= end)
+        return {key: current + added} if added else None
+    if metric == "activities":
+        seen = set(challenge.get(f"{side}_activities", []))
+        now = seen | {act for l in logs for act, hrs in (l.get("log") or {}).items() if hrs and hrs > 0}
+        return {key: len(now), f"{side}_activities": sorted(now)} if now != seen else None
+    if metric == "streak":
+        if streak is None or not start <= today <= end:
+            return None
+        run = streak_since(streak, start, today)
+        return {key: run} if run != current else None
+    return None
@@ -0,0 +1,412 @@
+import random
+
+# -----------------------------
+# CHESS RULES (BITBOARDS)
+# -----------------------------
+# Legal move generation for the server-side chess games (see chessgames.py).
+# A position is twelve 64-bit integers, one per piece type and colour, with
+# square 0 = a1, 7 = h1, 56 = a8. Knight, king and pawn attacks come from
+# precomputed tables; sliding attacks walk precomputed rays and cut them at
+# the first blocker (the lowest or highest set bit, depending on the ray's
+# direction). Moves are ints: from | to << 6 | promotion piece << 12.
+#
+# Positions are copied on make() rather than undone, and carry an
+# incremental Zobrist key used for repetition checks.
+
+WHITE, BLACK = 0, 1
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+PIECE_CHARS = "PNBRQKpnbrqk"
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+FILES = "abcdefgh"
+
+def square_name(sq):
+    return FILES[sq & 7] + str((sq >> 3) + 1)
+
+def parse_square(name):
+    if len(name) != 2 or name[0] not in FILES or name[1] not in "12345678":
+        raise ValueError(f"Bad square: {name!r}")
+    return FILES.index(name[0]) + 8 * (int(name[1]) - 1)
+
+def move_from(move):
+    return move & 63
+
+def move_to(move):
+    return move >> 6 & 63
+
+def move_promotion(move):
+    return move >> 12
+
+def _bits(bb):
+    """Square indexes of the set bits of ``bb``."""
+    while bb:
+        low = bb & -bb
+        yield low.bit_length() - 1
+        bb ^= low
+
+# -----------------------------
+# ATTACK TABLES
+# -----------------------------
+def _step_table(steps):
+    table = []
+    for sq in range(64):
+        rank, file = sq >> 3, sq & 7
+        bb = 0
+        for dr, df in steps:
+            r, f = rank + dr, file + df
+            if 0 <= r < 8 and 0 <= f < 8:
+                bb |= 1 << (r * 8 + f)
+        table.append(bb)
+    return table
+
+KNIGHT_ATTACKS = _step_table([(1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1), (-2, 1), (-1, 2)])
+KING_ATTACKS = _step_table([(1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1), (1, -1)])
+PAWN_ATTACKS = (_step_table([(1, -1), (1, 1)]), _step_table([(-1, -1), (-1, 1)]))
+
+# (rank step, file step, ray grows towards higher squares)
+ROOK_DIRECTIONS = ((1, 0, True), (0, 1, True), (-1, 0, False), (0, -1, False))
+BISHOP_DIRECTIONS = ((1, 1, True), (1, -1, True), (-1, 1, False), (-1, -1, False))
+
+def _ray_table(dr, df):
+    table = []
+    for sq in range(64):
+        r, f, bb = (sq >> 3) + dr, (sq & 7) + df, 0
+        while 0 <= r < 8 and 0 <= f < 8:
+            bb |= 1 << (r * 8 + f)
+            r, f = r + dr, f + df
+        table.append(bb)
+    return table
+
+RAYS = {(dr, df): _ray_table(dr, df) for dr, df, _ in ROOK_DIRECTIONS + BISHOP_DIRECTIONS}
+
+def _slide(sq, occupied, directions):
+    attacks = 0
+    for dr, df, ascending in directions:
+        rays = RAYS[dr, df]
+        ray = rays[sq]
+        blockers = ray & occupied
+        if blockers:
+            first = (blockers & -blockers).bit_length() - 1 if ascending else blockers.bit_length() - 1
+            ray ^= rays[first]
+        attacks |= ray
+    return attacks
+
+def bishop_attacks(sq, occupied):
+    return _slide(sq, occupied, BISHOP_DIRECTIONS)
+
+def rook_attacks(sq, occupied):
+    return _slide(sq, occupied, ROOK_DIRECTIONS)
+
+# -----------------------------
+# ZOBRIST KEYS
+# -----------------------------
+# Fixed seed: keys must agree between worker processes.
+_rng = random.Random(0x5EED)
+ZOBRIST_PIECES = [[_rng.getrandbits(64) for _ in range(64)] for _ in range(12)]
+ZOBRIST_CASTLING = [_rng.getrandbits(64) for _ in range(16)]
+ZOBRIST_EP_FILE = [_rng.getrandbits(64) for _ in range(8)]
+ZOBRIST_BLACK = _rng.getrandbits(64)
+
+# Castling rights: 1 = K, 2 = Q, 4 = k, 8 = q. Moving from or to a square
+# clears the rights in its mask.
+CASTLING_CHARS = "KQkq"
+CASTLE_MASK = [15] * 64
+for _sq, _rights in ((4, 1 | 2), (7, 1), (0, 2), (60, 4 | 8), (63, 4), (56, 8)):
+    CASTLE_MASK[_sq] = 15 & ~_rights
+# king from, king to, rook from, rook to, right, squares that must be empty, squares that must be safe
+CASTLES = (
+    (4, 6, 7, 5, 1, 0x60, (4, 5, 6)),
+    (4, 2, 0, 3, 2, 0x0E, (4, 3, 2)),
+    (60, 62, 63, 61, 4, 0x60 << 56, (60, 61, 62)),
+    (60, 58, 56, 59, 8, 0x0E << 56, (60, 59, 58)),
+)
+
+
+class Position:
+    """One chess position. make() returns a new Position."""
+
+    __slots__ = ("pieces", "occupancy", "board", "side", "castling", "ep", "halfmove", "fullmove", "key")
+
+    def __init__(self, fen=START_FEN):
+        fields = fen.split()
+        if len(fields) < 4:
+            raise ValueError(f"Bad FEN: {fen!r}")
+        self.pieces = [0] * 12
+        self.board = [-1] * 64
+        rows = fields[0].split("/")
+        if len(rows) != 8:
+            raise ValueError(f"Bad FEN: {fen!r}")
+        for i, row in enumerate(rows):
+            file = 0
+            for ch in row:
+                if ch.isdigit():
+                    file += int(ch)
+                elif ch in PIECE_CHARS and file < 8:
+                    sq = (7 - i) * 8 + file
+                    piece = PIECE_CHARS.index(ch)
+                    self.pieces[piece] |= 1 << sq
+                    self.board[sq] = piece
+                    file += 1
+                else:
+                    raise ValueError(f"Bad FEN: {fen!r}")
+            if file != 8:
+                raise ValueError(f"Bad FEN: {fen!r}")
+        self.occupancy = [0, 0]
+        for piece, bb in enumerate(self.pieces):
+            self.occupancy[piece // 6] |= bb
+        if fields[1] not in ("w", "b"):
+            raise ValueError(f"Bad FEN: {fen!r}")
+        self.side = WHITE if fields[1] == "w" else BLACK
+        self.castling = sum(1 << i for i, ch in enumerate(CASTLING_CHARS) if ch in fields[2])
+        self.ep = parse_square(fields[3]) if fields[3] != "-" else -1
+        self.halfmove = int(fields[4]) if len(fields) > 4 else 0
+        self.fullmove = int(fields[5]) if len(fields) > 5 else 1
+        self.key = self._full_key()
+
+    def copy(self):
+        other = Position.__new__(Position)
+        other.pieces = self.pieces[:]
+        other.occupancy = self.occupancy[:]
+        other.board = self.board[:]
+        other.side, other.castling, other.ep = self.side, self.castling, self.ep
+        other.halfmove, other.fullmove, other.key = self.halfmove, self.fullmove, self.key
+        return other
+
+    def _ep_key(self):
+        # The en passant square only counts when a pawn could actually take
+        if self.ep >= 0 and PAWN_ATTACKS[1 - self.side][self.ep] & self.pieces[self.side * 6 + PAWN]:
+            return ZOBRIST_EP_FILE[self.ep & 7]
+        return 0
+
+    def _full_key(self):
+        key = ZOBRIST_CASTLING[self.castling] ^ self._ep_key()
+        if self.side == BLACK:
+            key ^= ZOBRIST_BLACK
+        for piece, bb in enumerate(self.pieces):
+            for sq in _bits(bb):
+                key ^= ZOBRIST_PIECES[piece][sq]
+        return key
+
+    def fen(self):
+        rows = []
+        for rank in range(7, -1, -1):
+            row, empty = "", 0
+            for file in range(8):
+                piece = self.board[rank * 8 + file]
+                if piece < 0:
+                    empty += 1
+                    continue
+                if empty:
+                    row, empty = row + str(empty), 0
+                row += PIECE_CHARS[piece]
+            rows.append(row + (str(empty) if empty else ""))
+        castling = "".join(ch for i, ch in enumerate(CASTLING_CHARS) if self.castling >> i & 1) or "-"
+        ep = square_name(self.ep) if self.ep >= 0 else "-"
+        return f"{'/'.join(rows)} {'wb'[self.side]} {castling} {ep} {self.halfmove} {self.fullmove}"
+
+    # -----------------------------
+    # ATTACKS
+    # -----------------------------
+    def attacked(self, sq, by):
+        """True if side ``by`` attacks square ``sq``."""
+        p = self.pieces
+        base = by * 6
+        if PAWN_ATTACKS[1 - by][sq] & p[base + PAWN] or KNIGHT_ATTACKS[sq] & p[base + KNIGHT] \
+                or KING_ATTACKS[sq] & p[base + KING]:
+            return True
+        occupied = self.occupancy[0] | self.occupancy[1]
+        return bool(bishop_attacks(sq, occupied) & (p[base + BISHOP] | p[base + QUEEN])
+                    or rook_attacks(sq, occupied) & (p[base + ROOK] | p[base + QUEEN]))
+
+    def king_square(self, side):
+        return self.pieces[side * 6 + KING].bit_length() - 1
+
+    def in_check(self, side=None):
+        side = self.side if side is None else side
+        return self.attacked(self.king_square(side), 1 - side)
+
+    # -----------------------------
+    # MOVE GENERATION
+    # -----------------------------
+    def pseudo_moves(self):
+        """Moves that obey piece movement but may leave the king in check."""
+        us, them = self.side, 1 - self.side
+        own, enemy = self.occupancy[us], self.occupancy[them]
+        occupied = own | enemy
+        p = self.pieces
+        base = us * 6
+        moves = []
+        add = moves.append
+
+        # Pawns
+        forward = 8 if us == WHITE else -8
+        start_rank = 1 if us == WHITE else 6
+        last_rank = 7 if us == WHITE else 0
+        targets = enemy | (1 << self.ep if self.ep >= 0 else 0)
+        for frm in _bits(p[base + PAWN]):
+            to = frm + forward
+            dests = []
+            if not occupied >> to & 1:
+                dests.append(to)
+                if frm >> 3 == start_rank and not occupied >> (to + forward) & 1:
+                    dests.append(to + forward)
+            dests.extend(_bits(PAWN_ATTACKS[us][frm] & targets))
+            for to in dests:
+                if to >> 3 == last_rank:
+                    for promotion in (QUEEN, ROOK, BISHOP, KNIGHT):
+                        add(frm | to << 6 | promotion << 12)
+                else:
+                    add(frm | to << 6)
+
+        for frm in _bits(p[base + KNIGHT]):
+            for to in _bits(KNIGHT_ATTACKS[frm] & ~own):
+                add(frm | to << 6)
+        for frm in _bits(p[base + BISHOP] | p[base + QUEEN]):
+            for to in _bits(bishop_attacks(frm, occupied) & ~own):
+                add(frm | to << 6)
+        for frm in _bits(p[base + ROOK] | p[base + QUEEN]):
+            for to in _bits(rook_attacks(frm, occupied) & ~own):
+                add(frm | to << 6)
+
+        king = self.king_square(us)
+        for to in _bits(KING_ATTACKS[king] & ~own):
+            add(king | to << 6)
+        for k_from, k_to, _, _, right, empty, safe in CASTLES:
+            if self.castling & right & (3 if us == WHITE else 12) and k_from == king and not occupied & empty \
+                    and not any(self.attacked(sq, them) for sq in safe):
+                add(k_from | k_to << 6)
+        return moves
+
+    def legal_moves(self):
+        us = self.side
+        moves = []
+        for move in self.pseudo_moves():
+            child = self.make(move)
+            if not child.attacked(child.king_square(us), 1 - us):
+                moves.append(move)
+        return moves
+
+    def make(self, move):
+        """The position after ``move`` (which must be pseudo-legal)."""
+        frm, to, promotion = move & 63, move >> 6 & 63, move >> 12
+        pos = self.copy()
+        pieces, board, occ = pos.pieces, pos.board, pos.occupancy
+        us = self.side
+        piece = board[frm]
+        captured = board[to]
+        key = pos.key ^ ZOBRIST_CASTLING[pos.castling] ^ self._ep_key()
+
+        if captured >= 0:
+            pieces[captured] &= ~(1 << to)
+            occ[1 - us] &= ~(1 << to)
+            key ^= ZOBRIST_PIECES[captured][to]
+        kind = piece - us * 6
+        if kind == PAWN and to == self.ep:
+            victim = to - 8 if us == WHITE else to + 8
+            captured = board[victim]
+            pieces[captured] &= ~(1 << victim)
+            occ[1 - us] &= ~(1 << victim)
+            board[victim] = -1
+            key ^= ZOBRIST_PIECES[captured][victim]
+
+        placed = us * 6 + promotion if promotion else piece
+        pieces[piece] &= ~(1 << frm)
+        pieces[placed] |= 1 << to
+        occ[us] = occ[us] & ~(1 << frm) | 1 << to
+        board[frm], board[to] = -1, placed
+        key ^= ZOBRIST_PIECES[piece][frm] ^ ZOBRIST_PIECES[placed][to]
+
+        if kind == KING and abs(to - frm) == 2:
+            for k_from, k_to, r_from, r_to, _, _, _ in CASTLES:
+                if k_from == frm and k_to == to:
+                    rook = us * 6 + ROOK
+                    pieces[rook] = pieces[rook] & ~(1 << r_from) | 1 << r_to
+                    occ[us] = occ[us] & ~(1 << r_from) | 1 << r_to
+                    board[r_from], board[r_to] = -1, rook
+                    key ^= ZOBRIST_PIECES[rook][r_from] ^ ZOBRIST_PIECES[rook][r_to]
+
+        pos.castling &= CASTLE_MASK[frm] & CASTLE_MASK[to]
+        pos.ep = (frm + to) // 2 if kind == PAWN and abs(to - frm) == 16 else -1
+        pos.halfmove = 0 if kind == PAWN or captured >= 0 else self.halfmove + 1
+        if us == BLACK:
+            pos.fullmove += 1
+        pos.side = 1 - us
+        pos.key = key ^ ZOBRIST_BLACK ^ ZOBRIST_CASTLING[pos.castling] ^ pos._ep_key()
+        return pos
+
+    # -----------------------------
+    # NOTATION AND GAME END
+    # -----------------------------
+    def parse_uci(self, text):
+        """The legal move for a UCI string like "e2e4" / "e7e8q", or None."""
+        text = (text or "").strip().lower()
+        if len(text) not in (4, 5):
+            return None
+        try:
+            frm, to = parse_square(text[:2]), parse_square(text[2:4])
+        except ValueError:
+            return None
+        promotion = 0
+        if len(text) == 5:
+            if text[4] not in "nbrq":
+                return None
+            promotion = "pnbrq".index(text[4])
+        move = frm | to << 6 | promotion << 12
+        return move if move in self.legal_moves() else None
+
+    def uci(self, move):
+        promotion = move >> 12
+        return square_name(move & 63) + square_name(move >> 6 & 63) + ("pnbrq"[promotion] if promotion else "")
+
+    def san(self, move, legal=None):
+        """Standard algebraic notation for a legal ``move``."""
+        frm, to, promotion = move & 63, move >> 6 & 63, move >> 12
+        piece = self.board[frm]
+        kind = piece % 6
+        if kind == KING and abs(to - frm) == 2:
+            text = "O-O" if to > frm else "O-O-O"
+        else:
+            capture = self.board[to] >= 0 or (kind == PAWN and to == self.ep)
+            if kind == PAWN:
+                text = (FILES[frm & 7] + "x" if capture else "") + square_name(to)
+                if promotion:
+                    text += "=" + "PNBRQ"[promotion]
+            else:
+                rivals = [m & 63 for m in (legal if legal is not None else self.legal_moves())
+                          if m >> 6 & 63 == to and m & 63 != frm and self.board[m & 63] == piece]
+                hint = ""
+                if rivals:
+                    if all(r & 7 != frm & 7 for r in rivals):
+                        hint = FILES[frm & 7]
+                    elif all(r >> 3 != frm >> 3 for r in rivals):
+                        hint = str((frm >> 3) + 1)
+                    else:
+                        hint = square_name(frm)
+                text = "NBRQK"[kind - 1] + hint + ("x" if capture else "") + square_name(to)
+        child = self.make(move)
+        if child.in_check():
+            text += "#" if not child.legal_moves() else "+"
+        return text
+
+    def insufficient_material(self):
+        p = self.pieces
+        if p[PAWN] | p[6 + PAWN] | p[ROOK] | p[6 + ROOK] | p[QUEEN] | p[6 + QUEEN]:
+            return False
+        minors = [bin(p[c * 6 + k]).count("1") for c in (WHITE, BLACK) for k in (KNIGHT, BISHOP)]
+        return sum(minors) <= 1
+
+
+def outcome(position, keys=()):
+    """(result, reason) if the game is over, else None. ``keys`` are the
+    Zobrist keys of every earlier position (for threefold repetition)."""
+    if not position.legal_moves():
+        if position.in_check():
+            return ("0-1" if position.side == WHITE else "1-0"), "checkmate"
+        return "1/2-1/2", "stalemate"
+    if position.halfmove >= 100:
+        return "1/2-1/2", "fifty-move rule"
+    if position.insufficient_material():
+        return "1/2-1/2", "insufficient material"
+    if sum(1 for key in keys if key == position.key) >= 2:
+        return "1/2-1/2", "threefold repetition"
+    return None
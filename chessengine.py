@@ -0,0 +1,278 @@
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from chessboard import BISHOP, KING, KNIGHT, PAWN, QUEEN, ROOK, WHITE, Position
+
+# -----------------------------
+# CHESS ENGINE
+# -----------------------------
+# The practice opponent for H2H chess. Iterative-deepening alpha-beta
+# (negamax) over the bitboard move generator in chessboard.py, with a
+# quiescence search on captures, MVV-LVA move ordering and a transposition
+# table keyed by the positions' Zobrist keys. Evaluation is material plus
+# piece-square tables.
+#
+# A search is pure Python and CPU bound, so the app runs it in a process
+# pool (ChessEngine below): it never holds the GIL of a web worker. The
+# transposition table lives in each pool process and is reused across
+# searches, bounded by TT_SIZE entries.
+
+MATE = 100000
+INF = 10 * MATE
+TT_SIZE = 1 << 20
+EXACT, LOWER, UPPER = 0, 1, 2
+
+VALUES = (100, 320, 330, 500, 900, 0)
+
+# Piece-square tables from White's point of view, rank 8 first
+_PST = {
+    PAWN: (
+        0, 0, 0, 0, 0, 0, 0, 0,
+        50, 50, 50, 50, 50, 50, 50, 50,
+        10, 10, 20, 30, 30, 20, 10, 10,
+        5, 5, 10, 25, 25, 10, 5, 5,
+        0, 0, 0, 20, 20, 0, 0, 0,
+        5, -5, -10, 0, 0, -10, -5, 5,
+        5, 10, 10, -20, -20, 10, 10, 5,
+        0, 0, 0, 0, 0, 0, 0, 0),
+    KNIGHT: (
+        -50, -40, -30, -30, -30, -30, -40, -50,
+        -40, -20, 0, 0, 0, 0, -20, -40,
+        -30, 0, 10, 15, 15, 10, 0, -30,
+        -30, 5, 15, 20, 20, 15, 5, -30,
+        -30, 0, 15, 20, 20, 15, 0, -30,
+        -30, 5, 10, 15, 15, 10, 5, -30,
+        -40, -20, 0, 5, 5, 0, -20, -40,
+        -50, -40, -30, -30, -30, -30, -40, -50),
+    BISHOP: (
+        -20, -10, -10, -10, -10, -10, -10, -20,
+        -10, 0, 0, 0, 0, 0, 0, -10,
+        -10, 0, 5, 10, 10, 5, 0, -10,
+        -10, 5, 5, 10, 10, 5, 5, -10,
+        -10, 0, 10, 10, 10, 10, 0, -10,
+        -10, 10, 10, 10, 10, 10, 10, -10,
+        -10, 5, 0, 0, 0, 0, 5, -10,
+        -20, -10, -10, -10, -10, -10, -10, -20),
+    ROOK: (
+        0, 0, 0, 0, 0, 0, 0, 0,
+        5, 10, 10, 10, 10, 10, 10, 5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        0, 0, 0, 5, 5, 0, 0, 0),
+    QUEEN: (
+        -20, -10, -10, -5, -5, -10, -10, -20,
+        -10, 0, 0, 0, 0, 0, 0, -10,
+        -10, 0, 5, 5, 5, 5, 0, -10,
+        -5, 0, 5, 5, 5, 5, 0, -5,
+        0, 0, 5, 5, 5, 5, 0, -5,
+        -10, 5, 5, 5, 5, 5, 0, -10,
+        -10, 0, 5, 0, 0, 0, 0, -10,
+        -20, -10, -10, -5, -5, -10, -10, -20),
+    KING: (
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -20, -30, -30, -40, -40, -30, -30, -20,
+        -10, -20, -20, -20, -20, -20, -20, -10,
+        20, 20, 0, 0, 0, 0, 20, 20,
+        20, 30, 10, 0, 0, 10, 30, 20),
+}
+
+# SQUARE_SCORES[piece][sq]: material plus placement, positive for White
+SQUARE_SCORES = [[VALUES[kind] + _PST[kind][sq ^ 56] for sq in range(64)] for kind in range(6)] + \
+                [[-VALUES[kind] - _PST[kind][sq] for sq in range(64)] for kind in range(6)]
+
+
+def evaluate(position):
+    """Static score in centipawns for the side to move."""
+    score = 0
+    for piece, bb in enumerate(position.pieces):
+        table = SQUARE_SCORES[piece]
+        while bb:
+            low = bb & -bb
+            score += table[low.bit_length() - 1]
+            bb ^= low
+    return score if position.side == WHITE else -score
+
+
+class _Timeout(Exception):
+    pass
+
+
+class Search:
+    """One search: iterative deepening up to ``depth`` plies or until
+    ``movetime`` seconds have passed (the last finished depth is kept)."""
+
+    def __init__(self, tt, history=()):
+        self.tt = tt
+        self.seen = set(history)   # earlier game positions: repeating one is a draw
+        self.path = []
+        self.nodes = 0
+        self.deadline = None
+
+    def _order(self, position, moves, best=None):
+        board = position.board
+
+        def score(move):
+            if move == best:
+                return INF
+            victim = board[move >> 6 & 63]
+            value = 10 * VALUES[victim % 6] - VALUES[board[move & 63] % 6] // 10 if victim >= 0 else 0
+            return value + (VALUES[move >> 12] if move >> 12 else 0)
+
+        return sorted(moves, key=score, reverse=True)
+
+    def _tick(self):
+        self.nodes += 1
+        if self.nodes & 1023 == 0 and self.deadline is not None and time.monotonic() > self.deadline:
+            raise _Timeout()
+
+    def quiesce(self, position, alpha, beta):
+        self._tick()
+        stand = evaluate(position)
+        if stand >= beta:
+            return stand
+        alpha = max(alpha, stand)
+        us = position.side
+        board = position.board
+        captures = [m for m in position.pseudo_moves()
+                    if board[m >> 6 & 63] >= 0 or m >> 12 or (m >> 6 & 63) == position.ep and board[m & 63] % 6 == PAWN]
+        for move in self._order(position, captures):
+            child = position.make(move)
+            if child.attacked(child.king_square(us), 1 - us):
+                continue
+            score = -self.quiesce(child, -beta, -alpha)
+            if score >= beta:
+                return score
+            alpha = max(alpha, score)
+        return alpha
+
+    def negamax(self, position, depth, alpha, beta, ply):
+        self._tick()
+        if ply and (position.halfmove >= 100 or position.key in self.seen or position.key in self.path):
+            return 0
+        in_check = position.in_check()
+        if in_check and ply < 32:
+            depth += 1
+        if depth <= 0:
+            return self.quiesce(position, alpha, beta)
+
+        entry = self.tt.get(position.key)
+        best_move = None
+        if entry is not None:
+            entry_depth, flag, score, best_move = entry
+            if ply and entry_depth >= depth:
+                score = _from_tt(score, ply)
+                if flag == EXACT or flag == LOWER and score >= beta or flag == UPPER and score <= alpha:
+                    return score
+
+        start_alpha = alpha
+        best = -INF
+        us = position.side
+        self.path.append(position.key)
+        try:
+            for move in self._order(position, position.pseudo_moves(), best_move):
+                child = position.make(move)
+                if child.attacked(child.king_square(us), 1 - us):
+                    continue
+                score = -self.negamax(child, depth - 1, -beta, -alpha, ply + 1)
+                if score > best:
+                    best, best_move = score, move
+                    if score > alpha:
+                        alpha = score
+                        if alpha >= beta:
+                            break
+        finally:
+            self.path.pop()
+
+        if best == -INF:
+            return -MATE + ply if in_check else 0
+        flag = UPPER if best <= start_alpha else LOWER if best >= beta else EXACT
+        if len(self.tt) >= TT_SIZE:
+            self.tt.clear()
+        self.tt[position.key] = (depth, flag, _to_tt(best, ply), best_move)
+        return best
+
+    def run(self, position, depth, movetime=None):
+        """(best move, score, depth reached) for the side to move."""
+        started = time.monotonic()
+        best = (None, 0, 0)
+        for d in range(1, depth + 1):
+            # Depth 1 always finishes, so there is a move even on a tiny budget
+            self.deadline = started + movetime if movetime and d > 1 else None
+            try:
+                score = self.negamax(position, d, -INF, INF, 0)
+            except _Timeout:
+                break
+            entry = self.tt.get(position.key)
+            if entry is not None and entry[3] is not None:
+                best = (entry[3], score, d)
+            if abs(score) > MATE - 1000:
+                break   # forced mate found
+            if movetime and time.monotonic() - started > movetime / 2:
+                break   # the next depth would not finish in time
+        return best
+
+
+def _to_tt(score, ply):
+    # Mate scores are stored relative to the node, not the root
+    return score + ply if score > MATE - 1000 else score - ply if score < -MATE + 1000 else score
+
+def _from_tt(score, ply):
+    return score - ply if score > MATE - 1000 else score + ply if score < -MATE + 1000 else score
+
+
+_tt = {}
+
+def best_move(fen, history=(), depth=4, movetime=1.0):
+    """Search the position and return {"uci", "score", "depth", "nodes",
+    "seconds"} ("uci" is None when there is no legal move). ``history`` is
+    the Zobrist keys of the game's earlier positions. Runs in pool workers,
+    so it takes and returns plain values."""
+    started = time.perf_counter()
+    position = Position(fen)
+    search = Search(_tt, history)
+    move, score, reached = search.run(position, depth, movetime)
+    return {
+        "uci": position.uci(move) if move is not None else None,
+        "score": score,
+        "depth": reached,
+        "nodes": search.nodes,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+class ChessEngine:
+    """Engine searches on a process pool, so they can't block web workers."""
+
+    def __init__(self, workers=2, depth=4, movetime=1.0):
+        self.workers = workers
+        self.depth = depth
+        self.movetime = movetime
+        self._pool = None
+        self._lock = threading.Lock()
+        self.searches = 0
+
+    def _executor(self):
+        # Started on the first search, not at import (see make_ai_client)
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            self.searches += 1
+            return self._pool
+
+    def submit(self, fen, history=(), depth=None, movetime=None):
+        """Future for best_move() of the position; depth and movetime are
+        capped at the engine's own settings."""
+        depth = min(depth or self.depth, self.depth)
+        movetime = min(movetime or self.movetime, self.movetime)
+        return self._executor().submit(best_move, fen, list(history), depth, movetime)
+
+    def stats(self):
+        return {"workers": self.workers, "depth": self.depth, "movetime": self.movetime,
+                "started": self._pool is not None, "searches": self.searches}
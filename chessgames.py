@@ -0,0 +1,276 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from blocking import call_blocking
+from chessboard import START_FEN, WHITE, Position, outcome
+
+try:
+    import fcntl
+except ImportError:   # Windows: fall back to in-process locking only
+    fcntl = None
+
+# -----------------------------
+# CHESS GAMES
+# -----------------------------
+# Server-side state of the H2H chess matches, keyed by challenge id and
+# kept apart from the user records, so a move never loads or rewrites a
+# user. Each game is an append-only log, one JSON value per line:
+#
+#   games/<id>.log   {"white": ..., "black": ..., "fen": ...}   header
+#                    "e2e4"                                     one per move
+#                    {"result": "1-0", "reason": "resignation"} on resigning / adjudication
+#
+# The replayed game (position, SAN list, repetition keys) stays in memory,
+# least recently used dropped beyond ``max_games``. Before every read or
+# write the log's size is checked and any lines appended by another worker
+# are replayed, so processes agree without sharing memory. Writers hold an
+# exclusive lock on the log while they validate and append.
+#
+# wait() is the long poll: it returns as soon as the game has moved past a
+# given ply (woken directly by moves made in this process, and re-checking
+# the log every ``poll_interval`` seconds for moves made elsewhere).
+
+
+class ChessError(Exception):
+    """A move or action that isn't allowed (wrong turn, illegal, game over)."""
+
+
+class _Game:
+    def __init__(self, header):
+        self.header = header
+        self.white = header["white"]
+        self.black = header["black"]
+        self.start_fen = header.get("fen", START_FEN)
+        self.position = Position(self.start_fen)
+        self.keys = []        # Zobrist keys before each move (repetition)
+        self.moves = []       # [(uci, san)]
+        self.result = None
+        self.reason = None
+        self.offset = 0       # bytes of the log replayed so far
+        self.changed = threading.Condition()
+
+    def color_of(self, email):
+        return {self.white: "w", self.black: "b"}.get(email)
+
+    def replay(self, value):
+        if isinstance(value, dict):
+            self.result, self.reason = value.get("result"), value.get("reason")
+            return
+        move = self.position.parse_uci(value)
+        if move is None or self.result is not None:
+            return   # never written by play(); ignore rather than corrupt the game
+        self.moves.append((value, self.position.san(move)))
+        self.keys.append(self.position.key)
+        self.position = self.position.make(move)
+        ended = outcome(self.position, self.keys)
+        if ended:
+            self.result, self.reason = ended
+
+
+class ChessGames:
+    """Append-only, per-game move logs with in-memory replay and long polls."""
+
+    def __init__(self, root, max_games=1000, poll_interval=1.0, fsync=True):
+        self.root = root
+        self.max_games = max_games
+        self.poll_interval = poll_interval
+        self.fsync = fsync
+        self._games = OrderedDict()   # id -> _Game
+        self._lock = threading.Lock()
+
+    def _path(self, game_id):
+        if not game_id or not all(ch.isalnum() or ch in "-_" for ch in game_id):
+            raise ChessError("Bad game id.")
+        return os.path.join(self.root, f"{game_id}.log")
+
+    def _catch_up(self, game, f):
+        """Replay lines appended to the open log ``f`` since game.offset."""
+        f.seek(game.offset)
+        data = f.read()
+        end = data.rfind(b"\n") + 1   # a torn last line is picked up next time
+        for line in data[:end].splitlines():
+            if line.strip():
+                try:
+                    game.replay(json.loads(line))
+                except ValueError:
+                    continue
+        game.offset += end
+
+    def _load(self, game_id):
+        """The game, replayed up to the end of its log, or None."""
+        path = self._path(game_id)
+        with self._lock:
+            game = self._games.get(game_id)
+            if game is not None:
+                self._games.move_to_end(game_id)
+        try:
+            if game is not None:
+                if os.path.getsize(path) == game.offset:
+                    return game
+            with open(path, "rb") as f:
+                if game is None:
+                    game = _Game(json.loads(f.readline()))
+                    game.offset = f.tell()
+                    with self._lock:
+                        game = self._games.setdefault(game_id, game)
+                        while len(self._games) > self.max_games:
+                            self._games.popitem(last=False)
+                with game.changed:
+                    self._catch_up(game, f)
+        except FileNotFoundError:
+            return None
+        return game
+
+    def _append(self, game_id, check):
+        """Under the log's lock: catch up, ``check(game)`` -> value to append
+        (or None for nothing), append it and replay it."""
+        game = self._load(game_id)
+        if game is None:
+            raise ChessError("Game not found.")
+        with open(self._path(game_id), "a+b") as f:
+            if fcntl is not None:
+                call_blocking(fcntl.flock, f, fcntl.LOCK_EX)
+            try:
+                with game.changed:
+                    self._catch_up(game, f)
+                    value = check(game)
+                    if value is None:
+                        return game
+                    line = (json.dumps(value) + "\n").encode("utf-8")
+                    f.write(line)
+                    f.flush()
+                    if self.fsync:
+                        call_blocking(os.fsync, f.fileno())
+                    game.replay(value)
+                    game.offset += len(line)
+                    game.changed.notify_all()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+        return game
+
+    # -----------------------------
+    # PUBLIC API
+    # -----------------------------
+    def create(self, game_id, white, black, fen=START_FEN, **extra):
+        """Start the game if it doesn't exist yet (first writer wins). Any
+        ``extra`` fields are kept in the header (see history())."""
+        path = self._path(game_id)
+        os.makedirs(self.root, exist_ok=True)
+        # Write the header aside and link it into place, so readers never see a half-written log
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write((json.dumps({"white": white, "black": black, "fen": fen, **extra}) + "\n").encode("utf-8"))
+        try:
+            os.link(tmp, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(tmp)
+        return self.state(game_id)
+
+    def exists(self, game_id):
+        return os.path.exists(self._path(game_id))
+
+    def color_of(self, game_id, email):
+        """"w" or "b" if ``email`` plays in the game, else None (also when
+        there's no such game). Cheap: a game that isn't loaded yet only has
+        its header line read; its moves are not replayed."""
+        path = self._path(game_id)
+        with self._lock:
+            game = self._games.get(game_id)
+        if game is not None:
+            return game.color_of(email)
+        try:
+            with open(path, "rb") as f:
+                header = json.loads(f.readline())
+        except FileNotFoundError:
+            return None
+        return {header["white"]: "w", header["black"]: "b"}.get(email)
+
+    def state(self, game_id, after=0, game=None):
+        """Game summary with only the moves after ply ``after``, or None."""
+        game = game or self._load(game_id)
+        if game is None:
+            return None
+        with game.changed:
+            position = game.position
+            return {
+                "id": game_id,
+                "white": game.white,
+                "black": game.black,
+                "ply": len(game.moves),
+                "moves": [{"uci": uci, "san": san} for uci, san in game.moves[after:]],
+                "fen": position.fen(),
+                "turn": "w" if position.side == WHITE else "b",
+                "check": game.result is None and position.in_check(),
+                "result": game.result,
+                "reason": game.reason,
+            }
+
+    def history(self, game_id):
+        """What an engine needs to move: the header, the current FEN and the
+        Zobrist keys of every earlier position. None if there's no game."""
+        game = self._load(game_id)
+        if game is None:
+            return None
+        with game.changed:
+            return {"header": dict(game.header), "fen": game.position.fen(), "keys": list(game.keys),
+                    "turn": game.black if game.position.side else game.white, "result": game.result}
+
+    def play(self, game_id, email, uci):
+        """Validate and record ``email``'s move; returns the state after it
+        (with just that move). Raises ChessError."""
+        def check(game):
+            color = game.color_of(email)
+            if color is None:
+                raise ChessError("You are not playing in this game.")
+            if game.result is not None:
+                raise ChessError("The game is over.")
+            if color != ("w" if game.position.side == WHITE else "b"):
+                raise ChessError("It's not your turn.")
+            if game.position.parse_uci(uci) is None:
+                raise ChessError("Illegal move.")
+            return uci.strip().lower()
+
+        game = self._append(game_id, check)
+        return self.state(game_id, after=len(game.moves) - 1, game=game)
+
+    def resign(self, game_id, email):
+        def check(game):
+            color = game.color_of(email)
+            if color is None:
+                raise ChessError("You are not playing in this game.")
+            if game.result is not None:
+                raise ChessError("The game is over.")
+            return {"result": "0-1" if color == "w" else "1-0", "reason": "resignation"}
+
+        game = self._append(game_id, check)
+        return self.state(game_id, after=len(game.moves), game=game)
+
+    def adjudicate(self, game_id, result, reason):
+        """End the game with ``result`` unless it is already over. Returns
+        the final state (with no moves), or None if there's no game."""
+        if not self.exists(game_id):
+            return None
+        game = self._append(game_id, lambda game: None if game.result is not None
+                            else {"result": result, "reason": reason})
+        return self.state(game_id, after=len(game.moves), game=game)
+
+    def wait(self, game_id, after, timeout=25):
+        """Long poll: the state with the moves after ply ``after`` once there
+        are any (or the game ends), or unchanged after ``timeout`` seconds."""
+        deadline = time.monotonic() + timeout
+        game = self._load(game_id)
+        while game is not None and len(game.moves) <= after and game.result is None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            with game.changed:
+                if len(game.moves) <= after and game.result is None:
+                    game.changed.wait(min(self.poll_interval, remaining))
+            game = self._load(game_id)
+        return self.state(game_id, after=after, game=game) if game is not None else None
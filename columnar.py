@@ -0,0 +1,164 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date
+
+from stats import parse_day
+
+# -----------------------------
+# COLUMNAR DAILY LOGS
+# -----------------------------
+# Daily logs as parallel typed arrays, one row per log entry, rows ordered
+# by day:
+#
+#   ordinals     array("l")   ordinal day of each entry
+#   mood_codes   array("h")   index into .moods, -1 when no mood was given
+#   columns[a]   array("d")   hours logged for activity .activities[a]
+#
+# A date range is two bisects over the ordinals, and totals are sums over
+# column slices; with NumPy installed those sums run vectorized over the
+# same buffers (np.frombuffer, no copy). storage.CachedStore keeps one per
+# cached record (see Store.log_columns) and adds entries as they are logged.
+
+_np = False   # not looked up yet
+
+def _numpy():
+    """NumPy if installed, else None. Imported on first use, not at startup."""
+    global _np
+    if _np is False:
+        try:
+            import numpy
+            _np = numpy
+        except ImportError:   # optional: the same columns are summed with plain loops
+            _np = None
+    return _np
+
+def _ordinal(value):
+    day = parse_day(value) if isinstance(value, str) else value
+    return day.toordinal() if day is not None else 0   # 0: malformed, outside any range
+
+def _number(value):
+    """Sums come back as floats; keep whole hours as ints like the raw logs."""
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+
+class LogColumns:
+    """Compact, date-ordered columns for a list of daily log entries."""
+
+    def __init__(self, logs=()):
+        self.ordinals = array("l")
+        self.mood_codes = array("h")
+        self.columns = []      # activity id -> array("d") of hours per row
+        self.activities = []   # activity id -> name
+        self.moods = []        # mood code -> name
+        self._activity_ids = {}
+        self._mood_codes = {}
+        for entry in sorted(logs, key=lambda entry: _ordinal(entry.get("date"))):
+            self.add(entry)
+
+    def __len__(self):
+        return len(self.ordinals)
+
+    def copy(self):
+        """A copy that add() can change without affecting these columns."""
+        columns = LogColumns()
+        columns.ordinals = array("l", self.ordinals)
+        columns.mood_codes = array("h", self.mood_codes)
+        columns.columns = [array("d", column) for column in self.columns]
+        columns.activities = list(self.activities)
+        columns.moods = list(self.moods)
+        columns._activity_ids = dict(self._activity_ids)
+        columns._mood_codes = dict(self._mood_codes)
+        return columns
+
+    def _activity_id(self, name):
+        if name not in self._activity_ids:
+            self._activity_ids[name] = len(self.activities)
+            self.activities.append(name)
+            self.columns.append(array("d", bytes(8 * len(self.ordinals))))
+        return self._activity_ids[name]
+
+    def _mood_code(self, mood):
+        if not mood:
+            return -1
+        if mood not in self._mood_codes:
+            self._mood_codes[mood] = len(self.moods)
+            self.moods.append(mood)
+        return self._mood_codes[mood]
+
+    def add(self, entry):
+        """Add one log entry (O(1) for the usual newest-day append)."""
+        hours = {self._activity_id(act): hrs for act, hrs in entry.get("log", {}).items()}
+        day = _ordinal(entry.get("date"))
+        row = bisect_right(self.ordinals, day)
+        self.ordinals.insert(row, day)
+        self.mood_codes.insert(row, self._mood_code(entry.get("mood")))
+        for a, column in enumerate(self.columns):
+            column.insert(row, hours.get(a) or 0)
+
+    def _rows(self, start=None, end=None):
+        lo = 0 if start is None else bisect_left(self.ordinals, _ordinal(start))
+        hi = len(self.ordinals) if end is None else bisect_right(self.ordinals, _ordinal(end))
+        return lo, hi
+
+    def _row_totals(self, lo, hi):
+        """Hours per row for rows lo..hi (NumPy array or list)."""
+        np = _numpy()
+        if np is not None:
+            totals = np.zeros(hi - lo)
+            for column in self.columns:
+                totals += np.frombuffer(column, dtype=np.float64)[lo:hi]
+            return totals
+        return [sum(values) for values in zip(*(column[lo:hi] for column in self.columns))] \
+            if self.columns else [0.0] * (hi - lo)
+
+    def activity_totals(self, start=None, end=None):
+        """{activity: hours} for entries dated ``start`` .. ``end`` (inclusive, optional)."""
+        lo, hi = self._rows(start, end)
+        if lo == hi:
+            return {}
+        np = _numpy()
+        if np is not None:
+            sums = [np.frombuffer(column, dtype=np.float64)[lo:hi].sum() for column in self.columns]
+        else:
+            sums = [sum(column[lo:hi]) for column in self.columns]
+        return {name: _number(total) for name, total in zip(self.activities, sums)}
+
+    def daily_totals(self, start=None, end=None):
+        """{date: hours} for days with more than zero hours."""
+        lo, hi = self._rows(start, end)
+        if lo == hi:
+            return {}
+        totals = self._row_totals(lo, hi)
+        np = _numpy()
+        if np is not None:
+            ordinals = np.frombuffer(self.ordinals, dtype=f"i{self.ordinals.itemsize}")[lo:hi]
+            days, first = np.unique(ordinals, return_index=True)
+            per_day = zip(days.tolist(), np.add.reduceat(totals, first).tolist())
+        else:
+            per_day = {}
+            for day, total in zip(self.ordinals[lo:hi], totals):
+                per_day[day] = per_day.get(day, 0) + total
+            per_day = per_day.items()
+        return {str(date.fromordinal(day)): _number(total) for day, total in per_day if day and total > 0}
+
+    def stats(self):
+        """{"logs", "best_day", "hours", "moods"} over all entries (as Store.log_stats)."""
+        totals = self._row_totals(0, len(self))
+        np = _numpy()
+        if np is not None:
+            codes = np.frombuffer(self.mood_codes, dtype=np.int16)
+            counts = np.bincount(codes[codes >= 0], minlength=len(self.moods)).tolist()
+            best, hours = (totals.max() if len(totals) else 0), totals.sum()
+        else:
+            counts = [0] * len(self.moods)
+            for code in self.mood_codes:
+                if code >= 0:
+                    counts[code] += 1
+            best, hours = max(totals, default=0), sum(totals)
+        return {
+            "logs": len(self),
+            "best_day": _number(best),
+            "hours": _number(hours),
+            "moods": {mood: n for mood, n in zip(self.moods, counts) if n},
+        }
@@ -1,20 +1,795 @@
+import json
+import os
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
 
-def get_db():
-    return sqlite3.connect("users.db")
-
-def init_db():
-    db = get_db()
-    db.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            first_name TEXT,
-            last_name TEXT,
-            email TEXT UNIQUE,
-            password TEXT
+from h2hstore import ChallengeStore, user_buckets
+from storage import Store, apply_ops, path_parts
+
+DB_PATH = "users.db"
+SCHEMA_VERSION = 3
+
+# -----------------------------
+# CONNECTION POOL (ONE PER THREAD)
+# -----------------------------
+# sqlite3 connections must not be shared across threads, so each worker
+# thread keeps its own long-lived connection instead of opening and closing
+# one per call.
+#
+# SQLite's own busy handler sleeps inside the C call; on a gevent worker
+# that would stall every greenlet of the process (including the one that
+# holds the lock) while another connection is writing. So connections only
+# wait BUSY_TIMEOUT there, and writers take the lock in transaction(),
+# which retries with time.sleep (cooperative under gevent) for up to
+# WRITE_TIMEOUT seconds.
+BUSY_TIMEOUT = 0.1
+WRITE_TIMEOUT = 30
+_local = threading.local()
+
+def get_db(path=DB_PATH):
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    db = conns.get(path)
+    if db is None:
+        db = sqlite3.connect(path, timeout=BUSY_TIMEOUT)
+        db.row_factory = sqlite3.Row
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute("PRAGMA foreign_keys=ON")
+        conns[path] = db
+    return db
+
+def close_db(path=DB_PATH):
+    """Close the calling thread's connection (if any)."""
+    conns = getattr(_local, "conns", {})
+    db = conns.pop(path, None)
+    if db is not None:
+        db.close()
+
+@contextmanager
+def transaction(db):
+    """BEGIN IMMEDIATE ... COMMIT (ROLLBACK on an exception). The write lock
+    is taken before anything is read, so a read-modify-write can't
+    interleave with another writer's."""
+    deadline = time.monotonic() + WRITE_TIMEOUT
+    while True:
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            break
+        except sqlite3.OperationalError as e:
+            if "locked" not in str(e) or time.monotonic() > deadline:
+                raise
+            time.sleep(0.01)
+    try:
+        yield db
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+
+# -----------------------------
+# SCHEMA
+# -----------------------------
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    );
+
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        email TEXT UNIQUE NOT NULL,
+        password TEXT,
+        first_name TEXT,
+        last_name TEXT,
+        profile TEXT NOT NULL DEFAULT '{}',   -- the record's "data" dict
+        activities TEXT,
+        goals TEXT,
+        extra TEXT NOT NULL DEFAULT '{}',     -- any other top-level keys
+        keys TEXT NOT NULL DEFAULT '[]',      -- top-level key order of the record
+        version INTEGER NOT NULL DEFAULT 0    -- bumped on every write (cache validation)
+    );
+
+    CREATE TABLE IF NOT EXISTS tasks (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+        seq INTEGER NOT NULL,
+        task TEXT,
+        duration NUMERIC,
+        date TEXT,
+        extra TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_tasks_user_date ON tasks(user_id, date);
+
+    -- One row per activity per log entry; entries with an empty log keep a
+    -- single row with a NULL activity so the entry itself is not lost.
+    CREATE TABLE IF NOT EXISTS daily_logs (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+        entry INTEGER NOT NULL,
+        date TEXT NOT NULL,
+        mood TEXT,
+        activity TEXT,
+        hours NUMERIC
+    );
+    CREATE INDEX IF NOT EXISTS idx_daily_logs_user_date ON daily_logs(user_id, date);
+
+    CREATE TABLE IF NOT EXISTS notes (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+        seq INTEGER NOT NULL,
+        title TEXT,
+        content TEXT,
+        date TEXT,
+        extra TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_notes_user_date ON notes(user_id, date);
+
+    CREATE TABLE IF NOT EXISTS expenses (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+        seq INTEGER NOT NULL,
+        amount NUMERIC,
+        description TEXT,
+        category TEXT,
+        date TEXT,
+        extra TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_expenses_user_date ON expenses(user_id, date);
+
+    CREATE TABLE IF NOT EXISTS friends (
+        user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+        seq INTEGER NOT NULL,
+        friend_email TEXT NOT NULL,
+        state TEXT NOT NULL CHECK (state IN ('list', 'pending_sent', 'pending_received'))
+    );
+    CREATE INDEX IF NOT EXISTS idx_friends_user ON friends(user_id, state);
+    CREATE INDEX IF NOT EXISTS idx_friends_email ON friends(friend_email);
+
+    -- Daily / weekly challenges. Completed challenges only keep their id.
+    CREATE TABLE IF NOT EXISTS challenges (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+        seq INTEGER NOT NULL,
+        challenge_id TEXT NOT NULL,
+        state TEXT NOT NULL CHECK (state IN ('active', 'completed')),
+        type TEXT,
+        title TEXT,
+        description TEXT,
+        metric TEXT,
+        target NUMERIC,
+        progress NUMERIC,
+        reward TEXT,
+        expires TEXT,
+        extra TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_challenges_user ON challenges(user_id, state);
+    CREATE INDEX IF NOT EXISTS idx_challenges_expires ON challenges(state, expires);
+
+    -- The record's "rollups" dict (see stats.py), one row per leaf so an
+    -- incr/max op is a single upsert. ``path`` is the JSON list of keys
+    -- below "rollups"; a NULL value stands for an empty dict.
+    CREATE TABLE IF NOT EXISTS rollups (
+        user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+        path TEXT NOT NULL,
+        value,
+        PRIMARY KEY (user_id, path)
+    );
+"""
+
+def init_db(path=DB_PATH):
+    db = get_db(path)
+    # Migrations run at startup, before any request: wait for other
+    # processes' writers the blocking way (executescript commits on its own,
+    # so transaction() can't wrap it)
+    db.execute(f"PRAGMA busy_timeout = {WRITE_TIMEOUT * 1000}")
+    version = db.execute("PRAGMA user_version").fetchone()[0]
+    if version in (1, 2):
+        with db:
+            if version == 1:
+                db.execute("ALTER TABLE users ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+            db.executescript(SCHEMA)
+            # Version 3 moved the rollups out of users.extra into their own table
+            for row in db.execute("SELECT id, extra FROM users "
+                                  "WHERE json_extract(extra, '$.rollups') IS NOT NULL").fetchall():
+                extra = json.loads(row["extra"])
+                _set_rollups(db, row["id"], [], extra.pop("rollups"))
+                db.execute("UPDATE users SET extra = ?, version = version + 1 WHERE id = ?",
+                           (json.dumps(extra), row["id"]))
+            db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    elif version < SCHEMA_VERSION:
+        with db:
+            legacy = db.execute(
+                "SELECT name FROM sqlite_master WHERE type='table' AND name='users'"
+            ).fetchone()
+            if legacy and version == 0:
+                # The first version only had id/first_name/last_name/email/password.
+                db.execute("ALTER TABLE users RENAME TO users_v0")
+            db.executescript(SCHEMA)
+            if legacy and version == 0:
+                for row in db.execute("SELECT * FROM users_v0").fetchall():
+                    db.execute(
+                        "INSERT OR IGNORE INTO users (email, password, first_name, last_name, profile, keys) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (row["email"].lower(), row["password"], row["first_name"], row["last_name"],
+                         json.dumps({"first_name": row["first_name"]}), json.dumps(["password", "data"]))
+                    )
+                db.execute("DROP TABLE users_v0")
+            db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    db.execute(f"PRAGMA busy_timeout = {int(BUSY_TIMEOUT * 1000)}")
+    return db
+
+# -----------------------------
+# RECORD <-> ROW MAPPING
+# -----------------------------
+# Plain list sections: table name -> mapped columns. Keys outside the mapped
+# columns survive in the row's "extra" JSON.
+LIST_SECTIONS = {
+    "tasks": ("task", "duration", "date"),
+    "notes": ("title", "content", "date"),
+    "expenses": ("amount", "description", "category", "date"),
+}
+FRIEND_STATES = ("list", "pending_sent", "pending_received")
+CHALLENGE_COLUMNS = {
+    "id": "challenge_id", "type": "type", "title": "title", "desc": "description",
+    "metric": "metric", "target": "target", "progress": "progress",
+    "reward": "reward", "expires": "expires",
+}
+ROW_SECTIONS = tuple(LIST_SECTIONS) + ("daily_logs", "friends", "challenges")
+ROLLUPS = "rollups"
+APPENDABLE = tuple(LIST_SECTIONS) + ("daily_logs",)
+USER_COLUMNS = ("password", "data", "activities", "goals")
+
+def _dumps(value):
+    return json.dumps(value) if value is not None else None
+
+def _loads(value, default=None):
+    return json.loads(value) if value is not None else default
+
+def _split(item, columns):
+    """Split a dict into (mapped column values, leftover extra JSON)."""
+    extra = {k: v for k, v in item.items() if k not in columns}
+    return [item.get(c) for c in columns], (json.dumps(extra) if extra else None)
+
+def _join(row, columns):
+    item = {c: row[c] for c in columns}
+    item.update(_loads(row["extra"], {}))
+    return item
+
+def _rollup_rows(value, parts):
+    """(path, value) rows for the rollups value at ``parts``."""
+    if not isinstance(value, dict):
+        return [(json.dumps(parts), value)]
+    if not value:
+        return [(json.dumps(parts), None)] if parts else []
+    rows = []
+    for key, item in value.items():
+        rows += _rollup_rows(item, parts + [key])
+    return rows
+
+def _set_rollups(db, uid, parts, value):
+    """Replace the rollups value at ``parts`` (a key list, [] for all of them)."""
+    if parts:
+        path = json.dumps(parts)
+        prefix = path[:-1] + ","   # paths of the keys below it start with this
+        db.execute("DELETE FROM rollups WHERE user_id = ? AND (path = ? OR substr(path, 1, ?) = ?)",
+                   (uid, path, len(prefix), prefix))
+    else:
+        db.execute("DELETE FROM rollups WHERE user_id = ?", (uid,))
+    db.executemany("INSERT INTO rollups (user_id, path, value) VALUES (?, ?, ?)",
+                   [(uid, path, item) for path, item in _rollup_rows(value, parts)])
+
+def _read_rollups(db, uid):
+    rollups = {}
+    for r in db.execute("SELECT path, value FROM rollups WHERE user_id = ? ORDER BY rowid", (uid,)):
+        *parents, key = json.loads(r["path"])
+        target = rollups
+        for part in parents:
+            target = target.setdefault(part, {})
+        if r["value"] is None:
+            target.setdefault(key, {})
+        else:
+            target[key] = r["value"]
+    return rollups
+
+# Rollup ops that run as SQL on the rollups table
+ROLLUP_UPSERT = {
+    "incr": "COALESCE(value, 0) + excluded.value",
+    "max": "MAX(COALESCE(value, excluded.value), excluded.value)",
+}
+
+def _is_rollup_op(op, path):
+    parts = path_parts(path)
+    return parts[0] == ROLLUPS and (op == "set" or op in ROLLUP_UPSERT and len(parts) > 1)
+
+
+class SQLiteStore(Store):
+    """Relational backend: one users row plus normalized child rows per record."""
+
+    partial_loads = True
+
+    def __init__(self, path=DB_PATH, legacy_file=None):
+        self.path = path
+        db = init_db(path)
+        imported = db.execute("SELECT value FROM meta WHERE key = 'legacy_import'").fetchone()
+        if not imported and legacy_file and os.path.exists(legacy_file):
+            with open(legacy_file, "r") as f:
+                users = json.load(f)
+            with transaction(db):
+                for email, record in users.items():
+                    self._write(email, record)
+                db.execute("INSERT INTO meta (key, value) VALUES ('legacy_import', ?)", (legacy_file,))
+
+    @property
+    def db(self):
+        return get_db(self.path)
+
+    # -----------------------------
+    # SINGLE RECORD ACCESS
+    # -----------------------------
+    def exists(self, email):
+        return self.db.execute("SELECT 1 FROM users WHERE email = ?", (email,)).fetchone() is not None
+
+    def stamp(self, email):
+        row = self.db.execute("SELECT version FROM users WHERE email = ?", (email,)).fetchone()
+        return row["version"] if row else None
+
+    def load(self, email, sections=None):
+        """Return the user's record, or None if the user does not exist.
+
+        ``sections`` limits which row sections (tasks, daily_logs, ...) are
+        read; the users row itself (password, data, activities, goals and any
+        extra keys) and the rollups are always included.
+        """
+        return self._read(email, (ROW_SECTIONS if sections is None else tuple(sections)) + (ROLLUPS,))
+
+    def _read(self, email, wanted):
+        db = self.db
+        user = db.execute("SELECT * FROM users WHERE email = ?", (email,)).fetchone()
+        if user is None:
+            return None
+        uid = user["id"]
+
+        values = {
+            "password": user["password"],
+            "data": _loads(user["profile"], {}),
+            "activities": _loads(user["activities"]),
+            "goals": _loads(user["goals"]),
+        }
+        values.update(_loads(user["extra"], {}))
+
+        for table, columns in LIST_SECTIONS.items():
+            if table in wanted:
+                rows = db.execute(f"SELECT * FROM {table} WHERE user_id = ? ORDER BY seq", (uid,))
+                values[table] = [_join(r, columns) for r in rows]
+
+        if "daily_logs" in wanted:
+            logs = []
+            current = None
+            rows = db.execute("SELECT * FROM daily_logs WHERE user_id = ? ORDER BY entry, id", (uid,))
+            for r in rows:
+                if current is None or current[0] != r["entry"]:
+                    current = (r["entry"], {"date": r["date"], "mood": r["mood"], "log": {}})
+                    logs.append(current[1])
+                if r["activity"] is not None:
+                    current[1]["log"][r["activity"]] = r["hours"]
+            values["daily_logs"] = logs
+
+        if "friends" in wanted:
+            friends = {state: [] for state in FRIEND_STATES}
+            rows = db.execute("SELECT friend_email, state FROM friends WHERE user_id = ? ORDER BY seq", (uid,))
+            for r in rows:
+                friends[r["state"]].append(r["friend_email"])
+            values["friends"] = friends
+
+        if "challenges" in wanted:
+            challenges = {"active": [], "completed": []}
+            rows = db.execute("SELECT * FROM challenges WHERE user_id = ? ORDER BY seq", (uid,))
+            for r in rows:
+                if r["state"] == "completed":
+                    challenges["completed"].append(r["challenge_id"])
+                else:
+                    item = {key: r[col] for key, col in CHALLENGE_COLUMNS.items()}
+                    item.update(_loads(r["extra"], {}))
+                    challenges["active"].append(item)
+            values["challenges"] = challenges
+
+        if ROLLUPS in wanted:
+            values[ROLLUPS] = _read_rollups(db, uid)
+
+        # Rebuild the record with the same keys (and key order) it was saved with
+        return {k: values[k] for k in _loads(user["keys"], []) if k in values}
+
+    def save(self, email, record):
+        """Write ``record``. Row sections and rollups missing from it (because
+        it was loaded with ``sections=``) are left untouched rather than cleared."""
+        with transaction(self.db):
+            self._write(email, record)
+
+    def save_many(self, users):
+        """Write all records in a single transaction."""
+        with transaction(self.db):
+            for email, record in users.items():
+                self._write(email, record)
+
+    def _write(self, email, record):
+        db = self.db
+        kept = ROW_SECTIONS + (ROLLUPS,)
+        extra = {k: v for k, v in record.items() if k not in USER_COLUMNS and k not in kept}
+        data = record.get("data") or {}
+        keys = list(record.keys())
+        existing = db.execute("SELECT id, keys FROM users WHERE email = ?", (email,)).fetchone()
+        if existing is not None:
+            keys += [k for k in _loads(existing["keys"], []) if k in kept and k not in record]
+        params = (
+            record.get("password"), data.get("first_name"), data.get("last_name"),
+            json.dumps(data), _dumps(record.get("activities")), _dumps(record.get("goals")),
+            json.dumps(extra), json.dumps(keys),
+        )
+        uid = existing["id"] if existing is not None else None
+        if uid is None:
+            uid = db.execute(
+                "INSERT INTO users (password, first_name, last_name, profile, activities, goals, extra, keys, email) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", params + (email,)
+            ).lastrowid
+        else:
+            db.execute(
+                "UPDATE users SET password = ?, first_name = ?, last_name = ?, profile = ?, "
+                "activities = ?, goals = ?, extra = ?, keys = ?, version = version + 1 WHERE id = ?", params + (uid,)
+            )
+
+        # Child rows are replaced wholesale; per-user indexes keep this cheap.
+        for table, columns in LIST_SECTIONS.items():
+            if table not in record:
+                continue
+            db.execute(f"DELETE FROM {table} WHERE user_id = ?", (uid,))
+            rows = []
+            for seq, item in enumerate(record.get(table, [])):
+                values, item_extra = _split(item, columns)
+                rows.append((uid, seq, *values, item_extra))
+            marks = ", ".join("?" * (len(columns) + 3))
+            db.executemany(
+                f"INSERT INTO {table} (user_id, seq, {', '.join(columns)}, extra) VALUES ({marks})", rows
+            )
+
+        if "daily_logs" in record:
+            db.execute("DELETE FROM daily_logs WHERE user_id = ?", (uid,))
+            rows = []
+            for entry_no, entry in enumerate(record["daily_logs"]):
+                log = entry.get("log") or {None: None}
+                for act, hrs in log.items():
+                    rows.append((uid, entry_no, entry["date"], entry.get("mood"), act, hrs))
+            db.executemany(
+                "INSERT INTO daily_logs (user_id, entry, date, mood, activity, hours) VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+
+        if "friends" in record:
+            db.execute("DELETE FROM friends WHERE user_id = ?", (uid,))
+            rows = []
+            for state in FRIEND_STATES:
+                for friend_email in record["friends"].get(state, []):
+                    rows.append((uid, len(rows), friend_email, state))
+            db.executemany("INSERT INTO friends (user_id, seq, friend_email, state) VALUES (?, ?, ?, ?)", rows)
+
+        if "challenges" in record:
+            db.execute("DELETE FROM challenges WHERE user_id = ?", (uid,))
+            rows = []
+            for item in record["challenges"].get("active", []):
+                values, item_extra = _split(item, tuple(CHALLENGE_COLUMNS))
+                rows.append((uid, len(rows), "active", *values, item_extra))
+            for challenge_id in record["challenges"].get("completed", []):
+                rows.append((uid, len(rows), "completed", challenge_id) + (None,) * len(CHALLENGE_COLUMNS))
+            db.executemany(
+                f"INSERT INTO challenges (user_id, seq, state, {', '.join(CHALLENGE_COLUMNS.values())}, extra) "
+                f"VALUES ({', '.join('?' * (len(CHALLENGE_COLUMNS) + 4))})", rows
+            )
+
+        if ROLLUPS in record:
+            _set_rollups(db, uid, [], record[ROLLUPS])
+
+    def apply(self, email, ops):
+        """Appends to tasks/notes/expenses/daily_logs become single INSERTs and
+        set/incr/max ops on the rollups single upserts; anything else is a
+        read-modify-write of just the sections it touches."""
+        return self.apply_many({email: ops})[email]
+
+    def apply_many(self, changes):
+        """Apply {email: ops} in a single transaction."""
+        stamps = {}
+        with transaction(self.db):
+            for email, ops in changes.items():
+                before = self.stamp(email)
+                self._apply(email, ops)
+                stamps[email] = (before, self.stamp(email))
+        return stamps
+
+    def _apply(self, email, ops):
+        db = self.db
+        if not self.exists(email):
+            self._write(email, apply_ops({}, ops))
+            return
+        slow_sections = {path_parts(path)[0] for op, path, _ in ops
+                         if not (op == "append" and path in APPENDABLE) and not _is_rollup_op(op, path)}
+        fast, slow = [], []
+        for op in ops:
+            section = path_parts(op[1])[0]
+            is_fast = (op[0] == "append" and op[1] in APPENDABLE or _is_rollup_op(op[0], op[1])) \
+                and section not in slow_sections
+            (fast if is_fast else slow).append(op)
+
+        if slow:
+            record = self._read(email, tuple(s for s in slow_sections if s in ROW_SECTIONS + (ROLLUPS,)))
+            self._write(email, apply_ops(record, slow))
+
+        if fast:
+            user = db.execute("SELECT id, keys FROM users WHERE email = ?", (email,)).fetchone()
+            keys = _loads(user["keys"], [])
+            positions = {}   # section -> next seq / entry number, so bulk appends don't re-query MAX
+            for op, path, value in fast:
+                section = path_parts(path)[0]
+                if section not in keys:
+                    keys.append(section)
+                if section == ROLLUPS:
+                    self._rollup(user["id"], op, path_parts(path)[1:], value)
+                else:
+                    self._insert(user["id"], section, value, positions)
+            db.execute("UPDATE users SET keys = ?, version = version + 1 WHERE id = ?",
+                       (json.dumps(keys), user["id"]))
+
+    def _rollup(self, uid, op, parts, value):
+        if op == "set":
+            _set_rollups(self.db, uid, parts, value)
+            return
+        self.db.execute(f"INSERT INTO rollups (user_id, path, value) VALUES (?, ?, ?) "
+                        f"ON CONFLICT (user_id, path) DO UPDATE SET value = {ROLLUP_UPSERT[op]}",
+                        (uid, json.dumps(parts), value))
+
+    def _insert(self, uid, section, item, positions):
+        db = self.db
+        if section not in positions:
+            column = "entry" if section == "daily_logs" else "seq"
+            positions[section] = db.execute(f"SELECT COALESCE(MAX({column}) + 1, 0) FROM {section} "
+                                            f"WHERE user_id = ?", (uid,)).fetchone()[0]
+        position = positions[section]
+        positions[section] += 1
+        if section == "daily_logs":
+            db.executemany(
+                "INSERT INTO daily_logs (user_id, entry, date, mood, activity, hours) VALUES (?, ?, ?, ?, ?, ?)",
+                [(uid, position, item["date"], item.get("mood"), act, hrs)
+                 for act, hrs in (item.get("log") or {None: None}).items()]
+            )
+            return
+        columns = LIST_SECTIONS[section]
+        values, item_extra = _split(item, columns)
+        db.execute(
+            f"INSERT INTO {section} (user_id, seq, {', '.join(columns)}, extra) "
+            f"VALUES ({', '.join('?' * (len(columns) + 3))})", (uid, position, *values, item_extra)
+        )
+
+    def emails(self):
+        return [r["email"] for r in self.db.execute("SELECT email FROM users")]
+
+    # -----------------------------
+    # AGGREGATE QUERIES (INDEXED)
+    # -----------------------------
+    def _range(self, email, start, end):
+        sql = "user_id = (SELECT id FROM users WHERE email = ?)"
+        params = [email]
+        if start is not None:
+            sql += " AND date >= ?"
+            params.append(start)
+        if end is not None:
+            sql += " AND date <= ?"
+            params.append(end)
+        return sql, params
+
+    def iter_entries(self, email, section, start=None, end=None):
+        """Stream one section's entries straight off the cursor."""
+        where, params = self._range(email, start, end)
+        if section == "daily_logs":
+            current = None
+            rows = self.db.execute(f"SELECT * FROM daily_logs WHERE {where} ORDER BY entry, id", params)
+            for r in rows:
+                if current is None or current[0] != r["entry"]:
+                    if current is not None:
+                        yield current[1]
+                    current = (r["entry"], {"date": r["date"], "mood": r["mood"], "log": {}})
+                if r["activity"] is not None:
+                    current[1]["log"][r["activity"]] = r["hours"]
+            if current is not None:
+                yield current[1]
+            return
+        columns = LIST_SECTIONS[section]
+        for r in self.db.execute(f"SELECT * FROM {section} WHERE {where} ORDER BY seq", params):
+            yield _join(r, columns)
+
+    def daily_totals(self, email, start=None, end=None):
+        where, params = self._range(email, start, end)
+        rows = self.db.execute(
+            f"SELECT date, SUM(hours) AS hrs FROM daily_logs WHERE {where} "
+            f"GROUP BY date HAVING SUM(hours) > 0 ORDER BY date", params
+        )
+        return {r["date"]: r["hrs"] for r in rows}
+
+    def activity_totals(self, email, start=None, end=None):
+        where, params = self._range(email, start, end)
+        rows = self.db.execute(
+            f"SELECT activity, SUM(hours) AS hrs FROM daily_logs WHERE {where} AND activity IS NOT NULL "
+            f"GROUP BY activity", params
+        )
+        return {r["activity"]: r["hrs"] for r in rows}
+
+    def log_dates(self, email):
+        where, params = self._range(email, None, None)
+        rows = self.db.execute(f"SELECT DISTINCT date FROM daily_logs WHERE {where} ORDER BY date DESC", params)
+        return [r["date"] for r in rows]
+
+    def log_stats(self, email):
+        where, params = self._range(email, None, None)
+        stats = {"logs": 0, "best_day": 0, "hours": 0, "moods": {}}
+        rows = self.db.execute(
+            f"SELECT mood, SUM(COALESCE(hours, 0)) AS total FROM daily_logs WHERE {where} GROUP BY entry", params
         )
-    """)
-    db.commit()
-    db.close()
+        for r in rows:
+            stats["logs"] += 1
+            stats["hours"] += r["total"]
+            stats["best_day"] = max(stats["best_day"], r["total"])
+            if r["mood"]:
+                stats["moods"][r["mood"]] = stats["moods"].get(r["mood"], 0) + 1
+        return stats
+
+    def task_hours_by_date(self, email):
+        where, params = self._range(email, None, None)
+        rows = self.db.execute(f"SELECT date, SUM(duration) AS hrs FROM tasks WHERE {where} GROUP BY date", params)
+        return {r["date"]: r["hrs"] for r in rows}
+
+    def leaderboard_stats(self, emails=None):
+        """Return per-user leaderboard inputs for every user (or just ``emails``)
+        in a few grouped queries."""
+        db = self.db
+        stats = {}
+        users, params = "users", ()
+        if emails is not None:
+            users = "(SELECT * FROM users WHERE email IN (SELECT value FROM json_each(?)))"
+            params = (json.dumps(list(emails)),)
+        for r in db.execute(
+            "SELECT id, email, profile, json_extract(extra, '$.streak') AS streak, "
+            f"json_extract(extra, '$.achievements') AS achievements FROM {users}", params
+        ):
+            achievements = _loads(r["achievements"])
+            stats[r["id"]] = {"email": r["email"], "data": _loads(r["profile"], {}), "task_hours": 0,
+                              "logs": 0, "best_day": 0, "streak_state": _loads(r["streak"]), "dates": [],
+                              "badges": len(achievements) if achievements is not None else None}
+        if not stats:
+            return []
+        # Per-user queries are limited to the users found above
+        only, ids = "", ()
+        if emails is not None:
+            only, ids = "WHERE user_id IN (SELECT value FROM json_each(?))", (json.dumps(list(stats)),)
+        for r in db.execute(f"SELECT user_id, SUM(duration) AS hrs FROM tasks {only} GROUP BY user_id", ids):
+            stats[r["user_id"]]["task_hours"] = r["hrs"]
+        for r in db.execute(
+            "SELECT user_id, COUNT(*) AS logs, MAX(total) AS best FROM "
+            f"(SELECT user_id, SUM(COALESCE(hours, 0)) AS total FROM daily_logs {only} GROUP BY user_id, entry) "
+            "GROUP BY user_id", ids
+        ):
+            stats[r["user_id"]]["logs"] = r["logs"]
+            stats[r["user_id"]]["best_day"] = r["best"]
+        # Only users without a maintained streak state need their log dates
+        for r in db.execute(
+            f"SELECT DISTINCT l.user_id, l.date FROM daily_logs l JOIN {users} u ON u.id = l.user_id "
+            "WHERE json_extract(u.extra, '$.streak') IS NULL ORDER BY l.user_id, l.date DESC", params
+        ):
+            stats[r["user_id"]]["dates"].append(r["date"])
+        return list(stats.values())
+
+
+
+# -----------------------------
+# H2H CHALLENGES
+# -----------------------------
+# Canonical challenge rows (see h2hstore.py), in the same database file.
+# The per-user lists are answered by the two (player, status) indexes.
+H2H_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS h2h_challenges (
+        id TEXT PRIMARY KEY,
+        challenger TEXT NOT NULL,
+        opponent TEXT NOT NULL,
+        status TEXT NOT NULL,
+        data TEXT NOT NULL   -- the whole challenge dict
+    );
+    CREATE INDEX IF NOT EXISTS idx_h2h_challenger ON h2h_challenges(challenger, status);
+    CREATE INDEX IF NOT EXISTS idx_h2h_opponent ON h2h_challenges(opponent, status);
+"""
+
+H2H_BUCKET_WHERE = {
+    "pending": ("opponent = ? AND status = 'pending'", 1),
+    "active": ("(challenger = ? AND status IN ('pending', 'active')) OR (opponent = ? AND status = 'active')", 2),
+    "completed": ("(challenger = ? OR opponent = ?) AND status = 'completed'", 2),
+}
+
+
+class SQLiteChallengeStore(ChallengeStore):
+    """SQLite backend for H2H challenges: one row per challenge."""
+
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self.db.executescript(H2H_SCHEMA)
+
+    @property
+    def db(self):
+        return get_db(self.path)
+
+    def get(self, challenge_id):
+        row = self.db.execute("SELECT data FROM h2h_challenges WHERE id = ?", (challenge_id,)).fetchone()
+        return _loads(row["data"]) if row else None
+
+    def get_many(self, challenge_ids):
+        rows = self.db.execute("SELECT id, data FROM h2h_challenges WHERE id IN (SELECT value FROM json_each(?))",
+                               (json.dumps(list(challenge_ids)),))
+        return {r["id"]: _loads(r["data"]) for r in rows}
+
+    def ids(self, email, bucket):
+        where, n = H2H_BUCKET_WHERE[bucket]
+        return [r["id"] for r in self.db.execute(
+            f"SELECT id FROM h2h_challenges WHERE {where} ORDER BY rowid", (email,) * n)]
+
+    def for_user(self, email):
+        """All three lists from one indexed query."""
+        lists = {"active": [], "pending": [], "completed": []}
+        for r in self.db.execute(
+            "SELECT rowid AS n, data FROM h2h_challenges WHERE challenger = ? AND status != 'declined' "
+            "UNION ALL SELECT rowid AS n, data FROM h2h_challenges WHERE opponent = ? AND challenger != ? "
+            "AND status != 'declined' ORDER BY n", (email, email, email)
+        ):
+            challenge = _loads(r["data"])
+            for who, bucket in user_buckets(challenge):
+                if who == email:
+                    lists[bucket].append(challenge)
+                    break
+        return lists
+
+    def open_challenges(self):
+        return [(r["id"], r["end_date"]) for r in self.db.execute(
+            "SELECT id, json_extract(data, '$.end_date') AS end_date FROM h2h_challenges "
+            "WHERE status IN ('pending', 'active')")]
+
+    def _row(self, challenge):
+        return (challenge["id"], challenge["challenger"], challenge["opponent"],
+                challenge.get("status", "pending"), json.dumps(challenge))
+
+    def create(self, challenge):
+        with transaction(self.db):
+            cur = self.db.execute("INSERT OR IGNORE INTO h2h_challenges (id, challenger, opponent, status, data) "
+                                  "VALUES (?, ?, ?, ?, ?)", self._row(challenge))
+        return cur.rowcount == 1
+
+    def update(self, challenge_id, fields, check=None):
+        # The write lock is taken before reading, so check() sees what gets overwritten
+        with transaction(self.db) as db:
+            row = db.execute("SELECT data FROM h2h_challenges WHERE id = ?", (challenge_id,)).fetchone()
+            current = _loads(row["data"]) if row else None
+            changes = None
+            if current is not None and (check is None or check(dict(current))):
+                changes = fields(dict(current)) if callable(fields) else fields
+            if changes is None:
+                return None
+            challenge = {**current, **changes, "id": challenge_id}
+            db.execute("UPDATE h2h_challenges SET challenger = ?, opponent = ?, status = ?, data = ? WHERE id = ?",
+                       self._row(challenge)[1:] + (challenge_id,))
+            return challenge
+
+    def needs_import(self):
+        return self.db.execute("SELECT 1 FROM meta WHERE key = 'h2h_import'").fetchone() is None
+
+    def _put_many(self, challenges):
+        with transaction(self.db):
+            self.db.executemany("INSERT OR REPLACE INTO h2h_challenges (id, challenger, opponent, status, data) "
+                                "VALUES (?, ?, ?, ?, ?)", [self._row(c) for c in challenges])
+            self.db.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('h2h_import', 'done')")
 
-init_db()
+    def stats(self):
+        return {"challenges": self.db.execute("SELECT COUNT(*) FROM h2h_challenges").fetchone()[0]}
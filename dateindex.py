@@ -0,0 +1,89 @@
+from bisect import bisect_left, bisect_right
+from datetime import date
+
+from stats import parse_day
+
+# -----------------------------
+# DATE INDEX
+# -----------------------------
+# Entries of a dated section (daily_logs, tasks) ordered by day. Each date
+# string is parsed once, into an ordinal day number, when the entry enters
+# the index; "today", "this week" or "the last 30 days" are then two
+# bisects and a slice instead of a strptime per entry.
+#
+# storage.CachedStore keeps one per cached record and section and adds to
+# it as entries are appended (see CachedStore.date_index).
+
+
+def _ordinal(day):
+    """Ordinal day number for a date or a "YYYY-MM-DD" string (None if malformed)."""
+    if isinstance(day, str):
+        day = parse_day(day)
+    return day.toordinal() if day is not None else None
+
+
+class DateIndex:
+    """Date-ordered view of a list of entries that each have a "date" key."""
+
+    def __init__(self, entries=()):
+        self.by_date = {}   # "YYYY-MM-DD" -> [entries]
+        pairs = []
+        for entry in entries:
+            day = _ordinal(entry.get("date"))
+            if day is not None:
+                pairs.append((day, entry))
+                self.by_date.setdefault(entry["date"], []).append(entry)
+        pairs.sort(key=lambda pair: pair[0])   # stable: same-day entries keep their order
+        self.ordinals = [day for day, _ in pairs]   # sorted, parallel to self.entries
+        self.entries = [entry for _, entry in pairs]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def copy(self):
+        """A copy that add() can change without affecting this index."""
+        index = DateIndex()
+        index.by_date = dict(self.by_date)
+        index.ordinals = list(self.ordinals)
+        index.entries = list(self.entries)
+        return index
+
+    def add(self, entry):
+        day = _ordinal(entry.get("date"))
+        if day is None:
+            return
+        i = bisect_right(self.ordinals, day)
+        self.ordinals.insert(i, day)
+        self.entries.insert(i, entry)
+        # A new list, so copies sharing the old one are unaffected
+        self.by_date[entry["date"]] = self.by_date.get(entry["date"], []) + [entry]
+
+    def on(self, day):
+        """Entries dated ``day``."""
+        return self.by_date.get(str(day), [])
+
+    def between(self, start=None, end=None):
+        """Entries dated ``start`` .. ``end`` inclusive (dates or ISO
+        strings; None leaves that end open), in date order."""
+        lo = 0 if start is None else bisect_left(self.ordinals, _ordinal(start))
+        hi = len(self.ordinals) if end is None else bisect_right(self.ordinals, _ordinal(end))
+        return self.entries[lo:hi]
+
+    def streak(self, today=None):
+        """Consecutive logged days ending at the latest one, or 0 if that
+        is older than yesterday (same rule as app.calculate_streak)."""
+        if not self.ordinals:
+            return 0
+        today = (today or date.today()).toordinal()
+        last = self.ordinals[-1]
+        if last < today - 1:
+            return 0
+        run = 1
+        for day in reversed(self.ordinals):
+            if day == last:
+                continue
+            if day != last - 1:
+                break
+            run += 1
+            last = day
+        return run
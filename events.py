@@ -0,0 +1,110 @@
+import itertools
+import json
+import queue
+import threading
+
+# -----------------------------
+# LIVE EVENTS (SERVER-SENT EVENTS)
+# -----------------------------
+# In-process pub/sub for the small notifications pages show live: friend
+# requests, H2H invites and acceptances, friends coming online. Each open
+# /events stream subscribes a bounded queue for its user; publish() drops
+# the oldest queued event for a stream that isn't keeping up rather than
+# blocking the request that published it.
+#
+# An open stream is mostly idle: it waits on its queue and sends a comment
+# line every ``heartbeat`` seconds (which is also how a closed connection
+# is noticed). In production the app runs on gevent workers (see
+# gunicorn.conf.py), where that wait parks a greenlet, not a thread, so a
+# worker holds thousands of idle streams (benchmarks/bench_sse.py). Only
+# the threaded dev server (python app.py) still pins a thread per stream.
+#
+# A user can have at most ``max_streams_per_user`` streams open (one per
+# tab); /events answers 429 beyond that, and that tab just goes without
+# live updates (EventSource does not retry after an error status).
+#
+# Events only reach streams held by the worker that published them; with
+# several workers, run one (gevent) worker or put a broker in front.
+
+
+def format_event(event_id, event, data):
+    """One SSE message."""
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+class EventBus:
+    """Per-user fan-out of events to the user's open streams."""
+
+    def __init__(self, max_queue=100, max_streams_per_user=8, heartbeat=15):
+        self.max_queue = max_queue
+        self.max_streams_per_user = max_streams_per_user
+        self.heartbeat = heartbeat
+        self._streams = {}   # email -> set of queues
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.published = 0
+        self.dropped = 0
+
+    def has_subscribers(self, email):
+        return bool(self._streams.get(email))
+
+    def subscribe(self, email):
+        """A new queue for one of ``email``'s streams, or None at the limit."""
+        with self._lock:
+            streams = self._streams.setdefault(email, set())
+            if len(streams) >= self.max_streams_per_user:
+                return None
+            q = queue.Queue(maxsize=self.max_queue)
+            streams.add(q)
+            return q
+
+    def unsubscribe(self, email, q):
+        with self._lock:
+            streams = self._streams.get(email)
+            if streams is not None:
+                streams.discard(q)
+                if not streams:
+                    del self._streams[email]
+
+    def publish(self, email, event, data):
+        """Queue ``event`` for every open stream of ``email`` (no-op if none)."""
+        with self._lock:
+            streams = list(self._streams.get(email, ()))
+            if not streams:
+                return
+            message = (next(self._ids), event, data)
+            self.published += 1
+        for q in streams:
+            while True:
+                try:
+                    q.put_nowait(message)
+                    break
+                except queue.Full:
+                    try:
+                        q.get_nowait()
+                        self.dropped += 1
+                    except queue.Empty:
+                        pass
+
+    def stream(self, email, q):
+        """SSE body for a queue from subscribe(); unsubscribes when closed."""
+        try:
+            yield "retry: 5000\n: connected\n\n"
+            while True:
+                try:
+                    message = q.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    yield ": ping\n\n"
+                    continue
+                yield format_event(*message)
+        finally:
+            self.unsubscribe(email, q)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "users": len(self._streams),
+                "streams": sum(len(s) for s in self._streams.values()),
+                "published": self.published,
+                "dropped": self.dropped,
+            }
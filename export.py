@@ -0,0 +1,99 @@
+import csv
+import io
+import json
+import zipfile
+
+# -----------------------------
+# STREAMING EXPORT
+# -----------------------------
+# Generators that turn the store's entry iterators (Store.iter_entries)
+# into download bodies piece by piece, so an export starts sending right
+# away and memory stays flat however long the history is.
+#
+#   json     {"email": ..., "profile": {...}, "tasks": [...], ...}   (compact)
+#   ndjson   one {"section": "tasks", ...entry} object per line
+#   csv      one section as CSV
+#   zip      one CSV per section
+
+SECTIONS = ("tasks", "daily_logs", "notes", "expenses")
+HEADER_KEYS = ("data", "activities", "goals")   # record keys a JSON export starts with
+
+CSV_COLUMNS = {
+    "tasks": ("date", "task", "duration"),
+    "daily_logs": ("date", "mood", "activity", "hours"),   # one row per activity
+    "notes": ("date", "title", "content"),
+    "expenses": ("date", "amount", "category", "description"),
+}
+
+_dumps = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False).encode
+
+
+def csv_rows(section, entries):
+    """Header row, then one row per entry (per activity for daily logs)."""
+    yield CSV_COLUMNS[section]
+    for item in entries:
+        if section == "daily_logs":
+            for act, hrs in (item.get("log") or {None: None}).items():
+                yield item.get("date"), item.get("mood"), act, hrs
+        else:
+            yield tuple(item.get(column) for column in CSV_COLUMNS[section])
+
+
+def stream_csv(section, entries, batch=500):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for n, row in enumerate(csv_rows(section, entries), 1):
+        writer.writerow(row)
+        if n % batch == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def stream_ndjson(sections):
+    """``sections`` is [(name, entries)]."""
+    for name, entries in sections:
+        for item in entries:
+            yield _dumps({"section": name, **item}) + "\n"
+
+
+def stream_json(header, sections):
+    """``header`` holds the top-level keys written before the sections."""
+    yield _dumps(header)[:-1]
+    for i, (name, entries) in enumerate(sections):
+        yield f'{"," if header or i else ""}{_dumps(name)}:['
+        for j, item in enumerate(entries):
+            yield ("," if j else "") + _dumps(item)
+        yield "]"
+    yield "}"
+
+
+class _Drain(io.RawIOBase):
+    """Write-only sink for ZipFile whose contents are taken as they arrive."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def take(self):
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+def stream_zip(sections, prefix="smartroutine"):
+    """One CSV per section in a zip written on the fly (no seeking needed)."""
+    sink = _Drain()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, entries in sections:
+            with archive.open(f"{prefix}_{name}.csv", "w") as member:
+                for chunk in stream_csv(name, entries):
+                    member.write(chunk.encode("utf-8"))
+                    yield sink.take()
+    yield sink.take()
@@ -0,0 +1,102 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+
+# -----------------------------
+# FRIEND SUMMARIES
+# -----------------------------
+# The small cards shown for other users on the friends and H2H pages (name,
+# avatar, streak, hours, badges). Cards missing from the cache are built
+# for the whole batch from one storage call (Store.leaderboard_stats with
+# a list of emails) and then kept, least recently used evicted beyond
+# ``max_entries``.
+#
+# The app drops a user's card whenever their record is written (see
+# CachedStore.subscribe); last-seen updates only patch it. A batch being
+# built while one of its users is written doesn't keep that user's card
+# (the others are kept). Streaks depend
+# on the date, so cards built on an earlier day are rebuilt, and ``ttl``
+# bounds how stale a card can get from writes made by other workers.
+
+
+class FriendSummaries:
+    """Thread-safe LRU of per-user summary cards, filled in batches."""
+
+    def __init__(self, load_rows, make_entry, max_entries=10000, ttl=300, clock=time.monotonic):
+        """``load_rows(emails)`` returns the stats rows (each with an "email"
+        key) of those users that exist; ``make_entry(row)`` turns one into
+        a card."""
+        self._load_rows = load_rows
+        self._make_entry = make_entry
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._cards = OrderedDict()   # email -> (day, expires_at, card)
+        self._seq = 0                 # bumped by every invalidate()
+        self._invalidated = {}        # email -> seq of its last invalidate() during a build
+        self._building = 0            # batches being built right now
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, emails):
+        """{email: card} for the given emails that exist (cards are copies)."""
+        today, now = date.today(), self._clock()
+        cards, missing = {}, []
+        with self._lock:
+            for email in dict.fromkeys(emails):
+                cached = self._cards.get(email)
+                if cached is not None and cached[0] == today and cached[1] > now:
+                    self._cards.move_to_end(email)
+                    cards[email] = dict(cached[2])
+                    self.hits += 1
+                else:
+                    missing.append(email)
+                    self.misses += 1
+            if not missing:
+                return cards
+            started = self._seq
+            self._building += 1
+
+        built = {}
+        try:
+            built = {row["email"]: self._make_entry(row) for row in self._load_rows(missing)}
+        finally:
+            with self._lock:
+                self._building -= 1
+                # Only keep the cards of users not written while they were being built
+                for email, card in built.items():
+                    if self._invalidated.get(email, 0) <= started:
+                        self._cards[email] = (today, now + self.ttl, card)
+                        self._cards.move_to_end(email)
+                if not self._building:
+                    self._invalidated.clear()
+                while len(self._cards) > self.max_entries:
+                    self._cards.popitem(last=False)
+        cards.update((email, dict(card)) for email, card in built.items())
+        return cards
+
+    def invalidate(self, email):
+        with self._lock:
+            self._cards.pop(email, None)
+            self._seq += 1
+            if self._building:
+                self._invalidated[email] = self._seq
+
+    def patch(self, email, **fields):
+        """Update fields of a cached card in place (no-op if not cached)."""
+        with self._lock:
+            cached = self._cards.get(email)
+            if cached is not None:
+                cached[2].update(fields)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "entries": len(self._cards),
+            }
@@ -0,0 +1,38 @@
+import os
+
+# -----------------------------
+# GUNICORN SETTINGS
+# -----------------------------
+# Picked up automatically when gunicorn is started from this directory:
+#
+#   gunicorn app:app
+#
+# gevent workers serve every request in a greenlet, so an idle /events
+# stream or chess long poll waiting for its next message costs a few KB of
+# memory and a file descriptor instead of a thread. gunicorn monkey-patches
+# the standard library before importing the app, so the locks, conditions
+# and queues in events.py, chessgames.py etc. become cooperative and need
+# no changes. Raise the open-file limit (ulimit -n) to at least
+# ``worker_connections``.
+#
+# Nothing a request does may block the worker's one OS thread, or every
+# stream of the process stalls with it:
+#   - journal fsyncs and cross-process flocks run on gevent's native
+#     threadpool (blocking.py);
+#   - SQLite writers wait for another connection's lock with a cooperative
+#     sleep, not SQLite's busy handler (database.transaction);
+#   - chess moves are checked against one position's legal moves; engine
+#     searches run in a process pool (chessengine.py).
+#
+# Live events, presence and the record cache are per process (see
+# events.py), so the default is one worker; more workers are fine for
+# everything except events reaching streams held by another worker.
+
+bind = os.getenv("SMARTROUTINE_BIND", "0.0.0.0:8000")
+worker_class = "gevent"
+workers = int(os.getenv("SMARTROUTINE_WORKERS", "1"))
+worker_connections = int(os.getenv("SMARTROUTINE_WORKER_CONNECTIONS", "10000"))
+# Streams send a heartbeat every SMARTROUTINE_EVENTS_HEARTBEAT seconds, so
+# only idle keep-alive sockets between requests need a timeout
+keepalive = 75
+graceful_timeout = 10
@@ -0,0 +1,280 @@
+import json
+import os
+import threading
+
+from blocking import call_blocking
+
+try:
+    import fcntl
+except ImportError:   # Windows: fall back to in-process locking only
+    fcntl = None
+
+# -----------------------------
+# H2H CHALLENGES
+# -----------------------------
+# One canonical copy of every head-to-head challenge, keyed by its id, kept
+# outside the user records. Accepting, declining or finishing a challenge
+# is one write to that copy, so the two players can never see different
+# versions of it.
+#
+# The lists each user sees are secondary indexes derived from the
+# challenge's players and status (see user_buckets):
+#
+#   pending     invites the user received and hasn't answered
+#   active      accepted challenges, plus invites the user sent
+#   completed   finished challenges
+#
+# Declined and expired challenges are kept, but listed nowhere.
+
+BUCKETS = ("active", "pending", "completed")
+STATUS_RANK = {"pending": 0, "declined": 1, "expired": 1, "active": 1, "completed": 2}
+
+
+def user_buckets(challenge):
+    """[(email, bucket)] for every user list ``challenge`` belongs in."""
+    status = challenge.get("status")
+    challenger, opponent = challenge["challenger"], challenge["opponent"]
+    if status == "pending":
+        return [(challenger, "active"), (opponent, "pending")]
+    if status in ("active", "completed"):
+        return [(challenger, status), (opponent, status)]
+    return []
+
+
+def merge_copies(users):
+    """One challenge per id from the per-user ``h2h_challenges`` lists of
+    older records, keeping the furthest-along copy of each."""
+    merged = {}
+    for record in users.values():
+        lists = record.get("h2h_challenges") or {}
+        for bucket in BUCKETS:
+            for challenge in lists.get(bucket, []):
+                if not isinstance(challenge, dict) or "id" not in challenge:
+                    continue
+                seen = merged.get(challenge["id"])
+                if seen is None or STATUS_RANK.get(challenge.get("status"), 0) > STATUS_RANK.get(seen.get("status"), 0):
+                    merged[challenge["id"]] = dict(challenge)
+    return list(merged.values())
+
+
+class ChallengeStore:
+    """Challenges by id, plus the per-user lists. Backends implement get,
+    ids, create, update and _put_many."""
+
+    def get(self, challenge_id):
+        """A copy of the challenge, or None."""
+        raise NotImplementedError
+
+    def get_many(self, challenge_ids):
+        """{id: challenge} for the ids that exist."""
+        found = {}
+        for challenge_id in challenge_ids:
+            challenge = self.get(challenge_id)
+            if challenge is not None:
+                found[challenge_id] = challenge
+        return found
+
+    def ids(self, email, bucket):
+        """Ids in one of ``email``'s lists, oldest first."""
+        raise NotImplementedError
+
+    def for_user(self, email):
+        """{bucket: [challenge, ...]} for all of ``email``'s lists."""
+        lists = {}
+        for bucket in BUCKETS:
+            ids = self.ids(email, bucket)
+            found = self.get_many(ids)
+            lists[bucket] = [found[i] for i in ids if i in found]
+        return lists
+
+    def open_challenges(self):
+        """[(id, end_date)] of every pending or active challenge."""
+        raise NotImplementedError
+
+    def create(self, challenge):
+        """Add a new challenge in one write. False if the id is taken."""
+        raise NotImplementedError
+
+    def update(self, challenge_id, fields, check=None):
+        """Set ``fields`` on the challenge in one write, if it exists and
+        ``check(challenge)`` passes (checked under the write lock).
+        ``fields`` may also be a function of the current challenge (for
+        values computed from it) returning the fields, or None to leave
+        it as it is. Returns the updated copy, or None."""
+        raise NotImplementedError
+
+    def _put_many(self, challenges):
+        """Insert or replace whole challenges (migration)."""
+        raise NotImplementedError
+
+    def needs_import(self):
+        """True until import_records() has run once."""
+        raise NotImplementedError
+
+    def import_records(self, users):
+        """Adopt the challenges copied into older user records ({email:
+        record}); ids already in the store are left alone. Returns how many
+        were added."""
+        challenges = [c for c in merge_copies(users) if self.get(c["id"]) is None]
+        self._put_many(challenges)   # also marks the import done
+        return len(challenges)
+
+
+class ChallengeLog(ChallengeStore):
+    """JSON backend: an append-only log of whole challenges, one per line
+    (the last line for an id wins), replayed into memory.
+
+    Every read first replays whatever other processes appended (the file
+    size is checked, as in chessgames.py); writers hold an exclusive lock
+    on the log while they check and append. Once the log holds more than
+    ``compact_lines`` superseded lines it is rewritten with the live
+    challenges only.
+    """
+
+    def __init__(self, path, fsync=True, compact_lines=10000):
+        self.path = path
+        self.fsync = fsync
+        self.compact_lines = compact_lines
+        self._challenges = {}   # id -> challenge
+        self._index = {}        # (email, bucket) -> {id: None} (insertion-ordered set)
+        self._offset = 0
+        self._inode = None
+        self._lines = 0
+        self._lock = threading.RLock()
+
+    def _reset(self):
+        self._challenges, self._index = {}, {}
+        self._offset, self._lines = 0, 0
+
+    def _replay(self, challenge):
+        old = self._challenges.get(challenge["id"])
+        keys = user_buckets(challenge)
+        if old is not None:
+            for key in user_buckets(old):
+                if key not in keys:
+                    self._index.get(key, {}).pop(old["id"], None)
+        self._challenges[challenge["id"]] = challenge
+        for key in keys:
+            # setdefault: a challenge that stays in a list keeps its place
+            self._index.setdefault(key, {}).setdefault(challenge["id"], None)
+        self._lines += 1
+
+    def _sync(self):
+        """Replay lines appended since the last read (callers hold self._lock)."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self._reset()
+            self._inode = None
+            return
+        if st.st_ino != self._inode:
+            self._reset()   # first read, or the log was compacted by another process
+            self._inode = st.st_ino
+        if st.st_size == self._offset:
+            return
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1   # a torn last line is picked up next time
+        for line in data[:end].splitlines():
+            if line.strip():
+                try:
+                    self._replay(json.loads(line))
+                except (ValueError, KeyError, TypeError):
+                    continue
+        self._offset += end
+
+    def _write(self, build):
+        """Under the log's lock: catch up, ``build()`` -> challenges to
+        append (or None for nothing), append and replay them."""
+        with self._lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            while True:
+                f = open(self.path, "a+b")
+                if fcntl is not None:
+                    call_blocking(fcntl.flock, f, fcntl.LOCK_EX)
+                # Compaction may have swapped the file while we waited for the lock
+                if os.fstat(f.fileno()).st_ino == os.stat(self.path).st_ino:
+                    break
+                f.close()
+            try:
+                self._sync()
+                challenges = build()
+                if challenges:
+                    data = b"".join((json.dumps(c) + "\n").encode("utf-8") for c in challenges)
+                    f.write(data)
+                    f.flush()
+                    if self.fsync:
+                        call_blocking(os.fsync, f.fileno())
+                    for challenge in challenges:
+                        self._replay(challenge)
+                    self._offset += len(data)
+                    if self._lines - len(self._challenges) > self.compact_lines:
+                        self._compact()
+                return challenges
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+                f.close()
+
+    def _compact(self):
+        # Callers hold the log's lock
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        data = b"".join((json.dumps(c) + "\n").encode("utf-8") for c in self._challenges.values())
+        with open(tmp, "wb") as f:
+            f.write(data)
+            f.flush()
+            if self.fsync:
+                call_blocking(os.fsync, f.fileno())
+        os.replace(tmp, self.path)
+        self._inode = os.stat(self.path).st_ino
+        self._offset, self._lines = len(data), len(self._challenges)
+
+    def needs_import(self):
+        return not os.path.exists(self.path)
+
+    def get(self, challenge_id):
+        with self._lock:
+            self._sync()
+            challenge = self._challenges.get(challenge_id)
+            return dict(challenge) if challenge is not None else None
+
+    def get_many(self, challenge_ids):
+        with self._lock:
+            self._sync()
+            return {i: dict(self._challenges[i]) for i in challenge_ids if i in self._challenges}
+
+    def ids(self, email, bucket):
+        with self._lock:
+            self._sync()
+            return list(self._index.get((email, bucket), ()))
+
+    def open_challenges(self):
+        with self._lock:
+            self._sync()
+            return [(c["id"], c.get("end_date")) for c in self._challenges.values()
+                    if c.get("status") in ("pending", "active")]
+
+    def create(self, challenge):
+        challenge = dict(challenge)
+        return bool(self._write(lambda: None if challenge["id"] in self._challenges else [challenge]))
+
+    def update(self, challenge_id, fields, check=None):
+        def build():
+            current = self._challenges.get(challenge_id)
+            if current is None or (check is not None and not check(dict(current))):
+                return None
+            changes = fields(dict(current)) if callable(fields) else fields
+            if changes is None:
+                return None
+            return [{**current, **changes, "id": challenge_id}]
+
+        written = self._write(build)
+        return dict(written[0]) if written else None
+
+    def _put_many(self, challenges):
+        self._write(lambda: [dict(c) for c in challenges])
+
+    def stats(self):
+        with self._lock:
+            return {"challenges": len(self._challenges), "log_lines": self._lines}
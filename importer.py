@@ -0,0 +1,192 @@
+import csv
+import json
+import math
+from itertools import groupby
+
+from achievements import build_achievements
+from export import CSV_COLUMNS
+from stats import build_rollups, build_streak, parse_day
+
+# -----------------------------
+# BULK IMPORT
+# -----------------------------
+# Tasks, daily logs, notes and expenses from CSV or NDJSON, in the layouts
+# export.py writes (so an export imports back unchanged):
+#
+#   ndjson   {"section": "tasks", "task": ..., "duration": ..., "date": ...}
+#   csv      one section per file, header row first; a "section" column
+#            may name the section per row instead. Daily logs are either
+#            long (date, mood, activity, hours; consecutive rows of one
+#            date form one entry) or wide (date, mood, <activity>...).
+#
+# Rows are parsed and validated one at a time. Entries already in the
+# record (or earlier in the file) are skipped as duplicates: a daily log
+# per date, tasks, notes and expenses by all their fields. import_ops()
+# returns every accepted entry plus the recomputed streak / rollups /
+# badges as one list of ops, so the whole import is a single storage write.
+
+SECTIONS = ("tasks", "daily_logs", "notes", "expenses")
+MAX_ROWS = 100000
+MAX_ERRORS = 50   # rejected rows reported individually; the rest are counted
+
+
+def _number(value, integer=False):
+    """Non-negative number from a CSV cell or JSON value, or ValueError."""
+    if isinstance(value, bool):
+        raise ValueError(value)
+    number = float(value) if isinstance(value, str) else value
+    if not isinstance(number, (int, float)) or not math.isfinite(number) or number < 0:
+        raise ValueError(value)
+    if float(number).is_integer():
+        return int(number)
+    if integer:
+        raise ValueError(value)
+    return number
+
+
+def _text(value):
+    return value.strip() if isinstance(value, str) else ("" if value is None else str(value))
+
+
+def clean_entry(section, raw):
+    """Validated, normalized entry for ``section``. Raises ValueError."""
+    if section not in SECTIONS:
+        raise ValueError(f"section must be one of {', '.join(SECTIONS)}")
+    day = parse_day(_text(raw.get("date")))
+    if day is None:
+        raise ValueError("date must be YYYY-MM-DD")
+    if section == "tasks":
+        task = _text(raw.get("task"))
+        if not task:
+            raise ValueError("task is required")
+        try:
+            duration = _number(raw.get("duration"), integer=True)
+        except (TypeError, ValueError):
+            raise ValueError("duration must be a whole number of hours")
+        return {"task": task, "duration": duration, "date": str(day)}
+    if section == "daily_logs":
+        log = raw.get("log")
+        if not isinstance(log, dict):
+            raise ValueError("log must map activities to hours")
+        try:
+            log = {_text(act): _number(hrs if hrs != "" else 0) for act, hrs in log.items() if _text(act)}
+        except (TypeError, ValueError):
+            raise ValueError("hours must be non-negative numbers")
+        return {"date": str(day), "mood": _text(raw.get("mood")) or None, "log": log}
+    if section == "notes":
+        title, content = _text(raw.get("title")), _text(raw.get("content"))
+        if not (title or content):
+            raise ValueError("title or content is required")
+        return {"title": title, "content": content, "date": str(day)}
+    try:
+        amount = float(raw.get("amount"))
+    except (TypeError, ValueError):
+        amount = math.nan
+    if not math.isfinite(amount):
+        raise ValueError("amount must be a number")
+    return {"amount": amount, "description": _text(raw.get("description")),
+            "category": _text(raw.get("category")), "date": str(day)}
+
+
+def _dedupe_key(section, item):
+    if section == "daily_logs":
+        return item["date"]
+    return tuple(item.get(column) for column in CSV_COLUMNS[section])
+
+
+# -----------------------------
+# READERS
+# -----------------------------
+# Each yields (line number, section, raw entry dict) or, for a line that
+# can't be read at all, (line number, None, error message).
+
+def read_ndjson(lines, section=None):
+    for n, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            raw = json.loads(line)
+        except ValueError:
+            yield n, None, "not valid JSON"
+            continue
+        if not isinstance(raw, dict):
+            yield n, None, "expected a JSON object"
+            continue
+        yield n, raw.pop("section", None) or section, raw
+
+
+def read_csv(lines, section=None):
+    reader = csv.DictReader(lines)
+    fields = [f.strip() for f in reader.fieldnames or ()]
+    reader.fieldnames = fields
+    rows = ((reader.line_num, row.pop("section", None) or section, row) for row in reader)
+
+    def log_group(item):
+        n, sec, row = item
+        return (sec, row.get("date"), row.get("mood")) if sec == "daily_logs" else (n,)
+
+    for _, group in groupby(rows, key=log_group):
+        group = list(group)
+        n, sec, row = group[0]
+        if sec != "daily_logs":
+            yield n, sec, row
+        elif "activity" in fields:
+            yield n, sec, {"date": row.get("date"), "mood": row.get("mood"),
+                           "log": {r.get("activity"): r.get("hours") for _, _, r in group}}
+        else:
+            for n, sec, row in group:
+                yield n, sec, {"date": row.get("date"), "mood": row.get("mood"),
+                               "log": {k: v for k, v in row.items() if k not in ("date", "mood")}}
+
+
+READERS = {"csv": read_csv, "ndjson": read_ndjson}
+
+
+def import_ops(record, rows, max_rows=MAX_ROWS):
+    """(ops, summary) for importing ``rows`` (a reader's output) into ``record``."""
+    seen = {section: {_dedupe_key(section, item) for item in record.get(section, [])} for section in SECTIONS}
+    added = {section: [] for section in SECTIONS}
+    summary = {"accepted": dict.fromkeys(SECTIONS, 0), "duplicates": 0, "rejected": 0, "errors": []}
+
+    def reject(n, message):
+        summary["rejected"] += 1
+        if len(summary["errors"]) < MAX_ERRORS:
+            summary["errors"].append({"line": n, "error": message})
+
+    for count, (n, section, raw) in enumerate(rows, 1):
+        if count > max_rows:
+            reject(n, f"import is limited to {max_rows} rows")
+            break
+        if section is None and isinstance(raw, str):
+            reject(n, raw)
+            continue
+        try:
+            item = clean_entry(section, raw)
+        except ValueError as e:
+            reject(n, str(e))
+            continue
+        key = _dedupe_key(section, item)
+        if key in seen[section]:
+            summary["duplicates"] += 1
+            continue
+        seen[section].add(key)
+        added[section].append(item)
+        summary["accepted"][section] += 1
+
+    ops = [("append", section, item) for section in SECTIONS for item in added[section]]
+    if not ops:
+        return ops, summary
+
+    activities = list(record.get("activities") or [])
+    new_activities = {act: None for entry in added["daily_logs"] for act in entry["log"] if act not in activities}
+    if new_activities:
+        ops.append(("set", "activities", activities + list(new_activities)))
+
+    merged = {**record, **{section: record.get(section, []) + added[section] for section in SECTIONS}}
+    if added["daily_logs"]:
+        ops.append(("set", "streak", build_streak(entry["date"] for entry in merged["daily_logs"])))
+    if "rollups" in record:
+        ops.append(("set", "rollups", build_rollups(merged)))
+    if "achievements" in record:
+        ops.append(("set", "achievements", build_achievements(merged)))
+    return ops, summary
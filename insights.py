@@ -0,0 +1,244 @@
+import hashlib
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# -----------------------------
+# AI INSIGHT CACHE
+# -----------------------------
+# Chat completions are cached under a hash of the exact request (model and
+# messages). The prompt is built from the user's recent tasks and streak,
+# so asking again before any of those change is answered from memory
+# instead of another API call. Entries expire after ``ttl`` seconds and the
+# least recently used are evicted beyond ``max_entries``.
+#
+# FakeOpenAI stands in for the OpenAI client (SMARTROUTINE_AI=fake) so the
+# whole flow runs offline; benchmarks/stub_openai_server.py serves the real
+# client over HTTP (OPENAI_BASE_URL) with configurable latency and errors.
+
+DEFAULT_MODEL = "gpt-4o-mini"
+
+
+def insight_key(model, messages):
+    """Content address of one chat completion request."""
+    payload = json.dumps({"model": model, "messages": messages}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class InsightCache:
+    """Thread-safe TTL + LRU map of request hash -> completion text."""
+
+    def __init__(self, max_entries=1024, ttl=3600, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()   # key -> (expires_at, text)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= self._clock():
+                del self._entries[key]
+                self.expired += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, text):
+        with self._lock:
+            self._entries[key] = (self._clock() + self.ttl, text)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+            }
+
+
+class InsightService:
+    """Chat completions through an InsightCache. The client is only built
+    (``client_factory()``) when the first request misses the cache."""
+
+    def __init__(self, client_factory, cache):
+        self._client_factory = client_factory
+        self._client = None
+        self._client_lock = threading.Lock()
+        self.cache = cache
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = self._client_factory()
+        return self._client
+
+    def peek(self, messages, model=DEFAULT_MODEL):
+        """Cached text for this request, or None (never calls the API)."""
+        return self.cache.get(insight_key(model, messages))
+
+    def complete(self, messages, model=DEFAULT_MODEL, timeout=None):
+        """Return (text, cached). API errors propagate and are not cached."""
+        key = insight_key(model, messages)
+        text = self.cache.get(key)
+        if text is not None:
+            return text, True
+        kwargs = {"timeout": timeout} if timeout is not None else {}
+        response = self.client.chat.completions.create(model=model, messages=messages, **kwargs)
+        text = response.choices[0].message.content
+        self.cache.put(key, text)
+        return text, False
+
+    def stats(self):
+        return self.cache.stats()
+
+
+# -----------------------------
+# BACKGROUND INSIGHT JOBS
+# -----------------------------
+# LLM round trips run on a small thread pool instead of in the request, so
+# slow completions can't tie up the web workers. Each user has at most one
+# job queued or running (asking again returns that job), the number of
+# unfinished jobs is capped, and every job gets a per-attempt timeout and a
+# few retries with exponential backoff. Finished jobs are kept for
+# ``keep`` seconds so clients can poll for the result.
+
+def _retryable(error):
+    """Timeouts, connection errors, 408/429 and 5xx are worth retrying;
+    other 4xx responses (bad key, bad request) are not."""
+    status = getattr(error, "status_code", None)
+    return status is None or status in (408, 429) or status >= 500
+
+def with_retries(work, timeout, retries=2, backoff=1.0, on_attempt=None):
+    """Call ``work(timeout)``, retrying retryable errors with exponential
+    backoff. Returns (result, error); error is the last exception or None."""
+    error = None
+    for attempt in range(retries + 1):
+        if on_attempt is not None:
+            on_attempt(attempt + 1)
+        try:
+            return work(timeout), None
+        except Exception as e:
+            error = e
+            if not _retryable(e) or attempt == retries:
+                break
+            time.sleep(backoff * 2 ** attempt)
+    return None, error
+
+
+class InsightJobs:
+    """Bounded, per-user deduplicated background runner for insight work."""
+
+    def __init__(self, max_workers=4, max_pending=64, timeout=30, retries=2, backoff=1.0, keep=600):
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.keep = keep
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="insight")
+        self._jobs = {}     # job id -> job
+        self._active = {}   # email -> id of its unfinished job
+        self._lock = threading.Lock()
+
+    def submit(self, email, work):
+        """Queue ``work(timeout)`` for ``email`` and return the job (a copy).
+        Returns the user's unfinished job instead if there is one, or None
+        when too many jobs are already waiting."""
+        with self._lock:
+            self._prune()
+            job_id = self._active.get(email)
+            if job_id is not None:
+                return dict(self._jobs[job_id])
+            if len(self._active) >= self.max_pending:
+                return None
+            job = {"id": uuid.uuid4().hex, "email": email, "status": "queued", "attempts": 0,
+                   "result": None, "error": None, "finished_at": None}
+            self._jobs[job["id"]] = job
+            self._active[email] = job["id"]
+        self._pool.submit(self._run, job, work)
+        return dict(job)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def _run(self, job, work):
+        with self._lock:
+            job["status"] = "running"
+
+        def on_attempt(n):
+            with self._lock:
+                job["attempts"] = n
+
+        result, error = with_retries(work, self.timeout, self.retries, self.backoff, on_attempt)
+        with self._lock:
+            job["status"] = "failed" if error is not None else "done"
+            job["result"] = result
+            job["error"] = repr(error) if error is not None else None
+            job["finished_at"] = time.monotonic()
+            self._active.pop(job["email"], None)
+        if error is not None:
+            print("Insight job failed for", job["email"], error)
+
+    def _prune(self):
+        # Callers hold self._lock
+        cutoff = time.monotonic() - self.keep
+        for job_id in [j["id"] for j in self._jobs.values() if j["finished_at"] is not None and j["finished_at"] < cutoff]:
+            del self._jobs[job_id]
+
+    def stats(self):
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+            return counts
+
+
+# -----------------------------
+# OFFLINE CLIENT
+# -----------------------------
+class _Namespace:
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+class FakeOpenAI:
+    """Minimal stand-in for openai.OpenAI: chat.completions.create() returns
+    a canned answer derived from the prompt, and counts its calls."""
+
+    def __init__(self, reply="Focus on your longest task first thing tomorrow.", delay=0):
+        self.reply = reply
+        self.delay = delay
+        self.calls = 0
+        self.chat = _Namespace(completions=_Namespace(create=self._create))
+
+    def _create(self, model, messages, timeout=None, **kwargs):
+        self.calls += 1
+        if self.delay:
+            if timeout is not None and self.delay > timeout:
+                time.sleep(timeout)
+                raise TimeoutError("fake completion timed out")
+            time.sleep(self.delay)
+        digest = insight_key(model, messages)[:8]
+        message = _Namespace(role="assistant", content=f"{self.reply} [{digest}]")
+        return _Namespace(choices=[_Namespace(index=0, message=message)], model=model)
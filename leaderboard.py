@@ -0,0 +1,91 @@
+import threading
+from bisect import bisect_left, insort
+from datetime import date
+
+# -----------------------------
+# LEADERBOARD INDEX
+# -----------------------------
+# Keeps one sorted list of (-score, email) per sort mode, so the top of the
+# board and any user's rank are binary searches instead of a full re-sort of
+# every user on every page view. Entries are replaced as users' data changes.
+#
+# Streaks (and anything derived from them) depend on today's date, so once
+# per day every entry is recomputed from the raw rows it was built from.
+
+SORTS = ("streak", "total_hours", "badges")
+
+
+class LeaderboardIndex:
+    """Incrementally maintained leaderboard for a single worker process."""
+
+    def __init__(self, load_rows, make_entry, sorts=SORTS):
+        """``load_rows()`` returns the stats rows of every user (each with an
+        "email" key); ``make_entry(row)`` turns one into a display entry
+        that has a numeric value for every sort mode."""
+        self._load_rows = load_rows
+        self._make_entry = make_entry
+        self.sorts = sorts
+        self._lock = threading.RLock()
+        self._rows = None
+        self._entries = {}
+        self._order = {sort: [] for sort in sorts}
+        self._day = None
+
+    def _ensure(self):
+        # Callers hold self._lock
+        if self._rows is None:
+            self._rows = {row["email"]: row for row in self._load_rows()}
+            self._rebuild()
+        elif self._day != date.today():
+            self._rebuild()
+
+    def _rebuild(self):
+        self._day = date.today()
+        self._entries = {email: self._make_entry(row) for email, row in self._rows.items()}
+        for sort in self.sorts:
+            self._order[sort] = sorted((-e[sort], email) for email, e in self._entries.items())
+
+    def update(self, row):
+        """Insert or replace one user's row."""
+        with self._lock:
+            if self._rows is None:
+                return   # not built yet; the first read loads everything fresh
+            self._ensure()
+            email = row["email"]
+            self._remove(email)
+            entry = self._make_entry(row)
+            self._rows[email] = row
+            self._entries[email] = entry
+            for sort in self.sorts:
+                insort(self._order[sort], (-entry[sort], email))
+
+    def _remove(self, email):
+        old = self._entries.pop(email, None)
+        if old is None:
+            return
+        for sort in self.sorts:
+            order = self._order[sort]
+            i = bisect_left(order, (-old[sort], email))
+            if i < len(order) and order[i][1] == email:
+                del order[i]
+
+    def __len__(self):
+        with self._lock:
+            self._ensure()
+            return len(self._entries)
+
+    def top(self, sort, offset=0, limit=50):
+        """Entries ranked offset+1 .. offset+limit, each with its "rank"."""
+        with self._lock:
+            self._ensure()
+            keys = self._order[sort][offset:offset + limit]
+            return [{**self._entries[email], "rank": offset + i + 1} for i, (_, email) in enumerate(keys)]
+
+    def rank(self, sort, email):
+        """1-based rank of ``email`` (ties broken by email), or None."""
+        with self._lock:
+            self._ensure()
+            entry = self._entries.get(email)
+            if entry is None:
+                return None
+            return bisect_left(self._order[sort], (-entry[sort], email)) + 1
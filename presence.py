@@ -0,0 +1,75 @@
+import atexit
+import threading
+from datetime import datetime, timedelta
+
+# -----------------------------
+# PRESENCE TRACKING
+# -----------------------------
+# Page views only touch an in-memory dict. Timestamps are written to
+# storage in one batch every ``interval`` seconds (and at shutdown), so
+# showing someone as online no longer costs a database write per request.
+
+ONLINE_WINDOW = timedelta(minutes=5)
+
+
+class PresenceTracker:
+    """Coalesces last-seen timestamps and flushes them in batches."""
+
+    def __init__(self, flush, interval=60):
+        """``flush`` is called with {email: last_seen datetime} for every
+        user seen since the previous flush."""
+        self._flush = flush
+        self.interval = interval
+        self._seen = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def touch(self, email, when=None):
+        """Record activity; True if this process hadn't seen ``email``
+        within the online window (they just came online)."""
+        when = when or datetime.now()
+        with self._lock:
+            previous = self._seen.get(email)
+            self._seen[email] = when
+            self._dirty.add(email)
+            if self._thread is None:
+                self._start()
+        return previous is None or when - previous >= ONLINE_WINDOW
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run, name="presence-flush", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        stop = threading.Event()
+        while not stop.wait(self.interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print("Presence flush failed:", e)
+
+    def flush(self):
+        with self._lock:
+            batch = {email: self._seen[email] for email in self._dirty}
+            self._dirty.clear()
+        if batch:
+            self._flush(batch)
+
+    def last_seen(self, email, stored=None):
+        """Latest of what this process saw and the stored ISO timestamp
+        (which may come from another worker)."""
+        seen = self._seen.get(email)
+        if stored:
+            try:
+                stored = datetime.fromisoformat(stored)
+            except ValueError:
+                stored = None
+            if stored and (seen is None or stored > seen):
+                seen = stored
+        return seen
+
+    def is_online(self, email, stored=None, window=ONLINE_WINDOW):
+        seen = self.last_seen(email, stored)
+        return seen is not None and datetime.now() - seen < window
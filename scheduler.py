@@ -0,0 +1,111 @@
+import heapq
+import itertools
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+# -----------------------------
+# EXPIRY SCHEDULER
+# -----------------------------
+# Housekeeping that has to happen at a given time (a daily challenge
+# running out, an H2H challenge reaching its end date) is scheduled here
+# instead of being checked on every page view. Deadlines sit in a min-heap
+# and one background thread sleeps until the earliest is due, so the cost
+# is O(log n) per scheduled item and nothing at all between deadlines.
+#
+# Each key has at most one pending deadline: scheduling it again replaces
+# the old one (the stale heap entry is skipped when it comes up). Actions
+# run on the scheduler thread, one at a time; they must be idempotent,
+# because every worker process runs its own scheduler.
+
+
+def day_end(day):
+    """Epoch seconds at the end of ``day`` (a date or "YYYY-MM-DD"):
+    midnight at the start of the next day, local time."""
+    if isinstance(day, str):
+        day = date.fromisoformat(day)
+    return datetime.combine(day + timedelta(days=1), datetime.min.time()).timestamp()
+
+
+class ExpiryScheduler:
+    """Runs ``action()`` for a key once its deadline (epoch seconds) passes."""
+
+    def __init__(self, on_start=None):
+        """``on_start`` runs first on the scheduler thread (e.g. to schedule
+        what already exists in storage)."""
+        self._on_start = on_start
+        self._heap = []      # (when, seq, key)
+        self._pending = {}   # key -> (when, seq, action)
+        self._seq = itertools.count()
+        self._wakeup = threading.Condition()
+        self._thread = None
+        self.runs = 0
+        self.failures = 0
+
+    def start(self):
+        """Start the thread (once; later calls are no-ops)."""
+        if self._thread is not None:
+            return
+        with self._wakeup:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="expiry-scheduler", daemon=True)
+                self._thread.start()
+
+    def schedule(self, key, when, action):
+        """Run ``action()`` at ``when``, replacing any pending deadline for ``key``."""
+        with self._wakeup:
+            seq = next(self._seq)
+            self._pending[key] = (when, seq, action)
+            heapq.heappush(self._heap, (when, seq, key))
+            if self._heap[0][1] == seq:
+                self._wakeup.notify()
+
+    def cancel(self, key):
+        with self._wakeup:
+            self._pending.pop(key, None)
+
+    def due(self, key):
+        """The pending deadline for ``key``, or None."""
+        entry = self._pending.get(key)
+        return entry[0] if entry else None
+
+    def _next(self):
+        """Block until a deadline is due; return its action."""
+        with self._wakeup:
+            while True:
+                if not self._heap:
+                    self._wakeup.wait()
+                    continue
+                when, seq, key = self._heap[0]
+                entry = self._pending.get(key)
+                if entry is None or entry[1] != seq:
+                    heapq.heappop(self._heap)   # replaced or cancelled
+                    continue
+                delay = when - time.time()
+                if delay > 0:
+                    self._wakeup.wait(delay)
+                    continue
+                heapq.heappop(self._heap)
+                del self._pending[key]
+                return key, entry[2]
+
+    def _run(self):
+        if self._on_start is not None:
+            try:
+                self._on_start()
+            except Exception as e:
+                self.failures += 1
+                print("Expiry scheduler start-up failed:", e)
+        while True:
+            key, action = self._next()
+            try:
+                action()
+                self.runs += 1
+            except Exception as e:
+                self.failures += 1
+                print("Scheduled action failed for", key, e)
+
+    def stats(self):
+        with self._wakeup:
+            return {"pending": len(self._pending), "heap": len(self._heap),
+                    "runs": self.runs, "failures": self.failures}
@@ -0,0 +1,151 @@
+from datetime import date, timedelta
+
+# -----------------------------
+# DERIVED PER-USER STATE
+# -----------------------------
+# State kept on the user record and updated as data is added, so pages read
+# a few numbers instead of rescanning the whole history. rebuild_derived()
+# recomputes everything from scratch (see the "rebuild-stats" CLI command).
+
+def parse_day(value):
+    """"YYYY-MM-DD" -> date, or None if malformed."""
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+# -----------------------------
+# STREAKS
+# -----------------------------
+# record["streak"] = {"current": 4, "last_date": "2026-01-04", "longest": 9}
+#
+# "current" is the run of consecutive logged days ending at last_date; it
+# only counts as a live streak while last_date is today or yesterday.
+
+def build_streak(dates):
+    """Streak state from an iterable of "YYYY-MM-DD" strings."""
+    days = sorted({d for d in map(parse_day, dates) if d is not None})
+    if not days:
+        return {"current": 0, "last_date": None, "longest": 0}
+    run = longest = 1
+    for prev, day in zip(days, days[1:]):
+        run = run + 1 if (day - prev).days == 1 else 1
+        longest = max(longest, run)
+    return {"current": run, "last_date": str(days[-1]), "longest": longest}
+
+def advance_streak(state, log_date):
+    """Return the state after logging ``log_date``, or None if it needs
+    build_streak instead: the record has no state yet (it may predate
+    stored streaks and still have logs), or the date is older than
+    last_date (a backfill)."""
+    if state is None:
+        return None
+    day = parse_day(log_date)
+    if day is None:
+        return state
+    last = parse_day(state.get("last_date"))
+    if last is None:
+        return {"current": 1, "last_date": str(day), "longest": max(1, state.get("longest", 0))}
+    if day == last:
+        return state
+    if day < last:
+        return None
+    current = state["current"] + 1 if (day - last).days == 1 else 1
+    return {"current": current, "last_date": str(day), "longest": max(state["longest"], current)}
+
+def current_streak(state, today=None):
+    """The live streak: 0 once a full day has passed without a log."""
+    last = parse_day(state.get("last_date")) if state else None
+    if last is None:
+        return 0
+    today = today or date.today()
+    if last < today - timedelta(days=1):
+        return 0
+    return state["current"]
+
+# -----------------------------
+# DASHBOARD ROLLUPS
+# -----------------------------
+# record["rollups"] = {
+#     "task_total": 42,                         sum of all task durations
+#     "task_week": {"2026-W1": 12, ...},        task hours per week
+#     "task_month": {"2026-01": 30, ...},       task hours per month
+#     "log_day": {"2026-01-04": {"Coding": 4}}, logged hours per day and activity
+#     "log_count": 12,                          number of daily logs
+#     "log_best": 9,                            most hours in one daily log
+# }
+#
+# Kept up to date with "incr" (and "max") ops when tasks are added or
+# deleted and when daily logs are added, so rendering the dashboard or
+# ranking the user never walks the history. Rollups built before log_count
+# and log_best existed are rebuilt on the next dashboard visit.
+
+def task_period_keys(task_date):
+    """(week key, month key) used by the dashboard charts for a task date."""
+    d = parse_day(task_date)
+    return f"{d.year}-W{d.isocalendar().week}", d.strftime("%Y-%m")
+
+def task_rollup_ops(task, sign=1):
+    """Ops that add (sign=1) or remove (sign=-1) a task from the rollups."""
+    hours = sign * int(task["duration"])
+    week_key, month_key = task_period_keys(task["date"])
+    return [
+        ("incr", "rollups.task_total", hours),
+        ("incr", ["rollups", "task_week", week_key], hours),
+        ("incr", ["rollups", "task_month", month_key], hours),
+    ]
+
+def log_rollup_ops(entry, rollups):
+    """Ops that add a daily log entry to the user's current ``rollups``."""
+    ops = [
+        ("incr", ["rollups", "log_day", entry["date"], act], hrs)
+        for act, hrs in entry.get("log", {}).items()
+    ]
+    if "log_best" in rollups:   # older rollups get these from a rebuild
+        ops += [("incr", "rollups.log_count", 1), ("max", "rollups.log_best", sum(entry.get("log", {}).values()))]
+    return ops
+
+def build_rollups(record):
+    rollups = {"task_total": 0, "task_week": {}, "task_month": {}, "log_day": {}, "log_count": 0, "log_best": 0}
+    for t in record.get("tasks", []):
+        hours = int(t["duration"])
+        week_key, month_key = task_period_keys(t["date"])
+        rollups["task_total"] += hours
+        rollups["task_week"][week_key] = rollups["task_week"].get(week_key, 0) + hours
+        rollups["task_month"][month_key] = rollups["task_month"].get(month_key, 0) + hours
+    for entry in record.get("daily_logs", []):
+        day = rollups["log_day"].setdefault(entry["date"], {})
+        for act, hrs in entry.get("log", {}).items():
+            day[act] = day.get(act, 0) + hrs
+        rollups["log_count"] += 1
+        rollups["log_best"] = max(rollups["log_best"], sum(entry.get("log", {}).values()))
+    return rollups
+
+def activity_totals_between(rollups, start, end):
+    """{activity: hours} logged from ``start`` to ``end`` inclusive (one lookup per day)."""
+    totals = {}
+    for i in range((end - start).days + 1):
+        for act, hrs in rollups["log_day"].get(str(start + timedelta(days=i)), {}).items():
+            totals[act] = totals.get(act, 0) + hrs
+    return totals
+
+def recent_daily_totals(rollups, today, days):
+    """{date: hours} for the last ``days`` days with more than zero hours."""
+    totals = {}
+    for i in range(days):
+        day = str(today - timedelta(days=i))
+        hours = sum(rollups["log_day"].get(day, {}).values())
+        if hours > 0:
+            totals[day] = hours
+    return totals
+
+# -----------------------------
+# REBUILD
+# -----------------------------
+def rebuild_derived(record):
+    """Recompute every derived key for ``record``; returns {key: value}."""
+    logs = record.get("daily_logs", [])
+    return {
+        "streak": build_streak(entry["date"] for entry in logs),
+        "rollups": build_rollups(record),
+    }
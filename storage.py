@@ -0,0 +1,686 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from urllib.parse import quote, unquote
+
+from blocking import call_blocking
+from columnar import LogColumns
+from dateindex import DateIndex
+
+try:
+    import fcntl
+except ImportError:   # Windows: fall back to in-process locking only
+    fcntl = None
+
+# -----------------------------
+# RECORD OPS
+# -----------------------------
+# Small, replayable changes to a user record. ``path`` is a dotted key path,
+# or a list of keys when a key may itself contain dots:
+#
+#   ["append", "tasks", {...}]            record["tasks"].append(value)
+#   ["set", "data.latest_insight", "..."] record["data"]["latest_insight"] = value
+#   ["remove", "tasks", 3]                record["tasks"].pop(3)
+#   ["incr", ["rollups", "x.y"], 2]       record["rollups"]["x.y"] += 2 (from 0)
+#   ["max", "rollups.log_best", 9]        record["rollups"]["log_best"] = max(it, 9)
+
+def path_parts(path):
+    return path.split(".") if isinstance(path, str) else list(path)
+
+def apply_ops(record, ops):
+    for op, path, value in ops:
+        *parents, key = path_parts(path)
+        target = record
+        for part in parents:
+            target = target.setdefault(part, {})
+        if op == "append":
+            target.setdefault(key, []).append(value)
+        elif op == "set":
+            target[key] = value
+        elif op == "incr":
+            target[key] = target.get(key, 0) + value
+        elif op == "max":
+            target[key] = max(target.get(key, value), value)
+        elif op == "remove":
+            items = target.get(key, [])
+            if 0 <= value < len(items):
+                items.pop(value)
+        else:
+            raise ValueError(f"Unknown record op: {op}")
+    return record
+
+def apply_ops_copy(record, ops):
+    """apply_ops() on a copy of ``record``. Only the dicts and lists on the
+    ops' paths are copied; ``record`` itself is left unchanged."""
+    record = dict(record)
+    fresh = {id(record)}
+    for op, path, value in ops:
+        target = record
+        for part in path_parts(path):
+            child = target.get(part) if isinstance(target, dict) else None
+            if not isinstance(child, (dict, list)):
+                break
+            if id(child) not in fresh:
+                child = child.copy()
+                fresh.add(id(child))
+                target[part] = child
+            target = child
+    return apply_ops(record, ops)
+
+def copy_record(value):
+    """Deep copy of a JSON-style record (dicts, lists and scalars)."""
+    if isinstance(value, dict):
+        return {key: copy_record(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [copy_record(item) for item in value]
+    return value
+
+# -----------------------------
+# LEADERBOARD INPUTS
+# -----------------------------
+def leaderboard_row(email, record):
+    """Per-user leaderboard inputs: profile, task hours, log stats and the
+    streak state (or, if it was never built, the log dates) and the number
+    of unlocked badges (None if the record predates stored achievements).
+    Read from the maintained rollups and streak; only older records need
+    their history scanned."""
+    logs = record.get("daily_logs", [])
+    state = record.get("streak")
+    rollups = record.get("rollups") or {}
+    if "log_best" in rollups:
+        log_count, best_day = rollups["log_count"], rollups["log_best"]
+    else:
+        log_count, best_day = len(logs), max((sum(l.get("log", {}).values()) for l in logs), default=0)
+    return {
+        "email": email,
+        "data": record.get("data", {}),
+        "task_hours": rollups["task_total"] if rollups else sum(t.get("duration", 0) for t in record.get("tasks", [])),
+        "logs": log_count,
+        "best_day": best_day,
+        "streak_state": state,
+        "dates": [] if state is not None else sorted({l["date"] for l in logs}, reverse=True),
+        "badges": len(record["achievements"]) if "achievements" in record else None,
+    }
+
+# -----------------------------
+# STORAGE BACKEND INTERFACE
+# -----------------------------
+
+class Store:
+    """Base class for user storage backends.
+
+    Backends implement exists/load/save/emails/stamp. The aggregate queries
+    below work on any backend by loading the record; backends that can answer
+    them more cheaply (see database.SQLiteStore) override them.
+    """
+
+    # True if load(sections=...) can return a record without some sections
+    partial_loads = False
+
+    def exists(self, email):
+        raise NotImplementedError
+
+    def stamp(self, email):
+        """Cheap token that changes whenever the stored record changes."""
+        raise NotImplementedError
+
+    def load(self, email, sections=None):
+        raise NotImplementedError
+
+    def save(self, email, record):
+        raise NotImplementedError
+
+    def emails(self):
+        raise NotImplementedError
+
+    def view(self, email, sections=None):
+        """Like load(), for callers that only read the record (CachedStore
+        can then hand out its cached copy instead of a fresh one)."""
+        return self.load(email, sections=sections)
+
+    def apply(self, email, ops):
+        """Apply record ops (see apply_ops). Backends override this to write
+        only the change instead of the whole record.
+
+        Backends that can, return the (before, after) stamps of the write,
+        both read under their write lock; None means unknown."""
+        record = self.load(email)
+        self.save(email, apply_ops(record if record is not None else {}, ops))
+
+    def apply_many(self, changes):
+        """Apply {email: ops} for several users in one batch. Returns
+        {email: (before, after)} stamps, as apply() does, or None."""
+        stamps = {}
+        for email, ops in changes.items():
+            stamps[email] = self.apply(email, ops)
+        return stamps if None not in stamps.values() else None
+
+    def load_many(self, emails):
+        """Return {email: record} for the given emails that exist."""
+        users = {}
+        for email in emails:
+            if email in users:
+                continue
+            record = self.load(email)
+            if record is not None:
+                users[email] = record
+        return users
+
+    def save_many(self, users):
+        """Write back every record in ``users`` (and only those)."""
+        for email, record in users.items():
+            self.save(email, record)
+
+    def load_all(self):
+        return self.load_many(self.emails())
+
+    def derived(self, email, section, build):
+        """``build(entries)`` over one list section of the record, or None if
+        the user doesn't exist. CachedStore keeps these between requests."""
+        record = self.view(email, sections=(section,))
+        return build(record.get(section, [])) if record is not None else None
+
+    def date_index(self, email, section):
+        """DateIndex over a dated section ("daily_logs" / "tasks")."""
+        return self.derived(email, section, DateIndex)
+
+    def log_columns(self, email):
+        """LogColumns over the user's daily logs."""
+        return self.derived(email, "daily_logs", LogColumns)
+
+    # -----------------------------
+    # AGGREGATE QUERIES
+    # -----------------------------
+    # Dates are "YYYY-MM-DD" strings, so range checks are plain string
+    # comparisons. ``start`` / ``end`` are inclusive and optional.
+
+    def _logs(self, email, start=None, end=None):
+        record = self.view(email, sections=("daily_logs",)) or {}
+        for entry in record.get("daily_logs", []):
+            if (start is None or entry["date"] >= start) and (end is None or entry["date"] <= end):
+                yield entry
+
+    def iter_entries(self, email, section, start=None, end=None):
+        """Yield the entries of one list section (tasks, daily_logs, notes,
+        expenses) dated ``start`` .. ``end``, in stored order."""
+        record = self.view(email, sections=(section,)) or {}
+        for item in record.get(section, []):
+            day = item.get("date")
+            if start is None and end is None or day and (start is None or day >= start) and (end is None or day <= end):
+                yield item
+
+    def daily_totals(self, email, start=None, end=None):
+        """Return {date: total hours} for dates with more than zero hours."""
+        columns = self.log_columns(email)
+        return columns.daily_totals(start, end) if columns is not None else {}
+
+    def activity_totals(self, email, start=None, end=None):
+        """Return {activity: total hours}."""
+        columns = self.log_columns(email)
+        return columns.activity_totals(start, end) if columns is not None else {}
+
+    def log_dates(self, email):
+        """Return the distinct logged dates, newest first."""
+        return sorted({entry["date"] for entry in self._logs(email)}, reverse=True)
+
+    def log_stats(self, email):
+        """Return {"logs", "best_day", "hours", "moods"} over all daily logs."""
+        columns = self.log_columns(email)
+        return columns.stats() if columns is not None else {"logs": 0, "best_day": 0, "hours": 0, "moods": {}}
+
+    def task_hours_by_date(self, email):
+        """Return {date: total task duration}."""
+        record = self.view(email, sections=("tasks",)) or {}
+        totals = {}
+        for t in record.get("tasks", []):
+            totals[t["date"]] = totals.get(t["date"], 0) + int(t["duration"])
+        return totals
+
+    def leaderboard_stats(self, emails=None):
+        """Return leaderboard_row() for every user, or for those of ``emails`` that exist."""
+        rows = []
+        for email in dict.fromkeys(self.emails() if emails is None else emails):
+            record = self.view(email)
+            if record is not None:
+                rows.append(leaderboard_row(email, record))
+        return rows
+
+
+# -----------------------------
+# SHARDED USER STORAGE
+# -----------------------------
+# Every user record lives in its own JSON file so a request only reads and
+# writes the records it actually touches. Files are spread over 256 bucket
+# directories (first two hex chars of the email hash):
+#
+#   users/3f/someone@example.com.json      snapshot
+#   users/3f/someone@example.com.journal   appended ops (see apply)
+#
+# Small changes are appended to the journal as one JSON line each and
+# replayed on load. Each snapshot carries a random "generation" and journal
+# lines are tagged with the generation they apply to, so a crash between
+# writing a new snapshot and truncating the journal can never replay old
+# lines twice. Once a journal passes JOURNAL_COMPACT_BYTES a background
+# thread folds it into a fresh snapshot (written to a temp file and
+# atomically renamed into place).
+
+JOURNAL_COMPACT_BYTES = 64 * 1024
+GENERATION_KEY = "_generation"
+
+class ShardedStore(Store):
+    """Per-user JSON shards with the same load/save surface as users.json."""
+
+    def __init__(self, root, legacy_file=None, compact_bytes=JOURNAL_COMPACT_BYTES, fsync=True):
+        self.root = root
+        self.compact_bytes = compact_bytes
+        self.fsync = fsync
+        self._locks = [threading.Lock() for _ in range(64)]
+        self._generations = {}   # email -> (snapshot stat, generation)
+        self._compact_queue = set()
+        self._compact_wakeup = threading.Condition()
+        self._compactor = None
+        if not os.path.isdir(root):
+            self._create(legacy_file)
+
+    def _create(self, legacy_file):
+        """Create the shard directory, splitting the old monolithic file if any."""
+        if not legacy_file or not os.path.exists(legacy_file):
+            os.makedirs(self.root, exist_ok=True)
+            return
+
+        # Build the shards next to the final location and swap them in at
+        # the end, so a crash mid-migration never leaves a half-filled root.
+        staging = self.root + ".migrating"
+        shutil.rmtree(staging, ignore_errors=True)
+        with open(legacy_file, "r") as f:
+            users = json.load(f)
+        for email, record in users.items():
+            self._write_snapshot(self._path(email, staging), record)
+        os.replace(staging, self.root)
+
+    def _path(self, email, root=None):
+        bucket = hashlib.md5(email.encode("utf-8")).hexdigest()[:2]
+        name = quote(email, safe="@.+-_") + ".json"
+        return os.path.join(root or self.root, bucket, name)
+
+    def _journal_path(self, email):
+        return self._path(email)[:-len(".json")] + ".journal"
+
+    @contextmanager
+    def _locked(self, email):
+        """Serialize writers of one shard across threads and processes."""
+        path = self._journal_path(email)
+        lock = self._locks[hash(email) % len(self._locks)]
+        with lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "ab") as journal:
+                if fcntl is not None:
+                    call_blocking(fcntl.flock, journal, fcntl.LOCK_EX)
+                try:
+                    yield journal
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(journal, fcntl.LOCK_UN)
+
+    def _write_snapshot(self, path, record):
+        """Atomically replace ``path``; returns the new generation."""
+        generation = os.urandom(8).hex()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({**record, GENERATION_KEY: generation}, f)
+            if self.fsync:
+                f.flush()
+                call_blocking(os.fsync, f.fileno())
+        os.replace(tmp, path)
+        return generation
+
+    def _read(self, email):
+        """Return (record, generation) with the journal replayed, or (None, None)."""
+        path = self._path(email)
+        while True:
+            try:
+                with open(path, "r") as f:
+                    before = os.fstat(f.fileno())
+                    record = json.load(f)
+            except FileNotFoundError:
+                return None, None
+            generation = record.pop(GENERATION_KEY, None)
+            self._generations[email] = ((before.st_mtime_ns, before.st_size), generation)
+
+            try:
+                with open(self._journal_path(email), "r") as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                        except ValueError:
+                            continue   # torn line from a crash mid-append
+                        if entry.get("g") == generation:
+                            apply_ops(record, entry["ops"])
+            except FileNotFoundError:
+                pass
+            # Readers don't take the shard lock. A compaction that replaced the
+            # snapshot while we read the journal may have truncated lines we
+            # had not reached yet, so read the new snapshot instead.
+            try:
+                after = os.stat(path)
+            except FileNotFoundError:
+                return None, None
+            if (after.st_ino, after.st_mtime_ns, after.st_size) == (before.st_ino, before.st_mtime_ns, before.st_size):
+                return record, generation
+
+    def _generation(self, email):
+        path = self._path(email)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None, False
+        cached = self._generations.get(email)
+        if cached is not None and cached[0] == (st.st_mtime_ns, st.st_size):
+            return cached[1], True
+        # Snapshot changed under us (or never read here): look it up
+        with open(path, "r") as f:
+            generation = json.load(f).get(GENERATION_KEY)
+        self._generations[email] = ((st.st_mtime_ns, st.st_size), generation)
+        return generation, True
+
+    # -----------------------------
+    # SINGLE RECORD ACCESS
+    # -----------------------------
+    def exists(self, email):
+        return os.path.exists(self._path(email))
+
+    def stamp(self, email):
+        try:
+            st = os.stat(self._path(email))
+        except FileNotFoundError:
+            return None
+        try:
+            jt = os.stat(self._journal_path(email))
+            journal = (jt.st_mtime_ns, jt.st_size)
+        except FileNotFoundError:
+            journal = None
+        return (st.st_mtime_ns, st.st_size, journal)
+
+    def load(self, email, sections=None):
+        """Return the user's record, or None if the user does not exist.
+
+        A shard is always read whole, so ``sections`` is only a hint.
+        """
+        return self._read(email)[0]
+
+    def save(self, email, record):
+        """Write a full snapshot and start an empty journal."""
+        with self._locked(email) as journal:
+            self._snapshot(email, record, journal)
+
+    def _snapshot(self, email, record, journal):
+        path = self._path(email)
+        generation = self._write_snapshot(path, record)
+        st = os.stat(path)
+        self._generations[email] = ((st.st_mtime_ns, st.st_size), generation)
+        journal.truncate(0)
+
+    def apply(self, email, ops):
+        """Append ``ops`` to the user's journal: O(size of the change)."""
+        with self._locked(email) as journal:
+            before = self.stamp(email)
+            generation, found = self._generation(email)
+            if not found:
+                self._snapshot(email, apply_ops({}, ops), journal)
+                return before, self.stamp(email)
+            line = json.dumps({"g": generation, "ops": ops}) + "\n"
+            if journal.tell() > 0:
+                with open(journal.name, "rb") as f:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        line = "\n" + line   # seal a torn line left by a crash
+            journal.write(line.encode("utf-8"))
+            journal.flush()
+            if self.fsync:
+                call_blocking(os.fsync, journal.fileno())
+            size = journal.tell()
+            after = self.stamp(email)
+        if size > self.compact_bytes:
+            self._schedule_compaction(email)
+        return before, after
+
+    # -----------------------------
+    # BACKGROUND COMPACTION
+    # -----------------------------
+    def _schedule_compaction(self, email):
+        with self._compact_wakeup:
+            self._compact_queue.add(email)
+            if self._compactor is None:
+                self._compactor = threading.Thread(target=self._compact_loop, name="journal-compactor", daemon=True)
+                self._compactor.start()
+            self._compact_wakeup.notify()
+
+    def _compact_loop(self):
+        while True:
+            with self._compact_wakeup:
+                while not self._compact_queue:
+                    self._compact_wakeup.wait()
+                email = self._compact_queue.pop()
+            try:
+                self.compact(email)
+            except Exception as e:
+                print("Journal compaction failed for", email, e)
+
+    def compact(self, email):
+        """Fold the user's journal into a new snapshot."""
+        with self._locked(email) as journal:
+            record, _ = self._read(email)
+            if record is not None:
+                self._snapshot(email, record, journal)
+
+    def emails(self):
+        if not os.path.isdir(self.root):
+            return []
+        found = []
+        for bucket in os.scandir(self.root):
+            if not bucket.is_dir():
+                continue
+            for entry in os.scandir(bucket.path):
+                if entry.name.endswith(".json"):
+                    found.append(unquote(entry.name[:-len(".json")]))
+        return found
+
+
+# -----------------------------
+# WRITE-THROUGH RECORD CACHE
+# -----------------------------
+# Keeps parsed records in memory. Every load re-checks the backend's stamp
+# (an os.stat for shards) so edits made by another worker process are still
+# picked up, but a warm read never opens or parses the file.
+#
+# load() hands out a copy, so callers may change it freely; nothing reaches
+# the cache until it is saved. Cached records are never changed in place
+# (apply() builds the new version with apply_ops_copy), which lets view()
+# share them with read-only callers such as the aggregates below.
+#
+# Derived per-record structures (date indexes, log columns) live next to the
+# record and are kept current by apply(): like the record, they are never
+# changed in place. Appends are add()ed to a copy that replaces them, any
+# other change to their section drops them to be rebuilt on next use.
+
+def _aggregate(name):
+    def method(self, *args, **kwargs):
+        impl = getattr(type(self.backend), name)
+        if impl is getattr(Store, name):
+            # Generic version, run against the cached records
+            return getattr(Store, name)(self, *args, **kwargs)
+        return impl(self.backend, *args, **kwargs)
+    method.__name__ = name
+    return method
+
+
+class CachedStore(Store):
+    """Wraps a backend with a process-level LRU cache of parsed records."""
+
+    def __init__(self, backend, max_entries=10000):
+        self.backend = backend
+        self.max_entries = max_entries
+        self._entries = OrderedDict()   # email -> (stamp, record, {(build, section): derived})
+        self._lock = threading.Lock()
+        self._listeners = []
+        self.hits = 0
+        self.misses = 0
+
+    def __getattr__(self, name):
+        # Anything backend-specific (e.g. SQLiteStore.db) passes straight through
+        return getattr(self.backend, name)
+
+    def _put(self, email, stamp, record, derived=None):
+        with self._lock:
+            self._entries[email] = (stamp, record, {} if derived is None else derived)
+            self._entries.move_to_end(email)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def subscribe(self, listener):
+        """Call ``listener(email, ops)`` after every write to a user; ``ops``
+        is the list of record ops, or None when the whole record was saved."""
+        self._listeners.append(listener)
+
+    def _notify(self, email, ops):
+        for listener in self._listeners:
+            try:
+                listener(email, ops)
+            except Exception as e:
+                print("Storage listener failed for", email, e)
+
+    def _forget(self, email):
+        with self._lock:
+            self._entries.pop(email, None)
+
+    def exists(self, email):
+        return self.backend.exists(email)
+
+    def stamp(self, email):
+        return self.backend.stamp(email)
+
+    def emails(self):
+        return self.backend.emails()
+
+    def load(self, email, sections=None):
+        record = self.view(email, sections=sections)
+        return copy_record(record) if record is not None else None
+
+    def view(self, email, sections=None):
+        """The cached record itself: callers must not change it."""
+        stamp = self.backend.stamp(email)
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is not None and stamp is not None and entry[0] == stamp:
+                self.hits += 1
+                self._entries.move_to_end(email)
+                return entry[1]
+            self.misses += 1
+
+        if sections is not None and self.backend.partial_loads:
+            # Partial records are cheap to read and must not be cached as whole ones
+            return self.backend.load(email, sections=sections)
+        record = self.backend.load(email)
+        if record is None:
+            self._forget(email)
+        else:
+            self._put(email, stamp, record)
+        return record
+
+    def save(self, email, record):
+        self.save_many({email: record})
+
+    def save_many(self, users):
+        self.backend.save_many(users)
+        for email, record in users.items():
+            if self.backend.partial_loads:
+                with self._lock:
+                    entry = self._entries.get(email)
+                if entry is None:
+                    continue
+                # The backend kept any sections the record was loaded without
+                record = {**entry[1], **record}
+            self._put(email, self.backend.stamp(email), copy_record(record))
+        for email in users:
+            self._notify(email, None)
+
+    def apply(self, email, ops):
+        self.apply_many({email: ops})
+
+    def apply_many(self, changes):
+        # An entry only gets the ops applied in memory if it is exactly the
+        # version they were written on top of: it was cached before the write
+        # (one reloaded while the write was in flight may already contain
+        # them) and its stamp is the one the backend saw under its write lock
+        # (otherwise another process wrote in between). Anything else is
+        # dropped and reloaded on next use.
+        with self._lock:
+            cached = {email: self._entries.get(email) for email in changes}
+        stamps = self.backend.apply_many(changes) or {}
+        for email, ops in changes.items():
+            before, stamp = stamps.get(email) or (None, None)
+            with self._lock:
+                entry = cached[email]
+                if entry is None or before is None or entry[0] != before or self._entries.get(email) is not entry:
+                    self._entries.pop(email, None)
+                    continue
+                record = apply_ops_copy(entry[1], ops)
+                derived = dict(entry[2])
+                fresh = set()   # keys whose object is already our own copy
+                for op, path, value in ops:
+                    parts = path_parts(path)
+                    for key in [key for key in derived if key[1] == parts[0]]:
+                        if op == "append" and len(parts) == 1:
+                            if key not in fresh:
+                                derived[key] = derived[key].copy()
+                                fresh.add(key)
+                            derived[key].add(value)
+                        else:
+                            del derived[key]
+                self._entries[email] = (stamp, record, derived)
+        for email, ops in changes.items():
+            self._notify(email, ops)
+
+    def derived(self, email, section, build):
+        record = self.view(email)
+        if record is None:
+            return None
+        key = (build, section)
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is not None and entry[1] is record and key in entry[2]:
+                return entry[2][key]
+        value = build(record.get(section, []))
+        with self._lock:
+            current = self._entries.get(email)
+            # Only keep it if no write landed while it was being built
+            if entry is not None and current is not None and current[0] == entry[0] and current[1] is record:
+                value = current[2].setdefault(key, value)
+        return value
+
+    def _logs(self, email, start=None, end=None):
+        index = self.date_index(email, "daily_logs")
+        return index.between(start, end) if index is not None else []
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+            }
+
+    iter_entries = _aggregate("iter_entries")
+    daily_totals = _aggregate("daily_totals")
+    activity_totals = _aggregate("activity_totals")
+    log_dates = _aggregate("log_dates")
+    log_stats = _aggregate("log_stats")
+    task_hours_by_date = _aggregate("task_hours_by_date")
+    leaderboard_stats = _aggregate("leaderboard_stats")
@@ -0,0 +1,15 @@
+from achievements import BADGES, badges_from_stats, build_achievements
+
+
+def test_stats_fallback_matches_a_full_replay():
+    days = ["2024-01-01", "2024-01-02", "2024-01-03", "2024-01-05"]
+    record = {"daily_logs": [{"date": d, "log": {"Coding": 4}} for d in days]}
+    record["daily_logs"].append({"date": "2024-01-06", "log": {"Coding": 6, "Gym": 5}})
+    # The current streak (2) is below "On Fire"; the longest (3) is not
+    assert sorted(badges_from_stats(5, 3, 11)) == sorted(build_achievements(record))
+
+
+def test_stats_fallback_uses_the_registered_rules():
+    assert badges_from_stats(0, 10, 20) == []
+    assert badges_from_stats(1, 1, 1) == ["rookie"]
+    assert badges_from_stats(9, 7, 10) == [b for b in BADGES if BADGES[b]["on"] == "log"]
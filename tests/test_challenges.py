@@ -0,0 +1,45 @@
+from challenges import h2h_progress
+
+CHALLENGE = {"start_date": "2024-01-10", "end_date": "2024-01-17", "challenger_progress": 0}
+
+
+def progress(metric, tasks=(), logs=(), streak=None, today="2024-01-12", **fields):
+    challenge = {**CHALLENGE, "metric": metric, **fields}
+    return h2h_progress(challenge, "challenger", list(tasks), list(logs), streak, today)
+
+
+def log(day, **hours):
+    return {"date": day, "mood": "Good", "log": hours}
+
+
+def test_only_entries_inside_the_window_count():
+    logs = [log("2024-01-09", Coding=5), log("2024-01-10", Coding=2), log("2024-01-18", Coding=7)]
+    assert progress("hours", logs=logs) == {"challenger_progress": 2}
+    tasks = [{"date": "2024-01-09"}, {"date": "2024-01-17"}, {"date": "2024-01-11"}]
+    assert progress("tasks", tasks=tasks) == {"challenger_progress": 2}
+    assert progress("hours", logs=[log("2024-01-09", Coding=5)]) is None
+
+
+def test_activities_are_counted_once():
+    first = progress("activities", logs=[log("2024-01-10", Coding=1, Gym=0)])
+    assert first == {"challenger_progress": 1, "challenger_activities": ["Coding"]}
+    assert progress("activities", logs=[log("2024-01-11", Coding=2)], **first) is None
+
+
+def test_streak_counts_only_days_since_the_start():
+    # A 30 day run that reaches into the challenge counts from its first day
+    state = {"current": 30, "last_date": "2024-01-12", "longest": 30}
+    assert progress("streak", streak=state) == {"challenger_progress": 3}
+    # Yesterday's run is still live, and capped at the days elapsed
+    state = {"current": 30, "last_date": "2024-01-11", "longest": 30}
+    assert progress("streak", streak=state) == {"challenger_progress": 2}
+    # A run that started after the challenge counts whole
+    state = {"current": 1, "last_date": "2024-01-12", "longest": 9}
+    assert progress("streak", streak=state) == {"challenger_progress": 1}
+
+
+def test_streak_outside_the_window_or_broken():
+    state = {"current": 5, "last_date": "2024-01-09", "longest": 5}
+    assert progress("streak", streak=state, today="2024-01-09") is None   # not started yet
+    assert progress("streak", streak=state, challenger_progress=2) == {"challenger_progress": 0}
+    assert progress("streak", streak=None) is None
@@ -0,0 +1,53 @@
+"""Perft: leaf counts of the legal move tree from well-known positions,
+compared with the published numbers. Catches castling, en passant,
+promotion and pin bugs in the move generator. Depths are kept small
+enough for the test run; benchmarks/perft.py goes deeper and times it."""
+import pytest
+
+from chessboard import START_FEN, Position, outcome
+
+POSITIONS = {
+    "start": (START_FEN, [20, 400, 8902]),
+    "kiwipete": ("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", [48, 2039]),
+    "endgame": ("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", [14, 191, 2812, 43238]),
+    "promotions": ("r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", [6, 264, 9467]),
+    "tricky": ("rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", [44, 1486]),
+    "middlegame": ("r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10", [46, 2079]),
+}
+
+
+def perft(position, depth):
+    moves = position.legal_moves()
+    if depth == 1:
+        return len(moves)
+    return sum(perft(position.make(move), depth - 1) for move in moves)
+
+
+@pytest.mark.parametrize("name, depth, expected", [
+    (name, depth, count)
+    for name, (_, counts) in POSITIONS.items()
+    for depth, count in enumerate(counts, start=1)
+])
+def test_perft(name, depth, expected):
+    assert perft(Position(POSITIONS[name][0]), depth) == expected
+
+
+def walk(position, depth):
+    yield position
+    if depth:
+        for move in position.legal_moves():
+            yield from walk(position.make(move), depth - 1)
+
+
+@pytest.mark.parametrize("name", POSITIONS)
+def test_incremental_key_and_fen_round_trip(name):
+    for position in walk(Position(POSITIONS[name][0]), 2):
+        assert position.key == position._full_key()
+        assert Position(position.fen()).key == position.key
+
+
+def test_outcomes():
+    assert outcome(Position("7k/6Q1/6K1/8/8/8/8/8 b - - 0 1")) == ("1-0", "checkmate")
+    assert outcome(Position("7k/8/6QK/8/8/8/8/8 b - - 0 1")) == ("1/2-1/2", "stalemate")
+    assert outcome(Position("8/8/4k3/8/8/3NK3/8/8 w - - 0 1")) == ("1/2-1/2", "insufficient material")
+    assert outcome(Position()) is None
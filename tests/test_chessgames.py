@@ -0,0 +1,40 @@
+import pytest
+
+from chessgames import ChessError, ChessGames
+
+
+@pytest.fixture
+def games(tmp_path):
+    games = ChessGames(str(tmp_path), fsync=False)
+    games.create("g1", white="a@x.com", black="b@x.com")
+    return games
+
+
+def test_color_of(games):
+    assert games.color_of("g1", "a@x.com") == "w"
+    assert games.color_of("g1", "b@x.com") == "b"
+    assert games.color_of("g1", "c@x.com") is None
+    assert games.color_of("missing", "a@x.com") is None
+
+
+def test_color_of_reads_only_the_header(games):
+    games.play("g1", "a@x.com", "e2e4")
+    cold = ChessGames(games.root)
+    assert cold.color_of("g1", "b@x.com") == "b"
+    assert cold._games == {}   # nothing was replayed or cached
+
+
+def test_adjudicate_ends_a_game_in_progress(games):
+    games.play("g1", "a@x.com", "e2e4")
+    state = games.adjudicate("g1", "1/2-1/2", "challenge ended")
+    assert (state["result"], state["reason"], state["ply"]) == ("1/2-1/2", "challenge ended", 1)
+    with pytest.raises(ChessError):
+        games.play("g1", "b@x.com", "e7e5")
+    # Another process replaying the log sees the same result
+    assert ChessGames(games.root).state("g1")["result"] == "1/2-1/2"
+
+
+def test_adjudicate_keeps_a_real_result(games):
+    games.resign("g1", "b@x.com")
+    assert games.adjudicate("g1", "1/2-1/2", "challenge ended")["result"] == "1-0"
+    assert games.adjudicate("missing", "1/2-1/2", "challenge ended") is None
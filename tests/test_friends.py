@@ -0,0 +1,43 @@
+import threading
+
+from friends import FriendSummaries
+
+
+def rows_for(emails):
+    return [{"email": email, "streak": 1} for email in emails]
+
+
+def test_cards_are_cached_until_invalidated():
+    loads = []
+    summaries = FriendSummaries(lambda emails: loads.append(list(emails)) or rows_for(emails), dict)
+
+    summaries.get_many(["a", "b"])
+    summaries.get_many(["a", "b"])
+    summaries.invalidate("a")
+    summaries.get_many(["a", "b"])
+
+    assert loads == [["a", "b"], ["a"]]
+
+
+def test_write_during_a_build_only_drops_that_users_card():
+    building, release = threading.Event(), threading.Event()
+
+    def load_rows(emails):
+        building.set()
+        release.wait(5)
+        return rows_for(emails)
+
+    summaries = FriendSummaries(load_rows, dict)
+    worker = threading.Thread(target=summaries.get_many, args=(["a", "b", "c"],))
+    worker.start()
+    building.wait(5)
+    summaries.invalidate("b")
+    summaries.invalidate("z")   # someone not in the batch
+    release.set()
+    worker.join(5)
+
+    summaries._load_rows = rows_for
+    summaries.get_many(["a", "b", "c"])
+    stats = summaries.stats()
+    assert (stats["hits"], stats["entries"]) == (2, 3)   # a and c were kept, b rebuilt
+    assert summaries._invalidated == {}
@@ -0,0 +1,48 @@
+import io
+
+import pytest
+
+from export import SECTIONS, stream_csv, stream_ndjson
+from importer import import_ops, read_csv, read_ndjson
+from storage import apply_ops
+
+RECORD = {
+    "activities": ["Coding"],
+    "tasks": [{"task": "Write report", "duration": 2, "date": "2024-01-01"}],
+    "daily_logs": [{"date": "2024-01-01", "mood": "Good", "log": {"Coding": 3, "Gym": 1.5}}],
+    "notes": [{"title": "Idea", "content": "Try, \"quoted\"\nlines", "date": "2024-01-02"}],
+    "expenses": [{"amount": 9.5, "description": "Lunch", "category": "Food", "date": "2024-01-02"}],
+}
+
+
+def test_ndjson_export_imports_back_unchanged():
+    body = "".join(stream_ndjson((name, RECORD[name]) for name in SECTIONS))
+
+    ops, summary = import_ops({}, read_ndjson(io.StringIO(body)))
+    assert (summary["rejected"], summary["errors"]) == (0, [])
+    record = apply_ops({}, ops)
+    assert {name: record[name] for name in SECTIONS} == {name: RECORD[name] for name in SECTIONS}
+
+    # Importing the same export again only finds duplicates
+    ops, summary = import_ops(record, read_ndjson(io.StringIO(body)))
+    assert ops == []
+    assert (summary["duplicates"], summary["rejected"]) == (4, 0)
+
+
+@pytest.mark.parametrize("section", SECTIONS)
+def test_csv_export_imports_back_unchanged(section):
+    body = "".join(stream_csv(section, RECORD[section]))
+    ops, summary = import_ops({}, read_csv(io.StringIO(body, newline=""), section))
+    assert summary["errors"] == []
+    assert apply_ops({}, ops)[section] == RECORD[section]
+
+
+def test_duplicates_within_the_file_and_bad_rows():
+    body = ('{"section": "tasks", "task": "A", "duration": 1, "date": "2024-01-01"}\n'
+            '{"section": "tasks", "task": "A", "duration": 1, "date": "2024-01-01"}\n'
+            '{"section": "notes", "date": "2024-01-01"}\n'
+            'not json\n')
+    ops, summary = import_ops({}, read_ndjson(io.StringIO(body)))
+    assert summary["accepted"]["tasks"] == 1
+    assert summary["duplicates"] == 1
+    assert [e["line"] for e in summary["errors"]] == [3, 4]
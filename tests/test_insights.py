@@ -0,0 +1,75 @@
+import time
+
+from insights import FakeOpenAI, InsightCache, InsightJobs, InsightService
+
+MESSAGES = [
+    {"role": "system", "content": "You are a productivity coach."},
+    {"role": "user", "content": "Tasks: Coding 3h, Reading 1h. Streak: 4 days."},
+]
+
+
+def wait(jobs, job_id, seconds=5):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        job = jobs.get(job_id)
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"insight job {job_id} did not finish")
+
+
+def test_insight_job_is_answered_from_cache_the_second_time():
+    client = FakeOpenAI()
+    service = InsightService(lambda: client, InsightCache())
+    jobs = InsightJobs(max_workers=1, timeout=1, retries=0)
+    results = []
+
+    def work(timeout):
+        text, cached = service.complete(MESSAGES, timeout=timeout)
+        results.append(cached)
+        return text
+
+    first = wait(jobs, jobs.submit("a@x.com", work)["id"])
+    second = wait(jobs, jobs.submit("a@x.com", work)["id"])
+
+    assert first["status"] == second["status"] == "done"
+    assert first["result"] == second["result"]
+    assert results == [False, True]
+    assert client.calls == 1
+    assert service.peek(MESSAGES) == first["result"]
+    assert service.stats()["hits"] == 2   # the second complete() and peek()
+
+
+def test_client_is_only_built_on_a_cache_miss():
+    built = []
+    service = InsightService(lambda: built.append(1) or FakeOpenAI(), InsightCache())
+
+    assert service.peek(MESSAGES) is None
+    assert built == []
+    service.complete(MESSAGES)
+    service.complete(MESSAGES)
+    assert built == [1]
+
+
+def test_expired_insight_calls_the_client_again():
+    now = [0.0]
+    client = FakeOpenAI()
+    service = InsightService(lambda: client, InsightCache(ttl=60, clock=lambda: now[0]))
+
+    service.complete(MESSAGES)
+    now[0] = 61
+    _, cached = service.complete(MESSAGES)
+
+    assert not cached
+    assert client.calls == 2
+
+
+def test_timed_out_job_fails_without_caching():
+    client = FakeOpenAI(delay=0.2)
+    service = InsightService(lambda: client, InsightCache())
+    jobs = InsightJobs(max_workers=1, timeout=0.05, retries=0)
+
+    job = wait(jobs, jobs.submit("a@x.com", lambda timeout: service.complete(MESSAGES, timeout=timeout)[0])["id"])
+
+    assert job["status"] == "failed"
+    assert service.peek(MESSAGES) is None
@@ -0,0 +1,50 @@
+"""Worker boot: `import app` in a fresh interpreter must stay fast and must
+not pull in the heavy clients (see make_ai_client / http_session).
+
+The time budget is for what app.py adds on top of importing Flask itself,
+so it doesn't depend on how fast the machine is at loading Flask. Override
+it with SMARTROUTINE_STARTUP_BUDGET_MS. benchmarks/bench_startup.py gives
+the full numbers.
+"""
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ("openai", "requests", "numpy")
+BUDGET_MS = float(os.getenv("SMARTROUTINE_STARTUP_BUDGET_MS", "250"))
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(json.dumps({{"ms": elapsed * 1000, "modules": sorted(sys.modules)}}))
+"""
+
+
+def probe(module, cwd):
+    env = {k: v for k, v in os.environ.items() if k != "OPENAI_API_KEY"}
+    env["PYTHONPATH"] = ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    out = subprocess.run([sys.executable, "-c", PROBE.format(module=module)], cwd=cwd, env=env,
+                         capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def best_of(module, cwd, runs=3):
+    results = [probe(module, cwd) for _ in range(runs)]
+    return min(r["ms"] for r in results), results[-1]["modules"]
+
+
+def test_import_app_loads_no_heavy_modules(tmp_path):
+    _, modules = best_of("app", tmp_path, runs=1)
+    assert [m for m in HEAVY_MODULES if m in modules] == []
+
+
+def test_import_app_time_over_flask_is_within_budget(tmp_path):
+    probe("app", tmp_path)   # write .pyc files and warm the OS cache first
+    flask_ms, _ = best_of("flask", tmp_path)
+    app_ms, _ = best_of("app", tmp_path)
+    assert app_ms - flask_ms < BUDGET_MS, (
+        f"import app took {app_ms:.0f} ms, {app_ms - flask_ms:.0f} ms over Flask (budget {BUDGET_MS:.0f} ms)")
@@ -0,0 +1,259 @@
+import json
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from database import BUSY_TIMEOUT, SQLiteStore, close_db
+from storage import CachedStore, ShardedStore
+
+
+@pytest.fixture(params=["shards", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "shards":
+        yield ShardedStore(str(tmp_path / "users"), fsync=False)
+    else:
+        path = str(tmp_path / "users.db")
+        yield SQLiteStore(path)
+        close_db(path)
+
+
+def run_threads(count, target):
+    errors = []
+
+    def worker(n):
+        try:
+            target(n)
+        except Exception as e:   # surfaced below; a thread's exception is otherwise lost
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(count)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(60)
+    assert not errors
+
+
+RECORD = {
+    "password": "p",
+    "data": {"first_name": "Ada"},
+    "activities": ["Coding", "Gym"],
+    "tasks": [{"task": "Write", "duration": 2, "date": "2024-01-01"}],
+    "daily_logs": [{"date": "2024-01-01", "mood": "Good", "log": {"Coding": 1.5, "Gym": 0}},
+                   {"date": "2024-01-02", "mood": None, "log": {}}],
+    "notes": [{"title": "Idea", "content": "", "date": "2024-01-02"}],
+    "expenses": [{"amount": 3.5, "description": "Tea", "category": "Food", "date": "2024-01-02"}],
+    "streak": {"current": 2, "last_date": "2024-01-02", "longest": 2},
+}
+
+
+def test_round_trip(store):
+    store.save("a@x.com", RECORD)
+    assert store.exists("a@x.com") and not store.exists("b@x.com")
+    assert store.load("a@x.com") == RECORD
+    assert store.load("b@x.com") is None
+    assert list(store.emails()) == ["a@x.com"]
+    partial = store.load("a@x.com", sections=("tasks",))
+    assert partial["tasks"] == RECORD["tasks"] and partial["data"] == RECORD["data"]
+    assert list(store.iter_entries("a@x.com", "daily_logs", start="2024-01-02")) == RECORD["daily_logs"][1:]
+
+
+def test_ops_round_trip(store):
+    store.save("a@x.com", RECORD)
+    task = {"task": "Read", "duration": 1, "date": "2024-01-03"}
+    store.apply("a@x.com", [("append", "tasks", task), ("set", "data.first_name", "Ada L."),
+                            ("remove", "notes", 0), ("incr", "data.visits", 2)])
+    record = store.load("a@x.com")
+    assert record["tasks"] == RECORD["tasks"] + [task]
+    assert record["data"] == {"first_name": "Ada L.", "visits": 2}
+    assert record["notes"] == []
+    # The stamp moves with every write
+    stamp = store.stamp("a@x.com")
+    store.apply("a@x.com", [("incr", "data.visits", 1)])
+    assert store.stamp("a@x.com") != stamp
+
+
+def test_concurrent_incr_is_not_lost(store):
+    store.save("a@x.com", {"password": "p", "data": {}, "rollups": {"task_total": 0}})
+
+    def bump(n):
+        for _ in range(300):
+            store.apply("a@x.com", [("incr", "rollups.task_total", 1), ("set", "data.last", n)])
+        if isinstance(store, SQLiteStore):
+            close_db(store.path)
+
+    run_threads(4, bump)
+    assert store.load("a@x.com")["rollups"]["task_total"] == 1200
+
+
+
+def test_loads_during_compaction_see_every_op(tmp_path):
+    store = ShardedStore(str(tmp_path / "users"), compact_bytes=1, fsync=False)
+    store.save("a@x.com", {"rollups": {"task_total": 0}})
+    done = threading.Event()
+    seen = []
+
+    def write():
+        for n in range(400):
+            store.apply("a@x.com", [("incr", "rollups.task_total", 1)])
+            if n % 3 == 0:
+                store.compact("a@x.com")
+        done.set()
+
+    def read():
+        while not done.is_set():
+            seen.append(store.load("a@x.com")["rollups"]["task_total"])
+
+    run_threads(2, lambda n: (write if n == 0 else read)())
+    assert seen == sorted(seen)   # a load missing ops would go backwards
+    assert store.load("a@x.com")["rollups"]["task_total"] == 400
+
+
+def journal_lines(store, email):
+    with open(store._journal_path(email), "rb") as f:
+        return f.read().splitlines()
+
+
+def test_journal_ignores_a_torn_last_line(tmp_path):
+    root = str(tmp_path / "users")
+    store = ShardedStore(root, fsync=False)
+    store.save("a@x.com", {"data": {"n": 0}})
+    store.apply("a@x.com", [("incr", "data.n", 1)])
+    # A crash mid-append leaves half a line behind
+    with open(store._journal_path("a@x.com"), "ab") as f:
+        f.write(b'{"g": "x", "ops": [["incr", "da')
+    store = ShardedStore(root, fsync=False)
+    assert store.load("a@x.com") == {"data": {"n": 1}}
+    # The next append starts a line of its own
+    store.apply("a@x.com", [("incr", "data.n", 1)])
+    assert ShardedStore(root, fsync=False).load("a@x.com") == {"data": {"n": 2}}
+    assert len(journal_lines(store, "a@x.com")) == 3
+
+
+def test_journal_lines_of_an_older_snapshot_are_ignored(tmp_path):
+    root = str(tmp_path / "users")
+    store = ShardedStore(root, fsync=False)
+    store.save("a@x.com", {"data": {"n": 0}})
+    store.apply("a@x.com", [("incr", "data.n", 1)])
+    stale = journal_lines(store, "a@x.com")
+    # A crash between writing the compacted snapshot and truncating the
+    # journal leaves the folded-in lines behind; they must not apply twice
+    store.compact("a@x.com")
+    assert journal_lines(store, "a@x.com") == []
+    with open(store._journal_path("a@x.com"), "ab") as f:
+        f.write(b"\n".join(stale) + b"\n")
+    assert ShardedStore(root, fsync=False).load("a@x.com") == {"data": {"n": 1}}
+    store.apply("a@x.com", [("incr", "data.n", 1)])
+    assert ShardedStore(root, fsync=False).load("a@x.com") == {"data": {"n": 2}}
+
+
+def test_cache_drops_a_record_another_process_wrote_under_it(store):
+    other = type(store)(store.root if isinstance(store, ShardedStore) else store.path)
+    cached = CachedStore(store)
+    cached.save("a@x.com", {"data": {}, "rollups": {"task_total": 0}})
+    cached.view("a@x.com")
+    write = store.apply_many
+
+    def interleaved(changes):
+        # Another worker's write lands after the cache looked, before ours
+        other.apply("a@x.com", [("incr", "rollups.task_total", 10)])
+        return write(changes)
+
+    store.apply_many = interleaved
+    cached.apply("a@x.com", [("incr", "rollups.task_total", 1)])
+    assert cached.view("a@x.com")["rollups"]["task_total"] == 11
+
+
+def test_concurrent_incr_through_the_cache(store):
+    cached = CachedStore(store)
+    cached.save("a@x.com", {"data": {}, "rollups": {"task_total": 0}})
+
+    def bump(n):
+        for _ in range(200):
+            cached.apply("a@x.com", [("incr", "rollups.task_total", 1)])
+            cached.view("a@x.com")
+        if isinstance(store, SQLiteStore):
+            close_db(store.path)
+
+    run_threads(4, bump)
+    assert cached.view("a@x.com")["rollups"]["task_total"] == 800
+
+
+def test_appends_leave_handed_out_derived_objects_alone(store):
+    cached = CachedStore(store)
+    cached.save("a@x.com", {"data": {}, "daily_logs": [{"date": "2024-01-01", "mood": "ok", "log": {"Coding": 2}}]})
+    index, columns = cached.date_index("a@x.com", "daily_logs"), cached.log_columns("a@x.com")
+
+    cached.apply("a@x.com", [("append", "daily_logs", {"date": "2024-01-02", "mood": "ok", "log": {"Gym": 1}})])
+
+    assert (len(index), len(columns), columns.activities) == (1, 1, ["Coding"])
+    assert index.on("2024-01-02") == []
+    assert cached.log_columns("a@x.com").daily_totals() == {"2024-01-01": 2, "2024-01-02": 1}
+    assert len(cached.date_index("a@x.com", "daily_logs").on("2024-01-02")) == 1
+
+
+ROLLUP_OPS = [
+    ("set", "rollups", {"task_total": 0, "task_week": {}, "log_day": {}, "log_best": 0}),
+    ("incr", "rollups.task_total", 2),
+    ("incr", ["rollups", "task_week", "2024-W01"], 2),
+    ("incr", ["rollups", "log_day", "2024-01-01", "Reading.Books"], 1.5),
+    ("incr", ["rollups", "log_day", "2024-01-01", "Reading.Books"], 1),
+    ("max", "rollups.log_best", 3),
+    ("max", "rollups.log_best", 1),
+    ("set", ["rollups", "log_day", "2024-01-02"], {"Gym": 1}),
+    ("set", "rollups.extra", {}),
+]
+ROLLUPS_AFTER = {"task_total": 2, "task_week": {"2024-W01": 2}, "log_best": 3, "extra": {},
+                 "log_day": {"2024-01-01": {"Reading.Books": 2.5}, "2024-01-02": {"Gym": 1}}}
+
+
+def test_rollup_ops(store):
+    store.save("a@x.com", {"password": "p", "data": {}})
+    for op in ROLLUP_OPS:
+        store.apply("a@x.com", [op])
+    assert store.load("a@x.com")["rollups"] == ROLLUPS_AFTER
+    assert store.load("a@x.com", sections=("tasks",))["rollups"] == ROLLUPS_AFTER
+
+
+def test_sqlite_moves_rollups_out_of_the_users_row(tmp_path):
+    path = str(tmp_path / "users.db")
+    store = SQLiteStore(path)
+    store.save("a@x.com", {"password": "p", "data": {}, "rollups": ROLLUPS_AFTER, "streak": None})
+    # Turn it back into a version 2 database, which kept the rollups in users.extra
+    db = store.db
+    with db:
+        db.execute("UPDATE users SET extra = ?", (json.dumps({"rollups": ROLLUPS_AFTER, "streak": None}),))
+        db.execute("DROP TABLE rollups")
+        db.execute("PRAGMA user_version = 2")
+
+    store = SQLiteStore(path)
+    assert store.load("a@x.com") == {"password": "p", "data": {}, "rollups": ROLLUPS_AFTER, "streak": None}
+    assert json.loads(db.execute("SELECT extra FROM users").fetchone()[0]) == {"streak": None}
+    close_db(path)
+
+
+def test_sqlite_writer_waits_out_a_longer_lock(tmp_path):
+    path = str(tmp_path / "users.db")
+    store = SQLiteStore(path)
+    store.save("a@x.com", {"password": "p", "data": {"n": 0}})
+    other = sqlite3.connect(path, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    done = threading.Event()
+
+    def write():
+        store.apply("a@x.com", [("incr", ["data", "n"], 1)])
+        close_db(path)
+        done.set()
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    time.sleep(BUSY_TIMEOUT * 3)
+    assert not done.is_set()
+    other.execute("COMMIT")
+    writer.join(5)
+    assert done.is_set()
+    assert store.load("a@x.com")["data"] == {"n": 1}
+    other.close()
+    close_db(path)